@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Admin command handlers for Daal Store Telegram Bot
+
+main.py registers these with a filter on ADMIN_IDS, so other users never
+reach them.
+"""
+
+import asyncio
+import datetime
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from broadcast import format_broadcast, format_duration
+from catalog import format_price
+from order_ledger import Order
+from sales_stats import sales_stats
+from tracing import traced
+from utils import broadcaster, order_ledger, user_registry
+
+logger = logging.getLogger(__name__)
+
+# Orders listed by /orders
+ORDERS_LIST_LIMIT = 10
+
+STATS_WINDOW_TITLES = {"1h": "۱ ساعت اخیر", "24h": "۲۴ ساعت اخیر", "30d": "۳۰ روز اخیر"}
+STATS_BREAKDOWN_TITLES = (
+    ("plans", "📦 پلن‌ها"),
+    ("tiers", "🔒 وایرگارد"),
+    ("countries", "🌍 کشورها"),
+    ("services", "🍎 اپل آیدی"),
+)
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def format_order(order: Order) -> str:
+    """Full order, as shown by /order"""
+    return (
+        f"🧾 سفارش #{order.order_id}\n"
+        f"⏰ {_format_time(order.created_at)}\n"
+        f"🆔 شناسه کاربر: {order.user_id} (@{order.username})\n\n"
+        f"{order.details}"
+    )
+
+
+def format_order_line(order: Order) -> str:
+    """One-line order summary, as listed by /orders"""
+    country = f" | {order.country}" if order.country else ""
+    return (
+        f"#{order.order_id} | {_format_time(order.created_at)} | {order.user_id} | "
+        f"{order.plan_id}{country} | {format_price(order.price)}"
+    )
+
+
+@traced("order")
+async def order_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/order <order id>: show one order"""
+    if len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
+        await update.message.reply_text("استفاده: /order <شماره سفارش>")
+        return
+    order_id = int(context.args[0].lstrip("#"))
+    order = await asyncio.to_thread(order_ledger.get, order_id)
+    if order is None:
+        await update.message.reply_text(f"سفارش #{order_id} پیدا نشد")
+        return
+    await update.message.reply_text(format_order(order))
+
+
+@traced("orders")
+async def orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/orders [user id]: list a user's latest orders, or the latest orders of all users"""
+    if len(context.args) > 1 or (context.args and not context.args[0].isdigit()):
+        await update.message.reply_text("استفاده: /orders [شناسه کاربر]")
+        return
+    if context.args:
+        orders = await asyncio.to_thread(order_ledger.by_user, int(context.args[0]), ORDERS_LIST_LIMIT)
+    else:
+        orders = await asyncio.to_thread(order_ledger.recent, ORDERS_LIST_LIMIT)
+    if not orders:
+        await update.message.reply_text("سفارشی پیدا نشد")
+        return
+    await update.message.reply_text("\n".join(format_order_line(order) for order in orders))
+
+
+def format_stats(snapshot: dict) -> str:
+    """Sales stats of every window, as shown by /stats"""
+    sections = ["📊 آمار فروش"]
+    for window, stats in snapshot.items():
+        lines = [f"⏱ {STATS_WINDOW_TITLES.get(window, window)}: "
+                 f"{stats['orders']} سفارش | {format_price(stats['revenue'])}"]
+        for breakdown, title in STATS_BREAKDOWN_TITLES:
+            if stats[breakdown]:
+                lines.append(title)
+                lines.extend(
+                    f"  {name}: {entry['orders']} | {format_price(entry['revenue'])}"
+                    for name, entry in stats[breakdown].items()
+                )
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+@traced("stats")
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats: orders and revenue over the last hour, day and 30 days"""
+    snapshot = await asyncio.to_thread(sales_stats.snapshot)
+    await update.message.reply_text(format_stats(snapshot))
+
+
+@traced("broadcast")
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <text>: send text to every active user"""
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await update.message.reply_text("استفاده: /broadcast <متن پیام>")
+        return
+    broadcast = broadcaster.submit(update.effective_user.id, parts[1])
+    if broadcast is None:
+        await update.message.reply_text("یک پیام همگانی در حال ارسال است\nوضعیت: /broadcast_status")
+        return
+    users = await asyncio.to_thread(user_registry.count_active)
+    await update.message.reply_text(
+        f"📣 پیام همگانی #{broadcast.broadcast_id} برای {users} کاربر در صف ارسال قرار گرفت\n"
+        f"⏳ زمان تقریبی: {format_duration(users / broadcaster.rate)}\n"
+        f"وضعیت: /broadcast_status | لغو: /broadcast_cancel"
+    )
+
+
+@traced("broadcast_status")
+async def broadcast_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_status: progress, throughput and ETA of the latest broadcast"""
+    broadcast = broadcaster.latest()
+    if broadcast is None:
+        await update.message.reply_text("پیام همگانی‌ای ارسال نشده است")
+        return
+    await update.message.reply_text(format_broadcast(broadcast))
+
+
+@traced("broadcast_cancel")
+async def broadcast_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_cancel: stop the pending or running broadcast"""
+    broadcast = broadcaster.cancel()
+    if broadcast is None:
+        await update.message.reply_text("پیام همگانی در حال ارسالی وجود ندارد")
+        return
+    await update.message.reply_text(format_broadcast(broadcast))
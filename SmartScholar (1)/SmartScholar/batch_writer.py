@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background batch writer for Daal Store Telegram Bot
+"""
+
+import atexit
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    Items written in batches by a background thread
+
+    put() only queues the item, so handlers on the event loop never wait
+    for the database. The writer thread, started on the first put, hands
+    everything queued so far (up to batch_size items) to write_batch in one
+    call, so a burst of writes costs one transaction.
+
+    Args:
+        write_batch: Writes a list of items, in the order they were put
+        name: Name of the writer thread
+        batch_size: Most items per write_batch call
+    """
+
+    def __init__(self, write_batch: Callable[[List], None], name: str, batch_size: int = 500):
+        self.write_batch = write_batch
+        self.name = name
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+    def put(self, item):
+        """Queue an item for writing"""
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_queued, name=self.name, daemon=True)
+                    self._writer.start()
+                    atexit.register(self.close)
+        self._queue.put(item)
+
+    def flush(self):
+        """Wait until the items queued so far are written"""
+        if self._writer is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Write the items still queued and stop the writer thread"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def _write_queued(self):
+        while True:
+            item = self._queue.get()
+            items = []
+            # Markers: None stops the thread, an Event is set once everything before it is written
+            while item is not None and not isinstance(item, threading.Event):
+                items.append(item)
+                if len(items) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if items:
+                try:
+                    self.write_batch(items)
+                except Exception as e:
+                    logger.error("Error in %s: %s", self.name, e)
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
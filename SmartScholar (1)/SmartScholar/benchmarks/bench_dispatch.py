@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark: callback dispatch table vs the former if/elif chain
+
+Usage: python benchmarks/bench_dispatch.py [--skus 9,100,500]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="daal-bench-"))
+
+import bot_handlers  # noqa: E402
+from catalog import PLANS  # noqa: E402
+
+# Callback data in the order the old button_handler compared them
+MENU_DATA = [
+    "vpn", "apple_id", "openvpn", "wireguard", "wireguard_economy", "wireguard_premium",
+]
+TAIL_DATA = ["back_to_main", "back_to_vpn", "back_to_wireguard"]
+
+
+def make_chain(plan_ids):
+    """Build a function equivalent to the old if/elif chain over plan_ids"""
+    lines = ["def chain(data):"]
+    keyword = "if"
+    for index, data in enumerate(MENU_DATA):
+        lines.append(f"    {keyword} data == {data!r}:\n        return {index}")
+        keyword = "elif"
+    lines.append("    elif data.startswith('country_'):\n        return -1")
+    for index, data in enumerate(plan_ids + TAIL_DATA, start=len(MENU_DATA)):
+        lines.append(f"    elif data == {data!r}:\n        return {index}")
+    lines.append("    return None")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["chain"]
+
+
+def make_table(plan_ids):
+    """Build exact and prefix tables shaped like bot_handlers' registry"""
+    table = dict(bot_handlers.CALLBACK_HANDLERS)
+    for plan_id in plan_ids:
+        table[plan_id] = bot_handlers.purchase_vpn_plan
+    prefixes = dict(bot_handlers.CALLBACK_PREFIX_HANDLERS)
+
+    def dispatch(data):
+        handler = table.get(data)
+        if handler is None:
+            handler = prefixes.get(data.partition("_")[0])
+        return handler
+
+    return dispatch
+
+
+def bench(func, keys, number):
+    def run():
+        for key in keys:
+            func(key)
+    return min(timeit.repeat(run, number=number, repeat=5)) / (number * len(keys)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--skus", default="9,100,500", help="Comma-separated catalog sizes")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    real_ids = [plan.plan_id for plan in PLANS]
+    print(f"{'skus':>6} {'chain ns/op':>12} {'table ns/op':>12} {'speedup':>8}")
+    for size in (int(value) for value in args.skus.split(",")):
+        plan_ids = (real_ids + [f"sku_{i}" for i in range(size)])[:max(size, len(real_ids))]
+        keys = MENU_DATA + ["country_3"] + plan_ids + TAIL_DATA
+        chain_ns = bench(make_chain(plan_ids), keys, args.number)
+        table_ns = bench(make_table(plan_ids), keys, args.number)
+        print(f"{size:>6} {chain_ns:>12.1f} {table_ns:>12.1f} {chain_ns / table_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event loop benchmark: the default asyncio loop against uvloop
+
+Runs the same three workloads on each loop implementation:
+    tasks   creating and awaiting many short tasks, as concurrent updates do
+    http    keep-alive requests to the health server's /healthz
+    lag     scheduling delay seen by a lag probe while tasks keep the loop busy
+
+Usage:
+    python benchmarks/bench_event_loop.py [--loops asyncio,uvloop] [--tasks 50000]
+        [--requests 20000] [--clients 50]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_loop  # noqa: E402
+from event_loop import LoopLagMonitor  # noqa: E402
+from health import HealthServer  # noqa: E402
+
+REQUEST = b"GET /healthz HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def percentile(samples, share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+async def bench_tasks(count: int) -> str:
+    async def step(value):
+        await asyncio.sleep(0)
+        return value
+
+    started = time.perf_counter()
+    await asyncio.gather(*(step(index) for index in range(count)))
+    elapsed = time.perf_counter() - started
+    return f"{elapsed / count * 1e6:.2f} us/task"
+
+
+async def bench_http(requests: int, clients: int) -> str:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = HealthServer("127.0.0.1", port, LoopLagMonitor())
+    await server.start()
+    latencies = []
+
+    async def client(count: int):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(count):
+            started = time.perf_counter()
+            writer.write(REQUEST)
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(requests // clients) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    await server.stop()
+    return (
+        f"{len(latencies) / elapsed:,.0f} req/s, p50 {percentile(latencies, 0.5) * 1e3:.2f} ms, "
+        f"p99 {percentile(latencies, 0.99) * 1e3:.2f} ms"
+    )
+
+
+async def bench_lag(busy_tasks: int = 200, duration: float = 2.0, interval: float = 0.005) -> str:
+    """Probe as LoopLagMonitor does while busy_tasks each run ~20 us of work between yields"""
+    stop = time.perf_counter() + duration
+
+    async def busy():
+        while time.perf_counter() < stop:
+            sum(range(200))
+            await asyncio.sleep(0)
+
+    lags = []
+
+    async def probe():
+        loop = asyncio.get_running_loop()
+        while time.perf_counter() < stop:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - expected))
+
+    await asyncio.gather(probe(), *(busy() for _ in range(busy_tasks)))
+    return (
+        f"p50 {statistics.median(lags) * 1e3:.2f} ms, p99 {percentile(lags, 0.99) * 1e3:.2f} ms "
+        f"({len(lags)} probes, {busy_tasks} busy tasks)"
+    )
+
+
+async def run_all(args) -> list:
+    return [
+        ("tasks", await bench_tasks(args.tasks)),
+        ("http", await bench_http(args.requests, args.clients)),
+        ("lag", await bench_lag()),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop benchmark")
+    parser.add_argument("--loops", default="asyncio,uvloop")
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=50)
+    args = parser.parse_args()
+
+    for name in args.loops.split(","):
+        if name == "uvloop" and importlib.util.find_spec("uvloop") is None:
+            print(f"{name}: not installed (pip install uvloop)\n")
+            continue
+        print(name)
+        for workload, result in event_loop.run(run_all(args), name):
+            print(f"  {workload:<6} {result}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
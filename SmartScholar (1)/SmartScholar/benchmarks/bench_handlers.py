@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Handler benchmark suite: latency percentiles and allocations per update
+
+Drives start_handler, button_handler and message_handler with synthetic
+updates against FakeBot, covering every plan, every country and both Apple
+ID forms, plus the validators, format_user_info and keyboard builders.
+
+Usage:
+    python benchmarks/bench_handlers.py [--rounds 200] [--latency 0.0]
+        [--save baseline.json] [--compare baseline.json --tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="daal-bench-"))
+
+import keyboards  # noqa: E402
+import utils  # noqa: E402
+from bot_handlers import start_handler, button_handler, message_handler  # noqa: E402
+from catalog import PLANS  # noqa: E402
+from config import COUNTRIES  # noqa: E402
+from fake_bot import FakeBot, FakeContext, make_callback_update, make_message_update  # noqa: E402
+
+HANDLERS = {"start": start_handler, "button": button_handler, "message": message_handler}
+
+
+def build_paths():
+    """
+    Every user journey as a list of (handler, payload) steps
+
+    Returns:
+        dict: Path name -> steps
+    """
+    paths = {"start": [("start", "/start")]}
+    for plan in PLANS:
+        if plan.family == "openvpn":
+            paths[plan.plan_id] = [("button", "vpn"), ("button", "openvpn"), ("button", plan.plan_id)]
+        elif plan.family == "wireguard":
+            paths[plan.plan_id] = [
+                ("button", "vpn"), ("button", "wireguard"), ("button", "country_0"),
+                ("button", f"wireguard_{plan.tier}"), ("button", plan.plan_id),
+            ]
+        else:
+            steps = [
+                ("button", "apple_id"), ("button", plan.plan_id),
+                ("message", "Ali"), ("message", "Rezaei"), ("message", "1990/01/15"),
+            ]
+            if plan.needs_email:
+                steps.append(("message", "example@gmail.com"))
+            paths[plan.plan_id] = steps
+    for index in range(len(COUNTRIES)):
+        paths[f"country_{index}"] = [("button", "wireguard"), ("button", f"country_{index}")]
+    paths["back_to_main"] = [("button", "back_to_main")]
+    return paths
+
+
+def percentiles(samples):
+    """p50/p95/p99 in microseconds"""
+    if len(samples) < 2:
+        value = samples[0] * 1e6 if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49] * 1e6, "p95": cuts[94] * 1e6, "p99": cuts[98] * 1e6}
+
+
+async def run_paths(bot, paths, rounds, trace_allocations):
+    """
+    Run every path rounds times with a fresh user each time
+
+    Returns:
+        tuple: (latencies by handler, latencies by step, allocations by step)
+    """
+    context = FakeContext(bot)
+    by_handler = defaultdict(list)
+    by_step = defaultdict(list)
+    allocations = defaultdict(list)
+    user_id = 10_000
+
+    for _ in range(rounds):
+        for name, steps in paths.items():
+            user_id += 1
+            for handler_name, payload in steps:
+                if handler_name == "button":
+                    update = make_callback_update(bot, user_id, payload)
+                else:
+                    update = make_message_update(bot, user_id, payload)
+                step = f"{name}:{handler_name}:{payload}"
+
+                if trace_allocations:
+                    tracemalloc.reset_peak()
+                    before, _ = tracemalloc.get_traced_memory()
+                started = time.perf_counter()
+                await HANDLERS[handler_name](update, context)
+                elapsed = time.perf_counter() - started
+                if trace_allocations:
+                    _, peak = tracemalloc.get_traced_memory()
+                    allocations[step].append(peak - before)
+                else:
+                    by_handler[handler_name].append(elapsed)
+                    by_step[step].append(elapsed)
+    return by_handler, by_step, allocations
+
+
+def bench_helpers(number):
+    """ns/op for validators, format_user_info and keyboard getters"""
+    form = {"name": "Ali", "surname": "Rezaei", "birthdate": "1990/01/15",
+            "service_type": PLANS[-1].service_type, "email": "example@gmail.com"}
+    cases = {
+        "validate_name": lambda: utils.validate_name("Ali Reza"),
+        "validate_birthdate": lambda: utils.validate_birthdate("1990/01/15"),
+        "validate_email": lambda: utils.validate_email("example@gmail.com"),
+        "format_user_info": lambda: utils.format_user_info(form),
+    }
+    for getter in keyboards._keyboard_getters:
+        cases[getter.__name__] = getter
+    return {
+        name: min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+        for name, func in cases.items()
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return regressions where p95 grew by more than tolerance"""
+    regressions = []
+    for section in ("handlers", "steps"):
+        for name, current in results[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if previous and current["p95"] > previous["p95"] * (1 + tolerance):
+                regressions.append(f"{section}/{name}: p95 {previous['p95']:.1f}us -> {current['p95']:.1f}us")
+    for name, current in results["helpers_ns"].items():
+        previous = baseline.get("helpers_ns", {}).get(name)
+        if previous and current > previous * (1 + tolerance):
+            regressions.append(f"helpers/{name}: {previous:.0f}ns -> {current:.0f}ns")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Handler benchmark suite")
+    parser.add_argument("--rounds", type=int, default=200, help="Runs of every path")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake Telegram latency per call (s)")
+    parser.add_argument("--helper-number", type=int, default=20000)
+    parser.add_argument("--save", help="Write results as a JSON baseline")
+    parser.add_argument("--compare", help="Compare against a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 growth vs baseline")
+    args = parser.parse_args()
+
+    bot = FakeBot(latency=args.latency)
+    await bot.initialize()
+    paths = build_paths()
+
+    # Warm caches (membership, keyboards) before measuring
+    await run_paths(bot, paths, 1, trace_allocations=False)
+    calls_before = len(bot.calls)
+    by_handler, by_step, _ = await run_paths(bot, paths, args.rounds, trace_allocations=False)
+    calls_per_round = (len(bot.calls) - calls_before) / args.rounds
+    tracemalloc.start()
+    _, _, allocations = await run_paths(bot, paths, max(1, args.rounds // 10), trace_allocations=True)
+    tracemalloc.stop()
+
+    results = {
+        "rounds": args.rounds,
+        "latency": args.latency,
+        "handlers": {name: percentiles(samples) for name, samples in by_handler.items()},
+        "steps": {
+            name: dict(percentiles(samples), alloc_bytes=statistics.median(allocations[name]))
+            for name, samples in by_step.items()
+        },
+        "helpers_ns": bench_helpers(args.helper_number),
+        "calls_per_round": calls_per_round,
+    }
+
+    print(f"{'handler':<10} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9}")
+    for name, stats in results["handlers"].items():
+        print(f"{name:<10} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f}")
+    print()
+    print(f"{'step':<60} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'alloc B':>9}")
+    for name, stats in results["steps"].items():
+        print(f"{name:<60} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f} {stats['alloc_bytes']:>9.0f}")
+    print()
+    for name, ns in results["helpers_ns"].items():
+        print(f"{name:<40} {ns:>9.0f} ns/op")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2, ensure_ascii=False)
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging benchmark: time a log call costs the calling thread (the event loop)
+
+Compares the former basicConfig stream handler with the queue handler of
+log_setup.py, writing to a temporary file and to a stream that stalls on
+every write, as a full pipe to a slow console or log collector does.
+
+Usage:
+    python benchmarks/bench_logging.py [--calls 50000] [--stall-ms 1]
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_setup import TEXT_FORMAT, DeferredQueueHandler  # noqa: E402
+
+
+class StallingStream:
+    """Text stream whose writes block for a fixed time"""
+
+    def __init__(self, stall: float):
+        self.stall = stall
+
+    def write(self, text: str):
+        time.sleep(self.stall)
+
+    def flush(self):
+        pass
+
+
+def time_calls(name: str, handler: logging.Handler, calls: int):
+    """Print the mean cost per INFO call to the calling thread, in microseconds"""
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    started = time.perf_counter()
+    for _ in range(calls):
+        logger.info("Order queued for user %s", 123456789)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<16} {elapsed / calls * 1e6:>9.2f} us/call")
+
+
+def run(label: str, make_stream, calls: int):
+    """Time the stream handler and the queue handler writing to streams from make_stream"""
+    handler = logging.StreamHandler(make_stream())
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    time_calls(f"{label}/stream", handler, calls)
+
+    writer = logging.StreamHandler(make_stream())
+    writer.setFormatter(logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, writer)
+    listener.start()
+    time_calls(f"{label}/queue", DeferredQueueHandler(log_queue), calls)
+    listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging benchmark")
+    parser.add_argument("--calls", type=int, default=50000)
+    parser.add_argument("--stall-ms", type=float, default=1.0, help="Time each write blocks on the stalling stream")
+    args = parser.parse_args()
+    # As set by log_setup.setup_logging
+    logging._srcfile = None
+
+    directory = tempfile.mkdtemp(prefix="daal-bench-")
+    run("file", lambda: open(os.path.join(directory, "bench.log"), "a", encoding="utf-8"), args.calls)
+    run("stalling", lambda: StallingStream(args.stall_ms / 1000), max(args.calls // 100, 1))
+
+
+if __name__ == "__main__":
+    main()
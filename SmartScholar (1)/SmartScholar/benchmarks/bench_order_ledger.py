@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Order ledger benchmark: insert rate and lookup latency at scale
+
+Fills a fresh ledger with synthetic orders spread over users, plans and
+countries, then times the lookups behind /order and /orders.
+
+Usage:
+    python benchmarks/bench_order_ledger.py [--orders 300000] [--users 50000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import PLANS  # noqa: E402
+from config import COUNTRIES  # noqa: E402
+from order_ledger import OrderLedger  # noqa: E402
+
+
+def time_lookups(name, lookup, arguments):
+    """Print p50/p99 of lookup over arguments, in milliseconds"""
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        lookup(argument)
+        samples.append(time.perf_counter() - started)
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    print(f"{name:<12} p50 {cuts[49] * 1e3:>7.3f} ms   p99 {cuts[98] * 1e3:>7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order ledger benchmark")
+    parser.add_argument("--orders", type=int, default=300_000, help="Orders to insert")
+    parser.add_argument("--users", type=int, default=50_000, help="Distinct customers")
+    parser.add_argument("--lookups", type=int, default=2000, help="Lookups timed per query")
+    args = parser.parse_args()
+
+    random.seed(1)
+    # Apple ID details come from the form; the VPN plans' summaries are representative
+    vpn_plans = [plan for plan in PLANS if plan.family != "apple_id"]
+    ledger = OrderLedger(os.path.join(tempfile.mkdtemp(prefix="daal-bench-"), "orders.db"))
+    started = time.perf_counter()
+    for _ in range(args.orders):
+        plan = random.choice(vpn_plans)
+        country = random.choice(COUNTRIES) if plan.family == "wireguard" else ""
+        user_id = 5_000_000_000 + random.randrange(args.users)
+        ledger.record(user_id, f"user{user_id}", plan.plan_id, country, plan.price, plan.order_details(country))
+    elapsed = time.perf_counter() - started
+    print(f"inserted {args.orders} orders in {elapsed:.1f}s ({elapsed / args.orders * 1e6:.0f} us/order)\n")
+
+    order_ids = [random.randint(1, args.orders) for _ in range(args.lookups)]
+    user_ids = [5_000_000_000 + random.randrange(args.users) for _ in range(args.lookups)]
+    time_lookups("/order", ledger.get, order_ids)
+    time_lookups("/orders uid", ledger.by_user, user_ids)
+    time_lookups("/orders", lambda _: ledger.recent(), range(args.lookups))
+    ledger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Session memory benchmark: bytes per session, compact sessions vs dicts
+
+Fills MemorySessionStore and the previous two-dict layout (user_states plus
+a data dict per user) with the same mix of users, measures the memory held
+with tracemalloc, then times an idle sweep of the compact store in batches.
+
+User mix: 60% only pressed /start, 25% picked a WireGuard country, 10% are
+halfway through an Apple ID form, 5% completed one.
+
+Usage:
+    python benchmarks/bench_session_memory.py [--users 1000000] [--batch 1000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="daal-bench-"))
+
+from catalog import PLANS  # noqa: E402
+from config import COUNTRIES  # noqa: E402
+from session_store import MemorySessionStore  # noqa: E402
+
+
+class DictSessionStore:
+    """The layout sessions had before Session: a state dict and a dict of data dicts"""
+
+    def __init__(self):
+        self.user_states = {}
+        self.user_data = {}
+
+    def set_state(self, user_id, state):
+        self.user_states[user_id] = state
+
+    def set_data(self, user_id, key, value):
+        if user_id not in self.user_data:
+            self.user_data[user_id] = {}
+        self.user_data[user_id][key] = value
+
+
+def fill(store, users):
+    """Store sessions for users users through set_state/set_data"""
+    apple_plans = [plan for plan in PLANS if plan.family == "apple_id"]
+    for index in range(users):
+        # Telegram-sized ids, so keys are full int objects as in production
+        user_id = 5_000_000_000 + index * 7
+        bucket = index % 20
+        if bucket < 12:
+            store.set_state(user_id, "main_menu")
+        elif bucket < 17:
+            store.set_state(user_id, "wireguard_menu")
+            store.set_data(user_id, "vpn_type", "wireguard")
+            store.set_data(user_id, "country", COUNTRIES[index % len(COUNTRIES)])
+        else:
+            plan = apple_plans[index % len(apple_plans)]
+            store.set_data(user_id, "service_type", plan.service_type)
+            store.set_data(user_id, "plan_id", plan.plan_id)
+            store.set_data(user_id, "needs_email", plan.needs_email)
+            # Fresh strings, as if parsed from each user's message
+            store.set_data(user_id, "name", "".join(("Ali", str(index % 10))))
+            store.set_data(user_id, "surname", "".join(("Rezaei", str(index % 10))))
+            if bucket < 19:
+                store.set_state(user_id, "waiting_for_birthdate")
+            else:
+                store.set_data(user_id, "birthdate", "".join(("1990/01/1", str(index % 10))))
+                if plan.needs_email:
+                    store.set_data(user_id, "email", "".join(("user", str(index), "@gmail.com")))
+                store.set_state(user_id, "main_menu")
+
+
+def measure(factory, users):
+    """
+    Build a store and fill it
+
+    Returns:
+        tuple: (store, bytes held, seconds to fill)
+    """
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    store = factory()
+    fill(store, users)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, after - before, elapsed
+
+
+def time_sweep(store, batch_size):
+    """
+    Evict every session as idle, batch_size at a time
+
+    Returns:
+        tuple: (sessions evicted, total seconds, longest batch in seconds)
+    """
+    # The first sweep makes every session old, later ones evict them once idle_ttl has passed
+    time.sleep(store._sessions.period)
+    store.sweep(0)
+    time.sleep(store._sessions.idle_ttl)
+    evicted = 0
+    longest = 0.0
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        count = store.sweep(batch_size)
+        longest = max(longest, time.perf_counter() - batch_started)
+        evicted += count
+        if count < batch_size:
+            break
+    return evicted, time.perf_counter() - started, longest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session memory benchmark")
+    parser.add_argument("--users", type=int, default=1_000_000, help="Sessions to store")
+    parser.add_argument("--batch", type=int, default=1000, help="Sessions evicted per sweep step")
+    args = parser.parse_args()
+
+    results = {}
+    stores = (("dicts", DictSessionStore), ("compact", lambda: MemorySessionStore(idle_ttl=1)))
+    for name, factory in stores:
+        store, held, elapsed = measure(factory, args.users)
+        results[name] = held
+        print(f"{name:<8} {held / 2**20:>9.1f} MiB {held / args.users:>8.1f} B/session"
+              f" {elapsed / args.users * 1e9:>8.0f} ns/user to fill")
+        if name == "dicts":
+            del store
+        else:
+            compact = store
+
+    print(f"\ncompact sessions use {results['compact'] / results['dicts']:.0%} of the dict layout")
+
+    evicted, elapsed, longest = time_sweep(compact, args.batch)
+    print(f"idle sweep: {evicted} sessions in {elapsed * 1e3:.0f} ms, "
+          f"longest batch of {args.batch} took {longest * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
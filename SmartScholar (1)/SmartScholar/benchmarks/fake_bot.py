@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process fake Bot and synthetic updates for benchmarking handlers
+
+FakeRequest stands in for HTTPXRequest, so everything above the network
+(argument handling, serialization of keyboards, JSON encoding) runs as in
+production while calls are answered locally.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot, Update
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Daalstore Support", "username": "DaalstoreSupportingbot"}
+
+
+class FakeRequest(BaseRequest):
+    """
+    BaseRequest that records calls and answers them with canned results
+
+    Args:
+        latency: Seconds to sleep per call, or a dict of endpoint -> seconds
+        member_status: Status returned by getChatMember
+    """
+
+    def __init__(self, latency=0.0, member_status: str = "member"):
+        self.latency = latency
+        self.member_status = member_status
+        self.calls: List[Tuple[str, Dict]] = []
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if request_data is not None:
+            # Encode the body like HTTPXRequest does
+            request_data.json_payload
+        self.calls.append((endpoint, parameters))
+
+        latency = self.latency.get(endpoint, 0.0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+        return 200, json.dumps({"ok": True, "result": self._result(endpoint, parameters)}).encode("utf-8")
+
+    def _result(self, endpoint: str, parameters: Dict):
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint == "getChatMember":
+            return {
+                "status": self.member_status,
+                "user": {"id": parameters.get("user_id", 0), "is_bot": False, "first_name": "User"},
+            }
+        if endpoint in ("sendMessage", "editMessageText"):
+            chat_id = parameters.get("chat_id", 0)
+            return {
+                "message_id": parameters.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "channel"},
+                "from": BOT_USER,
+                "text": parameters.get("text", ""),
+            }
+        return True
+
+
+class FakeBot(Bot):
+    """telegram.Bot whose requests are answered by a FakeRequest"""
+
+    def __init__(self, latency=0.0, member_status: str = "member"):
+        request = FakeRequest(latency, member_status)
+        super().__init__("123456:FAKE-TOKEN", request=request, get_updates_request=request)
+        with self._unfrozen():
+            self.fake_request = request
+
+    @property
+    def calls(self) -> List[Tuple[str, Dict]]:
+        return self.fake_request.calls
+
+
+class FakeContext:
+    """The part of CallbackContext the handlers use"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "last_name": "User", "username": f"user{user_id}"}
+
+
+def make_message_update(bot: Bot, user_id: int, text: str) -> Update:
+    """Build a private text message (or command) update"""
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": next(_update_ids), "message": message}, bot)
+
+
+def make_callback_update(bot: Bot, user_id: int, data: str) -> Update:
+    """Build a callback query update for a button on a bot message"""
+    return Update.de_json({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "chat_instance": str(user_id),
+            "from": _user(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "menu",
+            },
+        },
+    }, bot)
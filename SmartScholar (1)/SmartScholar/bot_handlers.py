@@ -4,14 +4,14 @@
 Handler functions for Daal Store Telegram Bot
 """
 
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
 from config import (
-    WELCOME_MESSAGE, PAYMENT_INFO, APPLE_ID_PAYMENT_INFO,
-    ERROR_NOT_MEMBER, ERROR_GENERAL, ERROR_INVALID_INPUT, COUNTRIES
+    WELCOME_MESSAGE, ERROR_NOT_MEMBER, ERROR_GENERAL, ERROR_INVALID_INPUT, COUNTRIES
 )
 from keyboards import (
     get_main_menu_keyboard, get_vpn_menu_keyboard, get_openvpn_keyboard,
@@ -23,10 +23,23 @@ from states import (
     UserState, get_user_state, set_user_state, get_user_data,
     set_user_data, clear_user_data
 )
-from utils import check_channel_membership, validate_name, validate_birthdate, validate_email, format_user_info, log_order_to_channel
+from catalog import CATALOG, add_change_listener
+from forms import FORM_STEPS, Form, FormField, handle_form_input, register_form, start_form
+from metrics import timed, handler_seconds, callbacks_total, orders_total
+from tracing import traced
+from render_cache import (
+    wireguard_menu_text, wireguard_tier_text, vpn_payment_screen, apple_id_plan_text,
+    apple_id_payment_text
+)
+from utils import (
+    check_channel_membership, validate_name, validate_birthdate, validate_email, format_user_info,
+    place_order, is_membership_channel, record_membership, user_registry
+)
 
 logger = logging.getLogger(__name__)
 
+@timed(handler_seconds, "start")
+@traced("start")
 async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user_id = update.effective_user.id
@@ -50,21 +63,65 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         set_user_state(user_id, UserState.MAIN_MENU)
         
     except Exception as e:
-        logger.error(f"Error in start handler: {e}")
+        logger.error("Error in start handler: %s", e)
         await update.message.reply_text(ERROR_GENERAL)
 
+def _user_info(user) -> dict:
+    """Build the user_info dict used for order logging"""
+    return {
+        'user_id': user.id,
+        'username': user.username or 'No username',
+        'first_name': user.first_name or 'Unknown',
+        'last_name': user.last_name or ''
+    }
+
+# Callback data -> handler, and prefix (text before the first "_") -> handler
+CALLBACK_HANDLERS = {}
+CALLBACK_PREFIX_HANDLERS = {}
+
+def callback(*data, prefix=None):
+    """Register a button handler for exact callback data or a data prefix"""
+    def register(handler):
+        for item in data:
+            CALLBACK_HANDLERS[item] = handler
+        if prefix is not None:
+            CALLBACK_PREFIX_HANDLERS[prefix] = handler
+        return handler
+    return register
+
+def _callback_label(data) -> str:
+    """Metric label for callback data, bounded to the registered buttons"""
+    if data in CALLBACK_HANDLERS or data == "check_membership":
+        return data
+    prefix = str(data).partition("_")[0]
+    return prefix if prefix in CALLBACK_PREFIX_HANDLERS else "unknown"
+
+async def _answer_callback(query):
+    """Stop the button's loading animation; the click is still handled if this fails"""
+    try:
+        await query.answer()
+    except TelegramError as e:
+        logger.warning("Failed to answer callback query: %s", e)
+
+@timed(handler_seconds, "button")
+@traced("button")
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
-    await query.answer()
-    
     user_id = query.from_user.id
     data = query.data
+    callbacks_total.labels(_callback_label(data)).inc()
+    
+    # Answering the callback and checking membership are independent, so they share a round trip
+    _, is_member = await asyncio.gather(
+        _answer_callback(query),
+        check_channel_membership(context.bot, user_id, force_refresh=data == "check_membership")
+    )
     
     try:
         # Handle membership check button
         if data == "check_membership":
-            if await check_channel_membership(context.bot, user_id):
+            if is_member:
                 # User is now a member, show welcome message
                 await query.edit_message_text(
                     WELCOME_MESSAGE,
@@ -80,341 +137,219 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Check channel membership for all other interactions
-        if not await check_channel_membership(context.bot, user_id):
+        if not is_member:
             await query.edit_message_text(
                 ERROR_NOT_MEMBER,
                 reply_markup=get_membership_check_keyboard()
             )
             return
         
-        # Handle main menu buttons
-        if data == "vpn":
-            await query.edit_message_text(
-                "🔐 لطفا نوع VPN مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_vpn_menu_keyboard()
-            )
-            set_user_state(user_id, UserState.VPN_MENU)
-            
-        elif data == "apple_id":
-            await query.edit_message_text(
-                "🍎 لطفا نوع سرویس Apple ID مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_apple_id_keyboard()
-            )
-            set_user_state(user_id, UserState.APPLE_ID_MENU)
-            
-        # Handle VPN menu buttons
-        elif data == "openvpn":
-            await query.edit_message_text(
-                "🔒 OpenVPN - لطفا پلن مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_openvpn_keyboard()
-            )
-            set_user_state(user_id, UserState.OPENVPN_MENU)
-            
-        elif data == "wireguard":
-            await query.edit_message_text(
-                "⚡ WireGuard - لطفا کشور مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_country_keyboard()
-            )
-            set_user_state(user_id, UserState.COUNTRY_SELECTION)
-            set_user_data(user_id, "vpn_type", "wireguard")
-            
-        # Handle WireGuard menu buttons
-        elif data == "wireguard_economy":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            await query.edit_message_text(
-                f"💰 WireGuard اکونومی - {country}\n\n"
-                "لطفا پلن مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_wireguard_economy_keyboard()
-            )
-            set_user_state(user_id, UserState.WIREGUARD_ECONOMY)
-            
-        elif data == "wireguard_premium":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n\n"
-                "لطفا پلن مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_wireguard_premium_keyboard()
-            )
-            set_user_state(user_id, UserState.WIREGUARD_PREMIUM)
-            
-        # Handle country selection
-        elif data.startswith("country_"):
-            country_index = int(data.split("_")[1])
-            selected_country = COUNTRIES[country_index]
-            vpn_type = get_user_data(user_id).get("vpn_type", "")
-            
-            if vpn_type == "wireguard":
-                await query.edit_message_text(
-                    f"⚡ WireGuard - {selected_country}\n\n"
-                    "لطفا نوع سرویس مورد نظر خود را انتخاب کنید:",
-                    reply_markup=get_wireguard_keyboard()
-                )
-                set_user_state(user_id, UserState.WIREGUARD_MENU)
-                set_user_data(user_id, "country", selected_country)
-            
-        # Handle OpenVPN purchase
-        elif data == "openvpn_50gb":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "نامشخص")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"🔒 OpenVPN\n📦 پلن: یک ماهه ۵۰ گیگ\n💰 قیمت: ۲۸۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"🔒 OpenVPN\n"
-                f"📦 پلن: یک ماهه ۵۰ گیگ\n"
-                f"💰 قیمت: ۲۸۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        # Handle WireGuard Economy purchases
-        elif data == "wg_eco_50gb":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⚡ WireGuard اکونومی - {country}\n📦 پلن: ۵۰ گیگ ماهانه\n💰 قیمت: ۲۸۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⚡ WireGuard اکونومی - {country}\n"
-                f"📦 پلن: ۵۰ گیگ ماهانه\n"
-                f"💰 قیمت: ۲۸۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        elif data == "wg_eco_100gb":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⚡ WireGuard اکونومی - {country}\n📦 پلن: ۱۰۰ گیگ ماهانه\n💰 قیمت: ۵۰۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⚡ WireGuard اکونومی - {country}\n"
-                f"📦 پلن: ۱۰۰ گیگ ماهانه\n"
-                f"💰 قیمت: ۵۰۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        # Handle WireGuard Premium purchases
-        elif data == "wg_pre_30gb":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⭐ WireGuard پریمیوم - {country}\n📦 پلن: ۳۰ گیگ\n💰 قیمت: ۲۸۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n"
-                f"📦 پلن: ۳۰ گیگ\n"
-                f"💰 قیمت: ۲۸۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        elif data == "wg_pre_50gb":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⭐ WireGuard پریمیوم - {country}\n📦 پلن: ۵۰ گیگ\n💰 قیمت: ۴۰۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n"
-                f"📦 پلن: ۵۰ گیگ\n"
-                f"💰 قیمت: ۴۰۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        elif data == "wg_pre_120gb":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⭐ WireGuard پریمیوم - {country}\n📦 پلن: ۱۲۰ گیگ\n💰 قیمت: ۷۰۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n"
-                f"📦 پلن: ۱۲۰ گیگ\n"
-                f"💰 قیمت: ۷۰۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        elif data == "wg_pre_30gb_gaming":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⭐ WireGuard پریمیوم - {country}\n📦 پلن: ۳۰ گیگ (مخصوص گیمینگ)\n💰 قیمت: ۳۰۰ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n"
-                f"📦 پلن: ۳۰ گیگ (مخصوص گیمینگ)\n"
-                f"💰 قیمت: ۳۰۰ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        elif data == "wg_pre_50gb_gaming":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⭐ WireGuard پریمیوم - {country}\n📦 پلن: ۵۰ گیگ (مخصوص گیمینگ)\n💰 قیمت: ۴۳۵ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n"
-                f"📦 پلن: ۵۰ گیگ (مخصوص گیمینگ)\n"
-                f"💰 قیمت: ۴۳۵ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        elif data == "wg_pre_120gb_gaming":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            
-            # Log order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': query.from_user.username or 'No username',
-                'first_name': query.from_user.first_name or 'Unknown',
-                'last_name': query.from_user.last_name or ''
-            }
-            order_details = f"⭐ WireGuard پریمیوم - {country}\n📦 پلن: ۱۲۰ گیگ (مخصوص گیمینگ)\n💰 قیمت: ۷۳۵ تومان"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            await query.edit_message_text(
-                f"⭐ WireGuard پریمیوم - {country}\n"
-                f"📦 پلن: ۱۲۰ گیگ (مخصوص گیمینگ)\n"
-                f"💰 قیمت: ۷۳۵ تومان\n\n"
-                f"{PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-        # Handle Apple ID menu
-        elif data == "apple_id_personal":
-            await query.edit_message_text(
-                "🍎 ساخت Apple ID با جیمیل شخصی\n"
-                "💰 قیمت: ۸۰۰ تومان\n\n"
-                "لطفا نام خود را وارد کنید:"
-            )
-            set_user_state(user_id, UserState.WAITING_FOR_NAME)
-            set_user_data(user_id, "service_type", "Apple ID با جیمیل شخصی (۸۰۰ تومان)")
-            set_user_data(user_id, "needs_email", True)
-            
-        elif data == "apple_id_new":
-            await query.edit_message_text(
-                "🍎 ساخت Apple ID با جیمیل جدید\n"
-                "💰 قیمت: ۸۵۰ تومان\n\n"
-                "لطفا نام خود را وارد کنید:"
-            )
-            set_user_state(user_id, UserState.WAITING_FOR_NAME)
-            set_user_data(user_id, "service_type", "Apple ID با جیمیل جدید (۸۵۰ تومان)")
-            set_user_data(user_id, "needs_email", False)
-            
-        # Handle back buttons
-        elif data == "back_to_main":
-            await query.edit_message_text(
-                WELCOME_MESSAGE,
-                reply_markup=get_main_menu_keyboard()
-            )
-            set_user_state(user_id, UserState.MAIN_MENU)
-            clear_user_data(user_id)
-            
-        elif data == "back_to_vpn":
-            await query.edit_message_text(
-                "🔐 لطفا نوع VPN مورد نظر خود را انتخاب کنید:",
-                reply_markup=get_vpn_menu_keyboard()
-            )
-            set_user_state(user_id, UserState.VPN_MENU)
-            
-        elif data == "back_to_wireguard":
-            user_data = get_user_data(user_id)
-            country = user_data.get("country", "")
-            if country:
-                await query.edit_message_text(
-                    f"⚡ WireGuard - {country}\n\n"
-                    "لطفا نوع سرویس مورد نظر خود را انتخاب کنید:",
-                    reply_markup=get_wireguard_keyboard()
-                )
-            else:
-                await query.edit_message_text(
-                    "⚡ WireGuard - لطفا کشور مورد نظر خود را انتخاب کنید:",
-                    reply_markup=get_country_keyboard()
-                )
-                set_user_state(user_id, UserState.COUNTRY_SELECTION)
-                set_user_data(user_id, "vpn_type", "wireguard")
-                return
-            set_user_state(user_id, UserState.WIREGUARD_MENU)
+        handler = CALLBACK_HANDLERS.get(data)
+        if handler is None:
+            handler = CALLBACK_PREFIX_HANDLERS.get(data.partition("_")[0])
+        if handler is not None:
+            await handler(query, context, user_id, data)
             
     except Exception as e:
-        logger.error(f"Error in button handler: {e}")
+        logger.error("Error in button handler: %s", e)
         await query.edit_message_text(ERROR_GENERAL)
 
+# Handle main menu buttons
+@callback("vpn", "back_to_vpn")
+async def show_vpn_menu(query, context, user_id, data):
+    await query.edit_message_text(
+        "🔐 لطفا نوع VPN مورد نظر خود را انتخاب کنید:",
+        reply_markup=get_vpn_menu_keyboard()
+    )
+    set_user_state(user_id, UserState.VPN_MENU)
+
+@callback("apple_id")
+async def show_apple_id_menu(query, context, user_id, data):
+    await query.edit_message_text(
+        "🍎 لطفا نوع سرویس Apple ID مورد نظر خود را انتخاب کنید:",
+        reply_markup=get_apple_id_keyboard()
+    )
+    set_user_state(user_id, UserState.APPLE_ID_MENU)
+
+# Handle VPN menu buttons
+@callback("openvpn")
+async def show_openvpn_menu(query, context, user_id, data):
+    await query.edit_message_text(
+        "🔒 OpenVPN - لطفا پلن مورد نظر خود را انتخاب کنید:",
+        reply_markup=get_openvpn_keyboard()
+    )
+    set_user_state(user_id, UserState.OPENVPN_MENU)
+
+@callback("wireguard")
+async def show_country_selection(query, context, user_id, data):
+    await query.edit_message_text(
+        "⚡ WireGuard - لطفا کشور مورد نظر خود را انتخاب کنید:",
+        reply_markup=get_country_keyboard()
+    )
+    set_user_state(user_id, UserState.COUNTRY_SELECTION)
+    set_user_data(user_id, "vpn_type", "wireguard")
+
+# Handle WireGuard menu buttons
+@callback("wireguard_economy")
+async def show_wireguard_economy(query, context, user_id, data):
+    country = get_user_data(user_id).get("country", "")
+    await query.edit_message_text(
+        wireguard_tier_text("economy", country),
+        reply_markup=get_wireguard_economy_keyboard()
+    )
+    set_user_state(user_id, UserState.WIREGUARD_ECONOMY)
+
+@callback("wireguard_premium")
+async def show_wireguard_premium(query, context, user_id, data):
+    country = get_user_data(user_id).get("country", "")
+    await query.edit_message_text(
+        wireguard_tier_text("premium", country),
+        reply_markup=get_wireguard_premium_keyboard()
+    )
+    set_user_state(user_id, UserState.WIREGUARD_PREMIUM)
+
+# Handle country selection
+@callback(prefix="country")
+async def select_country(query, context, user_id, data):
+    country_index = int(data.split("_")[1])
+    selected_country = COUNTRIES[country_index]
+    vpn_type = get_user_data(user_id).get("vpn_type", "")
+    
+    if vpn_type == "wireguard":
+        await query.edit_message_text(
+            wireguard_menu_text(selected_country),
+            reply_markup=get_wireguard_keyboard()
+        )
+        set_user_state(user_id, UserState.WIREGUARD_MENU)
+        set_user_data(user_id, "country", selected_country)
+
+# Handle VPN purchases (every OpenVPN and WireGuard plan in the catalog)
+async def purchase_vpn_plan(query, context, user_id, data):
+    plan = CATALOG[data]
+    # The session keeps the last country picked, which only belongs to plans with a country step
+    country = get_user_data(user_id).get("country", "") if plan.has_country else ""
+    screen = vpn_payment_screen(plan.plan_id, country)
+    
+    # Record the order and log it to channel
+    order = await place_order(context.bot, _user_info(query.from_user), plan.plan_id, country, plan.price, screen.order_details)
+    orders_total.labels(plan.plan_id, country).inc()
+    
+    await query.edit_message_text(
+        screen.render(order.order_id if order else None),
+        reply_markup=get_back_to_main_keyboard()
+    )
+
+# Handle Apple ID menu
+async def start_apple_id_order(query, context, user_id, data):
+    plan = CATALOG[data]
+    set_user_data(user_id, "service_type", plan.service_type)
+    set_user_data(user_id, "plan_id", plan.plan_id)
+    set_user_data(user_id, "needs_email", plan.needs_email)
+    prompt = start_form(APPLE_ID_FORM, user_id)
+    await query.edit_message_text(apple_id_plan_text(plan.plan_id) + prompt)
+
+_plan_callbacks = set()
+
+def register_plan_handlers():
+    """Point every catalog plan's callback data at its purchase handler"""
+    for plan_id in _plan_callbacks:
+        CALLBACK_HANDLERS.pop(plan_id, None)
+    _plan_callbacks.clear()
+    for plan in CATALOG.values():
+        CALLBACK_HANDLERS[plan.plan_id] = start_apple_id_order if plan.family == "apple_id" else purchase_vpn_plan
+        _plan_callbacks.add(plan.plan_id)
+
+register_plan_handlers()
+add_change_listener(register_plan_handlers)
+
+# Handle back buttons
+@callback("back_to_main")
+async def back_to_main(query, context, user_id, data):
+    await query.edit_message_text(
+        WELCOME_MESSAGE,
+        reply_markup=get_main_menu_keyboard()
+    )
+    set_user_state(user_id, UserState.MAIN_MENU)
+    clear_user_data(user_id)
+
+@callback("back_to_wireguard")
+async def back_to_wireguard(query, context, user_id, data):
+    country = get_user_data(user_id).get("country", "")
+    if not country:
+        await show_country_selection(query, context, user_id, data)
+        return
+    await query.edit_message_text(
+        wireguard_menu_text(country),
+        reply_markup=get_wireguard_keyboard()
+    )
+    set_user_state(user_id, UserState.WIREGUARD_MENU)
+
+# Apple ID order form
+async def complete_apple_id_order(update, context, user_id, user_data):
+    """Log the Apple ID order and show the collected information with payment details"""
+    user_info = _user_info(update.effective_user)
+    order_details = (
+        f"🍎 {user_data.get('service_type', 'Apple ID')}\n"
+        f"👤 نام: {user_data.get('name', 'نامشخص')}\n"
+        f"👤 نام خانوادگی: {user_data.get('surname', 'نامشخص')}\n"
+        f"📅 تاریخ تولد: {user_data.get('birthdate', 'نامشخص')}"
+    )
+    if user_data.get("needs_email", False):
+        order_details += f"\n📧 ایمیل: {user_data.get('email', 'نامشخص')}"
+    plan_id = user_data.get("plan_id", "apple_id")
+    plan = CATALOG.get(plan_id)
+    order = await place_order(context.bot, user_info, plan_id, "", plan.price if plan else 0, order_details)
+    orders_total.labels(plan_id, "").inc()
+    
+    # Show user information and payment details
+    info_text = format_user_info(user_data)
+    await update.message.reply_text(
+        apple_id_payment_text(info_text, order.order_id if order else None),
+        reply_markup=get_back_to_main_keyboard()
+    )
+    
+    # Reset state
+    set_user_state(user_id, UserState.MAIN_MENU)
+
+APPLE_ID_FORM = register_form(Form(
+    "apple_id",
+    (
+        FormField(
+            "name", UserState.WAITING_FOR_NAME,
+            "لطفا نام خود را وارد کنید:",
+            "❌ نام وارد شده نامعتبر است. لطفا نام خود را به درستی وارد کنید:",
+            validate_name
+        ),
+        FormField(
+            "surname", UserState.WAITING_FOR_SURNAME,
+            "لطفا نام خانوادگی خود را وارد کنید:",
+            "❌ نام خانوادگی وارد شده نامعتبر است. لطفا نام خانوادگی خود را به درستی وارد کنید:",
+            validate_name
+        ),
+        FormField(
+            "birthdate", UserState.WAITING_FOR_BIRTHDATE,
+            "لطفا تاریخ تولد خود را به فرمت YYYY/MM/DD وارد کنید:\n"
+            "مثال: 1990/01/15",
+            "❌ تاریخ تولد وارد شده نامعتبر است. لطفا تاریخ تولد خود را به فرمت YYYY/MM/DD وارد کنید:\n"
+            "مثال: 1990/01/15",
+            validate_birthdate
+        ),
+        # Only the personal Gmail service collects the user's address
+        FormField(
+            "email", UserState.WAITING_FOR_EMAIL,
+            "لطفا آدرس جیمیل خود را وارد کنید:\n"
+            "مثال: example@gmail.com",
+            "❌ آدرس ایمیل وارد شده نامعتبر است. لطفا آدرس جیمیل خود را به درستی وارد کنید:\n"
+            "مثال: example@gmail.com",
+            validate_email,
+            condition=lambda data: data.get("needs_email", False)
+        ),
+    ),
+    complete_apple_id_order
+))
+
+@timed(handler_seconds, "message")
+@traced("message")
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages"""
     user_id = update.effective_user.id
@@ -430,102 +365,10 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Handle Apple ID information collection
-        if current_state == UserState.WAITING_FOR_NAME:
-            if not validate_name(text):
-                await update.message.reply_text(
-                    "❌ نام وارد شده نامعتبر است. لطفا نام خود را به درستی وارد کنید:"
-                )
-                return
-                
-            set_user_data(user_id, "name", text)
-            set_user_state(user_id, UserState.WAITING_FOR_SURNAME)
-            await update.message.reply_text("لطفا نام خانوادگی خود را وارد کنید:")
-            
-        elif current_state == UserState.WAITING_FOR_SURNAME:
-            if not validate_name(text):
-                await update.message.reply_text(
-                    "❌ نام خانوادگی وارد شده نامعتبر است. لطفا نام خانوادگی خود را به درستی وارد کنید:"
-                )
-                return
-                
-            set_user_data(user_id, "surname", text)
-            set_user_state(user_id, UserState.WAITING_FOR_BIRTHDATE)
-            await update.message.reply_text(
-                "لطفا تاریخ تولد خود را به فرمت YYYY/MM/DD وارد کنید:\n"
-                "مثال: 1990/01/15"
-            )
-            
-        elif current_state == UserState.WAITING_FOR_BIRTHDATE:
-            if not validate_birthdate(text):
-                await update.message.reply_text(
-                    "❌ تاریخ تولد وارد شده نامعتبر است. لطفا تاریخ تولد خود را به فرمت YYYY/MM/DD وارد کنید:\n"
-                    "مثال: 1990/01/15"
-                )
-                return
-                
-            set_user_data(user_id, "birthdate", text)
-            user_data = get_user_data(user_id)
-            
-            # Check if email is needed (for personal Gmail service)
-            if user_data.get("needs_email", False):
-                set_user_state(user_id, UserState.WAITING_FOR_EMAIL)
-                await update.message.reply_text(
-                    "لطفا آدرس جیمیل خود را وارد کنید:\n"
-                    "مثال: example@gmail.com"
-                )
-            else:
-                # Log Apple ID order to channel (without email for new Gmail service)
-                user_info = {
-                    'user_id': user_id,
-                    'username': update.effective_user.username or 'No username',
-                    'first_name': update.effective_user.first_name or 'Unknown',
-                    'last_name': update.effective_user.last_name or ''
-                }
-                order_details = f"🍎 {user_data.get('service_type', 'Apple ID')}\n👤 نام: {user_data.get('name', 'نامشخص')}\n👤 نام خانوادگی: {user_data.get('surname', 'نامشخص')}\n📅 تاریخ تولد: {user_data.get('birthdate', 'نامشخص')}"
-                await log_order_to_channel(context.bot, user_info, order_details)
-                
-                # Show user information and payment details
-                info_text = format_user_info(user_data)
-                await update.message.reply_text(
-                    f"{info_text}\n\n{APPLE_ID_PAYMENT_INFO}",
-                    reply_markup=get_back_to_main_keyboard()
-                )
-                
-                # Reset state
-                set_user_state(user_id, UserState.MAIN_MENU)
-                
-        elif current_state == UserState.WAITING_FOR_EMAIL:
-            if not validate_email(text):
-                await update.message.reply_text(
-                    "❌ آدرس ایمیل وارد شده نامعتبر است. لطفا آدرس جیمیل خود را به درستی وارد کنید:\n"
-                    "مثال: example@gmail.com"
-                )
-                return
-                
-            set_user_data(user_id, "email", text)
-            user_data = get_user_data(user_id)
-            
-            # Log Apple ID order to channel
-            user_info = {
-                'user_id': user_id,
-                'username': update.effective_user.username or 'No username',
-                'first_name': update.effective_user.first_name or 'Unknown',
-                'last_name': update.effective_user.last_name or ''
-            }
-            order_details = f"🍎 {user_data.get('service_type', 'Apple ID')}\n👤 نام: {user_data.get('name', 'نامشخص')}\n👤 نام خانوادگی: {user_data.get('surname', 'نامشخص')}\n📅 تاریخ تولد: {user_data.get('birthdate', 'نامشخص')}\n📧 ایمیل: {user_data.get('email', 'نامشخص')}"
-            await log_order_to_channel(context.bot, user_info, order_details)
-            
-            # Show user information and payment details
-            info_text = format_user_info(user_data)
-            await update.message.reply_text(
-                f"{info_text}\n\n{APPLE_ID_PAYMENT_INFO}",
-                reply_markup=get_back_to_main_keyboard()
-            )
-            
-            # Reset state
-            set_user_state(user_id, UserState.MAIN_MENU)
-            
+        # Collect form input (Apple ID information)
+        step = FORM_STEPS.get(current_state)
+        if step is not None:
+            await handle_form_input(update, context, step, text)
         else:
             # Unknown state or invalid input
             await update.message.reply_text(
@@ -535,14 +378,36 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             set_user_state(user_id, UserState.MAIN_MENU)
             
     except Exception as e:
-        logger.error(f"Error in message handler: {e}")
+        logger.error("Error in message handler: %s", e)
         await update.message.reply_text(ERROR_GENERAL)
 
-async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remember users who talk to the bot privately, so broadcasts can reach them"""
+    chat = update.effective_chat
+    if chat is not None and chat.type == "private" and update.effective_user is not None:
+        user_registry.seen(update.effective_user.id)
+
+@traced("chat_member")
+async def chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Track joins, leaves and kicks in the channel users must join"""
+    change = update.chat_member
+    if is_membership_channel(change.chat):
+        record_membership(change.new_chat_member.user.id, change.new_chat_member.status)
+
+@traced("error")
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
-    logger.error(f"Update {update} caused error {context.error}")
+    if not isinstance(update, Update):
+        logger.error("Error outside an update: %s", context.error, exc_info=context.error)
+        return
+    # Log which update failed, not the whole update (it holds the user's messages)
+    user_id = update.effective_user.id if update.effective_user else None
+    logger.error(
+        "Update %s of user %s caused error: %s", update.update_id, user_id, context.error,
+        exc_info=context.error, extra={"update_id": update.update_id, "user_id": user_id}
+    )
     
-    if update and update.effective_message:
+    if update.effective_message:
         try:
             await update.effective_message.reply_text(ERROR_GENERAL)
         except TelegramError:
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Broadcasts to all users of Daal Store Telegram Bot
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from flood_control import PRIORITY_BROADCAST, TokenBucket, call_priority
+from metrics import broadcast_messages_total
+from user_registry import UserRegistry
+
+logger = logging.getLogger(__name__)
+
+STATUS_LABELS = {
+    "pending": "در صف",
+    "running": "در حال ارسال",
+    "done": "ارسال شد",
+    "cancelled": "لغو شد",
+}
+
+# Seconds between progress log lines
+PROGRESS_LOG_INTERVAL = 60
+
+
+@dataclass
+class Broadcast:
+    """A broadcast and its progress"""
+    broadcast_id: int
+    created_at: float  # Unix time
+    admin_id: int  # Admin who sent it, notified when it finishes
+    text: str
+    status: str  # "pending", "running", "done" or "cancelled"
+    cursor: int  # Highest user ID handled; users are sent to in ID order
+    total: int  # Active users when sending started
+    sent: int
+    blocked: int  # Users who blocked the bot, now marked inactive
+    failed: int
+    resumed_at: float  # Unix time the current run started or resumed
+    resumed_handled: int  # Users handled before the current run
+    updated_at: float  # Unix time of the last checkpoint
+
+    @property
+    def handled(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Users handled per second in the current run"""
+        elapsed = self.updated_at - self.resumed_at
+        return (self.handled - self.resumed_handled) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds left, None before the rate is known"""
+        rate = self.rate
+        return max(self.total - self.handled, 0) / rate if rate else None
+
+
+_COLUMNS = (
+    "broadcast_id, created_at, admin_id, text, status, cursor, total, sent, blocked, failed, "
+    "resumed_at, resumed_handled, updated_at"
+)
+
+
+def format_duration(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def format_broadcast(broadcast: Broadcast) -> str:
+    """Progress of a broadcast, as shown to admins"""
+    lines = [
+        f"📣 پیام همگانی #{broadcast.broadcast_id}: {STATUS_LABELS.get(broadcast.status, broadcast.status)}",
+        f"✅ ارسال شده: {broadcast.sent} از {broadcast.total}",
+        f"🚫 ربات را مسدود کرده‌اند: {broadcast.blocked}",
+        f"❌ ناموفق: {broadcast.failed}",
+    ]
+    if broadcast.rate:
+        lines.append(f"⚡ سرعت: {broadcast.rate:.1f} پیام در ثانیه")
+    if broadcast.status == "running" and broadcast.eta is not None:
+        lines.append(f"⏳ زمان باقی‌مانده: {format_duration(broadcast.eta)}")
+    return "\n".join(lines)
+
+
+class Broadcaster:
+    """
+    Sends a message to every active user in the registry, in the background
+
+    Broadcasts are stored in SQLite and run one at a time by the runner
+    process, which picks up broadcasts submitted by any process. Users are
+    sent to in ID order, concurrency at a time, at no more than rate messages
+    per second. The calls are flood controlled with the lowest priority, so
+    they wait while user-facing calls or order logs need the global budget.
+    Progress is checkpointed after every batch, and a broadcast interrupted by
+    a restart resumes from its checkpoint, so at most one batch is sent twice.
+    Users who blocked the bot are marked inactive in the registry.
+
+    Args:
+        registry: Users to send to
+        path: SQLite database file for broadcasts
+        rate: Messages per second, below FLOOD_GLOBAL_RATE to leave room for users
+        concurrency: Messages in flight at once
+        batch_size: Users per checkpoint
+        runner: Whether this process sends broadcasts
+        poll_interval: Seconds between checks for broadcasts from other processes
+    """
+
+    def __init__(
+        self,
+        registry: UserRegistry,
+        path: str,
+        rate: float = 25.0,
+        concurrency: int = 10,
+        batch_size: int = 200,
+        runner: bool = True,
+        poll_interval: float = 5.0
+    ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.registry = registry
+        self.rate = rate
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.runner = runner
+        self.poll_interval = poll_interval
+
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            "broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+            "admin_id INTEGER NOT NULL, text TEXT NOT NULL, status TEXT NOT NULL, "
+            "cursor INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, "
+            "sent INTEGER NOT NULL DEFAULT 0, blocked INTEGER NOT NULL DEFAULT 0, "
+            "failed INTEGER NOT NULL DEFAULT 0, resumed_at REAL NOT NULL DEFAULT 0, "
+            "resumed_handled INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _select(self, where: str, parameters: tuple = ()) -> List[Broadcast]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM broadcasts {where}", parameters).fetchall()
+        return [Broadcast(*row) for row in rows]
+
+    def _active(self) -> Optional[Broadcast]:
+        """The running broadcast, else the oldest pending one"""
+        broadcasts = self._select(
+            "WHERE status IN ('running', 'pending') ORDER BY status = 'pending', broadcast_id LIMIT 1"
+        )
+        return broadcasts[0] if broadcasts else None
+
+    def submit(self, admin_id: int, text: str) -> Optional[Broadcast]:
+        """
+        Queue a broadcast to every active user
+
+        Args:
+            admin_id: Admin sending it
+            text: Message text
+
+        Returns:
+            Optional[Broadcast]: The queued broadcast, or None if one is already pending or running
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                busy = self._conn.execute(
+                    "SELECT 1 FROM broadcasts WHERE status IN ('running', 'pending') LIMIT 1"
+                ).fetchone()
+                if busy is None:
+                    cursor = self._conn.execute(
+                        "INSERT INTO broadcasts (created_at, admin_id, text, status, updated_at) "
+                        "VALUES (?, ?, ?, 'pending', ?)",
+                        (now, admin_id, text, now)
+                    )
+            finally:
+                self._conn.execute("COMMIT")
+        if busy is not None:
+            return None
+        self._wakeup.set()
+        return self.get(cursor.lastrowid)
+
+    def get(self, broadcast_id: int) -> Optional[Broadcast]:
+        broadcasts = self._select("WHERE broadcast_id = ?", (broadcast_id,))
+        return broadcasts[0] if broadcasts else None
+
+    def latest(self) -> Optional[Broadcast]:
+        """The most recent broadcast"""
+        broadcasts = self._select("ORDER BY broadcast_id DESC LIMIT 1")
+        return broadcasts[0] if broadcasts else None
+
+    def cancel(self) -> Optional[Broadcast]:
+        """
+        Cancel the pending or running broadcast; the runner stops after its current batch
+
+        Returns:
+            Optional[Broadcast]: The cancelled broadcast, or None if there was none
+        """
+        broadcast = self._active()
+        if broadcast is None:
+            return None
+        with self._lock:
+            self._conn.execute(
+                "UPDATE broadcasts SET status = 'cancelled' WHERE broadcast_id = ? AND status IN ('running', 'pending')",
+                (broadcast.broadcast_id,)
+            )
+        return self.get(broadcast.broadcast_id)
+
+    def _checkpoint(self, broadcast: Broadcast):
+        """Store progress; the status is left alone so a cancellation is not overwritten"""
+        broadcast.updated_at = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE broadcasts SET cursor = ?, total = ?, sent = ?, blocked = ?, failed = ?, "
+                "resumed_at = ?, resumed_handled = ?, updated_at = ? WHERE broadcast_id = ?",
+                (broadcast.cursor, broadcast.total, broadcast.sent, broadcast.blocked, broadcast.failed,
+                 broadcast.resumed_at, broadcast.resumed_handled, broadcast.updated_at, broadcast.broadcast_id)
+            )
+
+    def _set_status(self, broadcast: Broadcast, status: str) -> bool:
+        """Move an uncancelled broadcast to status; False if it was cancelled"""
+        with self._lock:
+            changed = self._conn.execute(
+                "UPDATE broadcasts SET status = ? WHERE broadcast_id = ? AND status != 'cancelled'",
+                (status, broadcast.broadcast_id)
+            ).rowcount
+        broadcast.status = status if changed else "cancelled"
+        return bool(changed)
+
+    def start(self, bot: Bot):
+        """
+        Start the background worker if this process is the runner
+
+        Args:
+            bot: Telegram Bot instance used for sending
+        """
+        if self.runner and self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run(bot))
+
+    async def stop(self):
+        """Stop the worker; a running broadcast resumes from its last checkpoint on the next start"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self, bot: Bot):
+        call_priority.set(PRIORITY_BROADCAST)
+        while True:
+            try:
+                broadcast = self._active()
+                if broadcast is not None:
+                    await self._send_all(bot, broadcast)
+                    continue
+            except sqlite3.Error as e:
+                logger.error("Error reading broadcasts: %s", e)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send_all(self, bot: Bot, broadcast: Broadcast):
+        """Send a broadcast to the users after its cursor, checkpointing every batch"""
+        if broadcast.status == "pending":
+            broadcast.total = self.registry.count_active()
+            if not self._set_status(broadcast, "running"):
+                return
+        broadcast.resumed_at = time.time()
+        broadcast.resumed_handled = broadcast.handled
+        self._checkpoint(broadcast)
+        logger.info(
+            "Broadcast %s: sending to %s users from user ID %s",
+            broadcast.broadcast_id, self.registry.count_active(broadcast.cursor), broadcast.cursor
+        )
+
+        bucket = TokenBucket(self.rate, 1)
+        logged = time.monotonic()
+        while True:
+            user_ids = self.registry.active_after(broadcast.cursor, self.batch_size)
+            if not user_ids:
+                break
+            pending = iter(user_ids)
+
+            async def sender():
+                for user_id in pending:
+                    delay = bucket.try_acquire(time.monotonic())
+                    while delay:
+                        await asyncio.sleep(delay)
+                        delay = bucket.try_acquire(time.monotonic())
+                    await self._send(bot, broadcast, user_id)
+
+            await asyncio.gather(*(sender() for _ in range(min(self.concurrency, len(user_ids)))))
+            broadcast.cursor = user_ids[-1]
+            self._checkpoint(broadcast)
+            if self.get(broadcast.broadcast_id).status == "cancelled":
+                broadcast.status = "cancelled"
+                break
+            if time.monotonic() - logged >= PROGRESS_LOG_INTERVAL:
+                logged = time.monotonic()
+                eta = broadcast.eta
+                logger.info(
+                    "Broadcast %s: %s/%s users, %.1f/s, ETA %s", broadcast.broadcast_id, broadcast.handled,
+                    broadcast.total, broadcast.rate, format_duration(eta) if eta is not None else "?"
+                )
+
+        if broadcast.status != "cancelled":
+            self._set_status(broadcast, "done")
+        logger.info(
+            "Broadcast %s %s: %s sent, %s blocked, %s failed", broadcast.broadcast_id, broadcast.status,
+            broadcast.sent, broadcast.blocked, broadcast.failed
+        )
+        try:
+            await bot.send_message(chat_id=broadcast.admin_id, text=format_broadcast(broadcast))
+        except TelegramError as e:
+            logger.warning("Failed to report broadcast %s to admin: %s", broadcast.broadcast_id, e)
+
+    async def _send(self, bot: Bot, broadcast: Broadcast, user_id: int, max_attempts: int = 3):
+        """Send the broadcast to one user"""
+        for _ in range(max_attempts):
+            try:
+                await bot.send_message(chat_id=user_id, text=broadcast.text)
+                broadcast.sent += 1
+                broadcast_messages_total.labels("sent").inc()
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except (Forbidden, BadRequest) as e:
+                # Blocked the bot, deactivated the account or never started a chat
+                if isinstance(e, BadRequest) and "chat not found" not in e.message.lower():
+                    logger.warning("Broadcast %s to user %s rejected: %s", broadcast.broadcast_id, user_id, e)
+                    break
+                self.registry.deactivate(user_id)
+                broadcast.blocked += 1
+                broadcast_messages_total.labels("blocked").inc()
+                return
+            except TelegramError as e:
+                # Timeouts and connection errors
+                logger.warning("Broadcast %s to user %s failed: %s", broadcast.broadcast_id, user_id, e)
+                await asyncio.sleep(1)
+        broadcast.failed += 1
+        broadcast_messages_total.labels("failed").inc()
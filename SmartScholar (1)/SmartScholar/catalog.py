@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Product catalog for Daal Store Telegram Bot
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Tuple
+
+PERSIAN_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+
+# Plan header shown in order details and payment screens, by (family, tier)
+PLAN_HEADERS = {
+    ("openvpn", ""): "🔒 OpenVPN",
+    ("wireguard", "economy"): "⚡ WireGuard اکونومی - {country}",
+    ("wireguard", "premium"): "⭐ WireGuard پریمیوم - {country}",
+}
+
+
+def format_price(price: int) -> str:
+    """
+    Format a price in Persian digits
+
+    Args:
+        price: Price in thousand toman
+
+    Returns:
+        str: Price label, e.g. "۲۸۰ تومان"
+    """
+    return f"{str(price).translate(PERSIAN_DIGITS)} تومان"
+
+
+@dataclass(frozen=True)
+class Plan:
+    """A purchasable plan; plan_id doubles as its callback data"""
+    plan_id: str
+    family: str  # "openvpn", "wireguard" or "apple_id"
+    tier: str  # "economy"/"premium" for WireGuard, "" otherwise
+    label: str  # Plan name used in order details
+    button: str  # Keyboard button text, the price is appended
+    price: int  # Thousand toman
+    needs_email: bool = False  # Apple ID services that collect the user's Gmail
+
+    @property
+    def price_label(self) -> str:
+        return format_price(self.price)
+
+    @property
+    def button_text(self) -> str:
+        return f"{self.button} - {self.price_label}"
+
+    @property
+    def has_country(self) -> bool:
+        """Whether the user picks a country before choosing this plan"""
+        return self.family == "wireguard"
+
+    @property
+    def service_type(self) -> str:
+        """Apple ID service description stored with the order form"""
+        return f"{self.label} ({self.price_label})"
+
+    def header(self, country: str = "") -> str:
+        return PLAN_HEADERS[(self.family, self.tier)].format(country=country)
+
+    def order_details(self, country: str = "") -> str:
+        """
+        Plan summary used in the order log and the payment screen
+
+        Args:
+            country: Selected country (ignored by plans without one)
+
+        Returns:
+            str: Header, plan and price lines
+        """
+        return f"{self.header(country)}\n📦 پلن: {self.label}\n💰 قیمت: {self.price_label}"
+
+
+# All plans, in keyboard order
+PLANS: Tuple[Plan, ...] = (
+    Plan("openvpn_50gb", "openvpn", "", "یک ماهه ۵۰ گیگ", "📦 یک ماهه ۵۰ گیگ", 280),
+    Plan("wg_eco_50gb", "wireguard", "economy", "۵۰ گیگ ماهانه", "📦 ۵۰ گیگ ماهانه", 280),
+    Plan("wg_eco_100gb", "wireguard", "economy", "۱۰۰ گیگ ماهانه", "📦 ۱۰۰ گیگ ماهانه", 500),
+    Plan("wg_pre_30gb", "wireguard", "premium", "۳۰ گیگ", "📦 ۳۰ گیگ", 280),
+    Plan("wg_pre_50gb", "wireguard", "premium", "۵۰ گیگ", "📦 ۵۰ گیگ", 400),
+    Plan("wg_pre_120gb", "wireguard", "premium", "۱۲۰ گیگ", "📦 ۱۲۰ گیگ", 700),
+    Plan("wg_pre_30gb_gaming", "wireguard", "premium", "۳۰ گیگ (مخصوص گیمینگ)", "🎮 ۳۰ گیگ (گیمینگ)", 300),
+    Plan("wg_pre_50gb_gaming", "wireguard", "premium", "۵۰ گیگ (مخصوص گیمینگ)", "🎮 ۵۰ گیگ (گیمینگ)", 435),
+    Plan("wg_pre_120gb_gaming", "wireguard", "premium", "۱۲۰ گیگ (مخصوص گیمینگ)", "🎮 ۱۲۰ گیگ (گیمینگ)", 735),
+    Plan("apple_id_personal", "apple_id", "", "Apple ID با جیمیل شخصی", "📧 ساخت با جیمیل شخصی", 800, needs_email=True),
+    Plan("apple_id_new", "apple_id", "", "Apple ID با جیمیل جدید", "🆕 ساخت با جیمیل جدید", 850),
+)
+
+CATALOG: Dict[str, Plan] = {}
+_plans_by_group: Dict[Tuple[str, str], Tuple[Plan, ...]] = {}
+_change_listeners: List[Callable[[], None]] = []
+
+
+def _index_plans():
+    CATALOG.clear()
+    _plans_by_group.clear()
+    for plan in PLANS:
+        CATALOG[plan.plan_id] = plan
+        group = (plan.family, plan.tier)
+        _plans_by_group[group] = _plans_by_group.get(group, ()) + (plan,)
+
+
+_index_plans()
+
+
+def plans_for(family: str, tier: str = "") -> Tuple[Plan, ...]:
+    """
+    Get the plans of a family and tier in keyboard order
+
+    Args:
+        family: Plan family
+        tier: Plan tier ("" for families without tiers)
+
+    Returns:
+        Tuple[Plan, ...]: Matching plans
+    """
+    return _plans_by_group.get((family, tier), ())
+
+
+def add_change_listener(listener: Callable[[], None]):
+    """
+    Register a callback run whenever the catalog or config changes
+
+    Args:
+        listener: Function invalidating anything derived from the catalog
+    """
+    _change_listeners.append(listener)
+
+
+def notify_changed():
+    """Invalidate derived data after the catalog or config was changed at runtime"""
+    for listener in _change_listeners:
+        listener()
+
+
+def set_plans(plans: Iterable[Plan]):
+    """
+    Replace the catalog at runtime
+
+    Args:
+        plans: New plans, in keyboard order
+    """
+    global PLANS
+    PLANS = tuple(plans)
+    _index_plans()
+    notify_changed()
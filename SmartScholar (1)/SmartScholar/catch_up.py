@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Restart catch-up for Daal Store Telegram Bot
+
+Updates that arrive while the bot is down are kept by Telegram and served
+after a restart instead of being dropped. The highest update ID processed
+is checkpointed, so updates redelivered after a crash are not handled
+twice, and the backlog is thinned before it is processed: messages older
+than a maximum age expire, and of several button presses on one message
+only the last is answered.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Iterable, List, Optional
+
+from telegram import Update
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application
+
+from config import UPDATE_MAX_AGE, UPDATE_OFFSET_PATH
+from metrics import skipped_updates_total
+
+logger = logging.getLogger(__name__)
+
+# Updates per getUpdates call while draining the backlog (Telegram's maximum)
+BACKLOG_BATCH_SIZE = 100
+
+
+class UpdateOffset:
+    """
+    Highest update ID up to which every update was processed, kept in a JSON file
+
+    Updates finish out of order when processed concurrently, so the offset
+    only moves past an update once every earlier one is done. It is written
+    every checkpoint_interval seconds while it moves, and at least every
+    heartbeat_interval seconds so the file also tells when the bot stopped.
+
+    Args:
+        path: JSON file
+        checkpoint_interval: Seconds between writes while updates are processed
+        heartbeat_interval: Seconds between writes while idle
+    """
+
+    def __init__(self, path: str, checkpoint_interval: float = 1.0, heartbeat_interval: float = 30.0):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.update_id = 0
+        self.stopped_at: Optional[float] = None  # Unix time of the last write before this start
+        self._latest = 0
+        self._in_flight = set()
+        self._saved_id = 0
+        self._saved_at = 0.0
+        self._worker: Optional[asyncio.Task] = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as offset_file:
+                state = json.load(offset_file)
+            self.update_id = self._latest = self._saved_id = int(state["update_id"])
+            self.stopped_at = float(state["updated_at"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Error reading update offset from %s: %s", self.path, e)
+
+    def is_processed(self, update_id: int) -> bool:
+        """Whether an update was processed already (Telegram redelivers unconfirmed updates after a crash)"""
+        return update_id <= self.update_id or update_id in self._in_flight
+
+    def begin(self, update_id: int):
+        self._in_flight.add(update_id)
+        self._latest = max(self._latest, update_id)
+
+    def done(self, update_id: int):
+        self._in_flight.discard(update_id)
+        self.update_id = min(self._in_flight) - 1 if self._in_flight else self._latest
+
+    def save(self):
+        """Write the offset and the current time"""
+        tmp_path = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as offset_file:
+                json.dump({"update_id": self.update_id, "updated_at": time.time()}, offset_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("Error writing update offset to %s: %s", self.path, e)
+            return
+        self._saved_id = self.update_id
+        self._saved_at = time.monotonic()
+
+    def start(self):
+        """Start writing checkpoints in the background"""
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the checkpoints and write the final offset"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            if self.update_id != self._saved_id or time.monotonic() - self._saved_at >= self.heartbeat_interval:
+                self.save()
+
+
+def is_expired(update: Update, max_age: float, now: float) -> bool:
+    """Whether a message update is older than max_age seconds (0 for no limit)"""
+    message = update.message or update.edited_message
+    return bool(max_age and message is not None and now - message.date.timestamp() > max_age)
+
+
+def select_backlog(updates: Iterable[Update], max_age: float, stopped_at: Optional[float]) -> List[Update]:
+    """
+    Updates of a restart backlog worth processing, in order
+
+    Messages older than max_age are dropped. Button presses carry no time,
+    so they are only known to be newer than stopped_at; they are dropped if
+    the bot was down for longer than max_age. Of several presses on the same
+    message, only the last is kept.
+
+    Args:
+        updates: Backlog updates, in update ID order
+        max_age: Seconds after which an update is no longer answered, 0 for no limit
+        stopped_at: Unix time the bot stopped, if known
+
+    Returns:
+        List[Update]: Updates to process
+    """
+    now = time.time()
+    callbacks_expired = bool(max_age and stopped_at and now - stopped_at > max_age)
+    kept = []
+    latest_press = {}
+    for update in updates:
+        query = update.callback_query
+        if query is None:
+            if is_expired(update, max_age, now):
+                skipped_updates_total.labels("expired").inc()
+                continue
+        elif callbacks_expired:
+            skipped_updates_total.labels("expired").inc()
+            continue
+        else:
+            if query.message is not None:
+                key = (query.message.chat_id, query.message.message_id)
+            else:
+                key = query.inline_message_id
+            earlier = latest_press.get(key)
+            if earlier is not None:
+                kept[earlier] = None
+                skipped_updates_total.labels("collapsed").inc()
+            latest_press[key] = len(kept)
+        kept.append(update)
+    return [update for update in kept if update is not None]
+
+
+async def drain_backlog(application: Application, offset: UpdateOffset, allowed_updates: List[str]) -> int:
+    """
+    Process the updates Telegram kept while the bot was down, before polling starts
+
+    The backlog is fetched in batches. Each batch is thinned by
+    select_backlog and processed concurrently through the application's
+    update processor, which keeps each user's updates in order. Fetching
+    the next batch confirms the previous one with Telegram.
+
+    Args:
+        application: Initialized application with handlers registered
+        offset: Checkpointed update offset
+        allowed_updates: Update types to fetch
+
+    Returns:
+        int: Updates processed
+    """
+    processor = application.update_processor
+    started = time.monotonic()
+    next_offset = None
+    fetched = processed = 0
+    while True:
+        try:
+            updates = await application.bot.get_updates(
+                offset=next_offset, limit=BACKLOG_BATCH_SIZE, timeout=0, allowed_updates=allowed_updates
+            )
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except TelegramError as e:
+            logger.error("Error fetching the update backlog, continuing with polling: %s", e)
+            break
+        if not updates:
+            break
+        next_offset = updates[-1].update_id + 1
+        fetched += len(updates)
+        selected = select_backlog(updates, UPDATE_MAX_AGE, offset.stopped_at)
+        processed += len(selected)
+        await asyncio.gather(*(
+            processor.process_update(update, application.process_update(update)) for update in selected
+        ))
+    if fetched:
+        logger.info(
+            "Caught up on %s updates received while stopped (%s processed) in %.1fs",
+            fetched, processed, time.monotonic() - started
+        )
+    return processed
+
+
+update_offset = UpdateOffset(UPDATE_OFFSET_PATH)
@@ -12,6 +12,121 @@ CHANNEL_ID = "@daalstore"  # Channel username for membership verification
 CHANNEL_URL = "https://t.me/daalstore"
 ORDER_LOG_CHANNEL = "-1002692195953"  # Channel ID for order logging (@daalstoreorderlog)
 
+# Update ingestion: "polling" or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Webhook configuration (used when BOT_MODE is "webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public base URL, empty to skip set_webhook
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+
+# Concurrent update processing (updates of one user are still handled in order)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1024"))
+
+# Sharded mode: with more than one worker process, a supervisor receives updates
+# and routes them by user id to the workers
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+
+# Outbound flood control (Telegram allows ~30 messages/s overall, ~1/s per chat, 20/min per group)
+FLOOD_GLOBAL_RATE = float(os.getenv("FLOOD_GLOBAL_RATE", "30"))
+FLOOD_PRIVATE_CHAT_RATE = float(os.getenv("FLOOD_PRIVATE_CHAT_RATE", "1"))
+FLOOD_PRIVATE_CHAT_BURST = float(os.getenv("FLOOD_PRIVATE_CHAT_BURST", "3"))
+FLOOD_GROUP_CHAT_PER_MINUTE = float(os.getenv("FLOOD_GROUP_CHAT_PER_MINUTE", "20"))
+
+# Telegram HTTP client (timeouts in seconds)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "256"))  # Connections for API calls
+HTTP_UPDATES_POOL_SIZE = int(os.getenv("HTTP_UPDATES_POOL_SIZE", "1"))  # Connections for getUpdates
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "5"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "1"))  # Wait for a free connection
+HTTP_VERSION = os.getenv("HTTP_VERSION", "1.1")  # "2" multiplexes calls per connection (needs httpx[http2])
+
+# Directory for local databases and spool files
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# Session storage: "memory", "sqlite" or "redis"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(DATA_DIR, "sessions.db"))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))  # Seconds between write-behind flushes
+SESSION_FLUSH_BATCH_SIZE = int(os.getenv("SESSION_FLUSH_BATCH_SIZE", "500"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "0"))  # Redis key expiry in seconds, 0 to keep forever
+# Sessions held in memory (the memory backend, the sqlite and redis caches).
+# Evicted sqlite and redis sessions are reloaded; evicted memory sessions are gone.
+SESSION_MAX_IN_MEMORY = int(os.getenv("SESSION_MAX_IN_MEMORY", "200000"))  # LRU cap, 0 for no cap
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "86400"))  # Evict after this many idle seconds, 0 to keep
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # Seconds between idle sweeps
+
+# Order log outbox (spooled to disk, sent in the background)
+ORDER_OUTBOX_PATH = os.getenv("ORDER_OUTBOX_PATH", os.path.join(DATA_DIR, "order_outbox.jsonl"))
+ORDER_LOG_MESSAGES_PER_MINUTE = float(os.getenv("ORDER_LOG_MESSAGES_PER_MINUTE", "20"))
+
+# Restarts: the last processed update is checkpointed so updates received while the bot is down
+# are answered after a restart, except messages (and, after long outages, button presses) older
+# than UPDATE_MAX_AGE seconds (0 answers everything)
+UPDATE_OFFSET_PATH = os.getenv("UPDATE_OFFSET_PATH", os.path.join(DATA_DIR, "update_offset.json"))
+UPDATE_MAX_AGE = float(os.getenv("UPDATE_MAX_AGE", "600"))
+
+# Update tracing: a share of traces, and every update slower than TRACE_SLOW_SECONDS,
+# is appended to TRACE_PATH (rotated to TRACE_PATH.1 at TRACE_MAX_BYTES); "" disables the file
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(DATA_DIR, "traces.jsonl"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "2"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Logging: records are written by a background thread to the console and, as JSON lines, to
+# LOG_PATH (rotated at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files); "" disables the file
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_PATH = os.getenv("LOG_PATH", os.path.join(DATA_DIR, "bot.log.jsonl"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+# Order ledger (SQLite, shared by all worker processes)
+ORDER_LEDGER_PATH = os.getenv("ORDER_LEDGER_PATH", os.path.join(DATA_DIR, "orders.db"))
+
+# User IDs allowed to use admin commands, comma separated
+ADMIN_IDS = [int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()]
+
+# Registry of users who talked to the bot (shared by all worker processes), for broadcasts
+USER_REGISTRY_PATH = os.getenv("USER_REGISTRY_PATH", os.path.join(DATA_DIR, "users.db"))
+# Broadcasts: messages per second (keep below FLOOD_GLOBAL_RATE to leave room for users),
+# messages in flight, and users per progress checkpoint
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+# Whether this process sends broadcasts; in multi-process mode only the first worker does
+BROADCAST_RUNNER = os.getenv("BROADCAST_RUNNER", "1") == "1"
+
+# Health server (/, /healthz, /readyz, /metrics, /stats), served on the bot's event loop.
+# Metrics are per process: in multi-process mode the supervisor's /metrics only covers routing,
+# and worker n serves its own (handlers, API calls, sessions, outbox) on HEALTH_PORT + 1 + n
+HEALTH_LISTEN = os.getenv("HEALTH_LISTEN", "0.0.0.0")
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8080"))
+# Token for the health server's /stats JSON (?token=...); /stats is disabled while empty
+STATS_TOKEN = os.getenv("STATS_TOKEN", "")
+
+# Event loop implementation: "asyncio" or "uvloop" (pip install uvloop)
+EVENT_LOOP = os.getenv("EVENT_LOOP", "asyncio")
+# Event loop lag is measured every LOOP_LAG_INTERVAL seconds; a lag of LOOP_BLOCKED_SECONDS
+# or more is logged with the blocking call's stack (0 only records lag)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_BLOCKED_SECONDS = float(os.getenv("LOOP_BLOCKED_SECONDS", "0.25"))
+
+# Membership cache configuration (TTLs in seconds)
+MEMBERSHIP_CACHE_POSITIVE_TTL = float(os.getenv("MEMBERSHIP_CACHE_POSITIVE_TTL", "300"))
+MEMBERSHIP_CACHE_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_CACHE_NEGATIVE_TTL", "15"))
+MEMBERSHIP_CACHE_MAX_SIZE = int(os.getenv("MEMBERSHIP_CACHE_MAX_SIZE", "50000"))
+
+# Membership index fed by chat_member updates; needs the bot to be an administrator of CHANNEL_ID
+MEMBERSHIP_INDEX = os.getenv("MEMBERSHIP_INDEX", "0") == "1"
+MEMBERSHIP_INDEX_PATH = os.getenv("MEMBERSHIP_INDEX_PATH", os.path.join(DATA_DIR, "membership.db"))
+MEMBERSHIP_INDEX_MAX_AGE = float(os.getenv("MEMBERSHIP_INDEX_MAX_AGE", "604800"))  # Seconds a status is trusted
+MEMBERSHIP_INDEX_MAX_SIZE = int(os.getenv("MEMBERSHIP_INDEX_MAX_SIZE", "200000"))  # Users held in memory, 0 for no cap
+
 # Welcome message
 WELCOME_MESSAGE = "به ربات پشتیبانی فروشگاه دال استور خوش آمدید"
 
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event loop selection and monitoring for Daal Store Telegram Bot
+
+The loop implementation is chosen by EVENT_LOOP (asyncio or uvloop). A
+probe task measures how late the loop runs a callback scheduled at a fixed
+interval, i.e. how long other callbacks held the loop. A watchdog thread
+notices when the probe stops running altogether and logs the stack the
+loop thread is stuck in, so the blocking call can be found.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Coroutine, Optional
+
+from config import EVENT_LOOP, LOOP_BLOCKED_SECONDS, LOOP_LAG_INTERVAL
+from metrics import event_loop_blocked_total, event_loop_lag_seconds
+
+logger = logging.getLogger(__name__)
+
+
+def event_loop_factory(name: str = EVENT_LOOP) -> Callable[[], asyncio.AbstractEventLoop]:
+    """
+    Constructor of an event loop implementation
+
+    Args:
+        name: "asyncio" or "uvloop"; falls back to asyncio if uvloop is not installed
+
+    Returns:
+        Callable[[], asyncio.AbstractEventLoop]: Creates a new loop
+    """
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("EVENT_LOOP=uvloop needs uvloop (pip install uvloop), using asyncio")
+        else:
+            return uvloop.new_event_loop
+    elif name != "asyncio":
+        logger.warning("Unknown EVENT_LOOP %r, using asyncio", name)
+    return asyncio.new_event_loop
+
+
+def run(main: Coroutine, name: str = EVENT_LOOP):
+    """asyncio.run on the configured loop implementation"""
+    with asyncio.Runner(loop_factory=event_loop_factory(name)) as runner:
+        return runner.run(main)
+
+
+class LoopLagMonitor:
+    """
+    Scheduling delay of the event loop, and stacks of calls that block it
+
+    Every interval seconds the probe records how late it woke up in
+    daal_event_loop_lag_seconds. A lag of blocked_seconds or more counts as
+    a blocked loop. While the loop is blocked that long, the watchdog thread
+    logs the loop thread's current stack; a block that ended before the
+    watchdog looked is logged with its duration only.
+
+    Args:
+        interval: Seconds between probes
+        blocked_seconds: Lag reported as a blocked loop, 0 to only record lag
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, blocked_seconds: float = LOOP_BLOCKED_SECONDS):
+        self.interval = interval
+        self.blocked_seconds = blocked_seconds
+        self.lag = 0.0  # Latest measured lag in seconds
+        self._beat = time.monotonic()  # When the probe last ran
+        self._reported_beat: Optional[float] = None  # _beat of the stall the watchdog logged
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start probing the running loop, and the watchdog thread"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        if self.blocked_seconds > 0:
+            self._stopped.clear()
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        """Stop the probe and the watchdog"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            beat = self._beat
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+            event_loop_lag_seconds.observe(self.lag)
+            if self.blocked_seconds and self.lag >= self.blocked_seconds:
+                if self._reported_beat != beat:
+                    event_loop_blocked_total.inc()
+                logger.warning("Event loop was blocked for %.0fms", self.lag * 1e3)
+
+    def _watch(self):
+        while not self._stopped.wait(max(self.blocked_seconds / 2, 0.01)):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.blocked_seconds or beat == self._reported_beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_beat = beat
+            event_loop_blocked_total.inc()
+            logger.warning(
+                "Event loop blocked for over %.0fms in:\n%s", stalled * 1e3, "".join(traceback.format_stack(frame))
+            )
+
+
+loop_monitor = LoopLagMonitor()
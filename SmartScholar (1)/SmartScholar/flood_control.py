@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Outbound flood control for Daal Store Telegram Bot
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from typing import Optional, Tuple
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, RequestData
+
+from metrics import (
+    api_errors_total, api_in_flight, api_in_flight_max, api_pool_timeouts_total,
+    api_request_seconds, api_requests_total
+)
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Priorities, lower is served first
+PRIORITY_USER = 0
+PRIORITY_LOG = 1
+PRIORITY_BROADCAST = 2
+PRIORITY_NAMES = ("user", "log", "broadcast")
+
+# Priority of calls made from the current task; the broadcast worker lowers its own
+call_priority: contextvars.ContextVar[int] = contextvars.ContextVar("daal_call_priority", default=PRIORITY_USER)
+
+
+def is_rate_limited_method(endpoint: str) -> bool:
+    """Whether a Bot API method counts towards Telegram's message limits"""
+    return endpoint.startswith(("send", "edit", "copyMessage", "forwardMessage"))
+
+
+class TokenBucket:
+    """Token bucket that can also be blocked for a fixed time (retry_after)"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def try_acquire(self, now: float) -> float:
+        """
+        Take a token if one is available
+
+        Args:
+            now: Current time.monotonic()
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one may be
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, now: float, seconds: float):
+        """Refuse tokens for the next seconds"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        """Whether the bucket is full again and can be forgotten"""
+        return now >= self.blocked_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose state lives in shared memory, so worker processes
+    started with the same bucket draw from one budget
+
+    time.monotonic() is system-wide, so timestamps compare across processes.
+
+    Args:
+        rate: Tokens per second
+        capacity: Bucket size
+        context: multiprocessing context the workers are started with
+    """
+
+    __slots__ = ("_state", "_lock")
+
+    def __init__(self, rate: float, capacity: float, context):
+        # tokens, updated, blocked_until
+        self._state = context.RawArray("d", 3)
+        self._lock = context.Lock()
+        super().__init__(rate, capacity)
+
+    def __getstate__(self):
+        return self.rate, self.capacity, self._state, self._lock
+
+    def __setstate__(self, state):
+        self.rate, self.capacity, self._state, self._lock = state
+
+    def _field(index):
+        return property(
+            lambda self: self._state[index],
+            lambda self, value: self._state.__setitem__(index, value)
+        )
+
+    tokens = _field(0)
+    updated = _field(1)
+    blocked_until = _field(2)
+    del _field
+
+    def try_acquire(self, now: float) -> float:
+        with self._lock:
+            return super().try_acquire(now)
+
+    def block(self, now: float, seconds: float):
+        with self._lock:
+            super().block(now, seconds)
+
+
+class FloodControlScheduler:
+    """
+    Global and per-chat token buckets with priority for user-facing calls
+
+    Calls first wait for their chat's bucket, then for the global bucket.
+    While a call waits for the global bucket, lower priority calls are held
+    back: user-facing calls first, then the order log channel, then
+    broadcasts.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        private_chat_rate: float = 1.0,
+        private_chat_burst: float = 3.0,
+        group_chat_rate: float = 20 / 60,
+        group_chat_burst: float = 3.0,
+        max_chat_buckets: int = 10000
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_chat_rate = group_chat_rate
+        self.group_chat_burst = group_chat_burst
+        self.max_chat_buckets = max_chat_buckets
+        self._chat_buckets = {}
+        # Calls waiting on any bucket / on the global bucket, by priority
+        self.queued = [0] * len(PRIORITY_NAMES)
+        self._waiting_global = [0] * len(PRIORITY_NAMES)
+        self.throttled = 0
+        self.retry_after_count = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._prune(time.monotonic())
+            # Private chats have positive ids; groups and channels are negative or @names
+            private = (isinstance(chat_id, int) and chat_id > 0) or str(chat_id).isdigit()
+            if private:
+                bucket = TokenBucket(self.private_chat_rate, self.private_chat_burst)
+            else:
+                bucket = TokenBucket(self.group_chat_rate, self.group_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def acquire(self, chat_id, priority: int = PRIORITY_USER):
+        """
+        Wait until a call to chat_id fits both the chat and the global budget
+
+        Args:
+            chat_id: Target chat, or None for calls without one
+            priority: PRIORITY_USER, PRIORITY_LOG or PRIORITY_BROADCAST
+        """
+        self.queued[priority] += 1
+        try:
+            if chat_id is not None:
+                bucket = self._chat_bucket(chat_id)
+                delay = bucket.try_acquire(time.monotonic())
+                while delay:
+                    self.throttled += 1
+                    await asyncio.sleep(delay)
+                    delay = bucket.try_acquire(time.monotonic())
+
+            self._waiting_global[priority] += 1
+            try:
+                while True:
+                    if any(self._waiting_global[:priority]):
+                        delay = 1 / self.global_bucket.rate
+                    else:
+                        delay = self.global_bucket.try_acquire(time.monotonic())
+                    if not delay:
+                        return
+                    self.throttled += 1
+                    await asyncio.sleep(delay)
+            finally:
+                self._waiting_global[priority] -= 1
+        finally:
+            self.queued[priority] -= 1
+
+    def retry_after(self, chat_id, seconds: float):
+        """
+        Honour a retry_after answer from Telegram
+
+        Args:
+            chat_id: Chat the call was for, or None to pause all calls
+            seconds: Seconds Telegram asked us to wait
+        """
+        self.retry_after_count += 1
+        now = time.monotonic()
+        if chat_id is None:
+            self.global_bucket.block(now, seconds)
+        else:
+            self._chat_bucket(chat_id).block(now, seconds)
+
+    def stats(self) -> dict:
+        """Queue depths and counters for monitoring"""
+        return {
+            "queued": dict(zip(PRIORITY_NAMES, self.queued)),
+            "chat_buckets": len(self._chat_buckets),
+            "throttled": self.throttled,
+            "retry_after": self.retry_after_count,
+        }
+
+
+class FloodControlledRequest(BaseRequest):
+    """
+    Request wrapper that schedules message-sending calls through a
+    FloodControlScheduler and retries calls answered with retry_after
+
+    Calls to low_priority_chat_id (the order log channel) yield to
+    user-facing calls when the global budget is exhausted, and calls made
+    under a lower call_priority (broadcasts) yield to both. Calls in flight
+    and pool timeouts are tracked to size the connection pool.
+    """
+
+    def __init__(
+        self,
+        request: BaseRequest,
+        scheduler: FloodControlScheduler,
+        low_priority_chat_id: Optional[str] = None,
+        max_retries: int = 2
+    ):
+        self._request = request
+        self.scheduler = scheduler
+        self.low_priority_chat_id = str(low_priority_chat_id) if low_priority_chat_id else None
+        self.max_retries = max_retries
+        # endpoint -> (calls, latency, errors) metric children
+        self._endpoint_metrics = {}
+        self._in_flight = api_in_flight.labels()
+        self._in_flight_max = api_in_flight_max.labels()
+        self._pool_timeouts = api_pool_timeouts_total.labels()
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._request.read_timeout
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        limited = is_rate_limited_method(endpoint)
+        chat_id = None
+        priority = call_priority.get()
+        if limited and request_data is not None:
+            chat_id = request_data.parameters.get("chat_id")
+            if chat_id is not None and str(chat_id) == self.low_priority_chat_id:
+                priority = PRIORITY_LOG
+
+        with span(endpoint):
+            calls, latency, errors = self._metrics_for(endpoint)
+            attempt = 0
+            while True:
+                if limited:
+                    with span("rate_limit"):
+                        await self.scheduler.acquire(chat_id, priority)
+                calls.inc()
+                in_flight = self._in_flight
+                in_flight.value += 1
+                if in_flight.value > self._in_flight_max.value:
+                    self._in_flight_max.value = in_flight.value
+                started = time.perf_counter()
+                try:
+                    code, payload = await self._request.do_request(
+                        url=url,
+                        method=method,
+                        request_data=request_data,
+                        read_timeout=read_timeout,
+                        write_timeout=write_timeout,
+                        connect_timeout=connect_timeout,
+                        pool_timeout=pool_timeout,
+                    )
+                except TimedOut as exc:
+                    errors.inc()
+                    if isinstance(exc.__cause__, httpx.PoolTimeout):
+                        self._pool_timeouts.inc()
+                    raise
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    in_flight.value -= 1
+                    latency.observe(time.perf_counter() - started)
+                if code >= 400:
+                    errors.inc()
+                if code != 429:
+                    return code, payload
+
+                retry_after = self._parse_retry_after(payload)
+                self.scheduler.retry_after(chat_id, retry_after)
+                if attempt >= self.max_retries:
+                    # Let PTB raise RetryAfter to the caller
+                    return code, payload
+                attempt += 1
+                logger.warning("Flood limit hit on %s, retrying in %ss", endpoint, retry_after)
+                if not limited:
+                    await asyncio.sleep(retry_after)
+
+    def _metrics_for(self, endpoint: str):
+        children = self._endpoint_metrics.get(endpoint)
+        if children is None:
+            children = self._endpoint_metrics[endpoint] = (
+                api_requests_total.labels(endpoint),
+                api_request_seconds.labels(endpoint),
+                api_errors_total.labels(endpoint),
+            )
+        return children
+
+    @staticmethod
+    def _parse_retry_after(payload: bytes) -> float:
+        try:
+            return float(json.loads(payload)["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return 1.0
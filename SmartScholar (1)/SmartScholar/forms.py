@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Declarative multi-step forms for Daal Store Telegram Bot
+
+A form is an ordered list of fields. Each field owns the UserState the user
+is in while the bot waits for that field, so registering a form fills
+FORM_STEPS, a table from UserState to the field being collected and the
+fields that may follow it. message_handler resolves a user's step with one
+lookup instead of a chain of state comparisons.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from states import UserState, get_user_data, set_user_data, set_user_state
+
+
+@dataclass(frozen=True)
+class FormField:
+    """One input of a form"""
+    key: str  # Session data key the value is stored under
+    state: UserState  # State while waiting for this field
+    prompt: str  # Message asking for the value
+    error: str  # Message sent when validation fails
+    validator: Callable[[str], bool]
+    condition: Optional[Callable[[Dict[str, Any]], bool]] = None  # Ask only if condition(data)
+
+    def applies(self, data: Dict[str, Any]) -> bool:
+        return self.condition is None or self.condition(data)
+
+
+# on_complete(update, context, user_id, data)
+CompletionHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE, int, Dict[str, Any]], Awaitable[None]]
+
+
+class Form:
+    """
+    Ordered fields plus the handler run once all applicable fields are filled
+
+    Args:
+        name: Form name, for logging
+        fields: Fields in the order they are asked
+        on_complete: Coroutine function called with the collected data
+    """
+
+    def __init__(self, name: str, fields: Tuple[FormField, ...], on_complete: CompletionHandler):
+        self.name = name
+        self.fields = tuple(fields)
+        self.on_complete = on_complete
+
+    def first_field(self, data: Dict[str, Any]) -> Optional[FormField]:
+        """First field to ask for, given the data known when the form starts"""
+        return next((field for field in self.fields if field.applies(data)), None)
+
+
+@dataclass(frozen=True)
+class FormStep:
+    """Transition table entry: the field being collected and what may follow"""
+    form: Form
+    field: FormField
+    following: Tuple[FormField, ...]
+
+    def next_field(self, data: Dict[str, Any]) -> Optional[FormField]:
+        return next((field for field in self.following if field.applies(data)), None)
+
+
+# UserState -> FormStep for every registered form
+FORM_STEPS: Dict[UserState, FormStep] = {}
+
+
+def register_form(form: Form) -> Form:
+    """
+    Add a form's fields to the transition table
+
+    Args:
+        form: Form to register
+
+    Returns:
+        Form: The same form
+
+    Raises:
+        ValueError: If a state is already used by another field
+    """
+    for index, field in enumerate(form.fields):
+        if field.state in FORM_STEPS:
+            raise ValueError(f"State {field.state} is already used by form {FORM_STEPS[field.state].form.name}")
+        FORM_STEPS[field.state] = FormStep(form, field, form.fields[index + 1:])
+    return form
+
+
+def start_form(form: Form, user_id: int) -> str:
+    """
+    Move a user to the first field of a form
+
+    Args:
+        form: Form to start
+        user_id: User filling in the form
+
+    Returns:
+        str: Prompt for the first field, for the caller to send
+    """
+    field = form.first_field(get_user_data(user_id))
+    set_user_state(user_id, field.state)
+    return field.prompt
+
+
+async def handle_form_input(update: Update, context: ContextTypes.DEFAULT_TYPE, step: FormStep, text: str):
+    """
+    Validate and store one answer, then ask the next field or complete the form
+
+    Args:
+        update: Update carrying the answer
+        context: Handler context
+        step: Step the user is at, from FORM_STEPS
+        text: The user's answer
+    """
+    user_id = update.effective_user.id
+    field = step.field
+    if not field.validator(text):
+        await update.message.reply_text(field.error)
+        return
+
+    set_user_data(user_id, field.key, text)
+    data = get_user_data(user_id)
+    next_field = step.next_field(data)
+    if next_field is not None:
+        set_user_state(user_id, next_field.state)
+        await update.message.reply_text(next_field.prompt)
+        return
+
+    await step.form.on_complete(update, context, user_id, data)
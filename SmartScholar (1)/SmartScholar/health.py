@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Health server for Daal Store Telegram Bot
+
+Runs on the bot's event loop, so it only answers while the loop does:
+
+    /         "I am alive!" while the process runs, for uptime monitors
+    /healthz  Liveness: the event loop is running, with its latest lag
+    /readyz   Readiness: updates are being received and Telegram is reachable
+    /metrics  Prometheus metrics
+    /stats    Sales aggregates as JSON, with ?token=STATS_TOKEN
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import time
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+
+from telegram import Bot
+from telegram.error import TelegramError
+
+import metrics
+from config import HEALTH_LISTEN, HEALTH_PORT, STATS_TOKEN
+from event_loop import LoopLagMonitor, loop_monitor
+from http_server import AsyncHTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+def json_response(status: int, body: dict) -> Response:
+    return Response(status, json.dumps(body).encode("utf-8"), JSON_CONTENT_TYPE)
+
+
+class HealthServer:
+    """
+    Liveness, readiness, metrics and stats endpoints
+
+    Readiness stays false until set_ingress is called once the bot is ready.
+    Telegram is probed with getMe at most every probe_interval seconds, so
+    frequent readiness checks do not reach the Bot API.
+
+    Args:
+        host: Listen address
+        port: Listen port
+        monitor: Event loop lag monitor reported by /healthz
+        probe_interval: Seconds a getMe result is reused
+        probe_timeout: Seconds before a getMe probe counts as failed
+    """
+
+    def __init__(self, host: str, port: int, monitor: LoopLagMonitor, probe_interval: float = 15.0,
+                 probe_timeout: float = 5.0):
+        self.monitor = monitor
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.server = AsyncHTTPServer(host, port)
+        self._bot: Optional[Bot] = None
+        self._receiving: Optional[Callable[[], bool]] = None
+        self._reachable = False
+        self._probed_at = float("-inf")
+        self._probe: Optional[asyncio.Task] = None
+        for path, handler in (
+            ("/", self._home),
+            ("/healthz", self._healthz),
+            ("/readyz", self._readyz),
+            ("/metrics", self._metrics),
+            ("/stats", self._stats),
+        ):
+            self.server.add_route("GET", path, handler)
+
+    def set_ingress(self, bot: Bot, receiving: Callable[[], bool]):
+        """
+        Start reporting readiness
+
+        Args:
+            bot: Initialized bot used to probe Telegram
+            receiving: Whether updates are currently being received (polling or webhook)
+        """
+        self._bot = bot
+        self._receiving = receiving
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def readiness(self) -> dict:
+        """Readiness and its checks"""
+        receiving = self._receiving is not None and self._receiving()
+        telegram = await self._telegram_reachable()
+        return {"ready": receiving and telegram, "receiving": receiving, "telegram": telegram}
+
+    async def _telegram_reachable(self) -> bool:
+        if self._bot is None:
+            return False
+        if time.monotonic() - self._probed_at >= self.probe_interval and self._probe is None:
+            # Concurrent checks wait for the same probe
+            self._probe = asyncio.get_running_loop().create_task(self._probe_telegram())
+        if self._probe is not None:
+            await asyncio.shield(self._probe)
+        return self._reachable
+
+    async def _probe_telegram(self):
+        try:
+            await asyncio.wait_for(self._bot.get_me(), self.probe_timeout)
+            self._reachable = True
+        except (TelegramError, asyncio.TimeoutError) as e:
+            if self._reachable:
+                logger.warning("Telegram unreachable from readiness check: %r", e)
+            self._reachable = False
+        finally:
+            self._probed_at = time.monotonic()
+            self._probe = None
+
+    async def _home(self, request: Request) -> Response:
+        # Keep-alive ping; readiness is only reported by /readyz
+        return Response(200, "I am alive!".encode("utf-8"))
+
+    async def _healthz(self, request: Request) -> Response:
+        return json_response(200, {
+            "status": "ok",
+            "loop_monitor": self.monitor.running,
+            "loop_lag_ms": round(self.monitor.lag * 1e3, 3),
+        })
+
+    async def _readyz(self, request: Request) -> Response:
+        readiness = await self.readiness()
+        return json_response(200 if readiness["ready"] else 503, readiness)
+
+    async def _metrics(self, request: Request) -> Response:
+        return Response(200, metrics.render().encode("utf-8"), metrics.CONTENT_TYPE)
+
+    async def _stats(self, request: Request) -> Response:
+        token = parse_qs(request.query).get("token", [""])[0]
+        if not STATS_TOKEN or not hmac.compare_digest(token.encode("utf-8"), STATS_TOKEN.encode("utf-8")):
+            return Response(404)
+        from sales_stats import sales_stats
+        return json_response(200, await asyncio.to_thread(sales_stats.snapshot))
+
+
+health_server = HealthServer(HEALTH_LISTEN, HEALTH_PORT, loop_monitor)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minimal asyncio HTTP/1.1 server for Daal Store Telegram Bot
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_COUNT = 100
+MAX_BODY_SIZE = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 75
+
+STATUS_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class Request:
+    """Parsed HTTP request"""
+
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+class Response:
+    """HTTP response returned by route handlers"""
+
+    __slots__ = ("status", "body", "content_type")
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain; charset=utf-8"):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+
+RouteHandler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPError(Exception):
+    """Raised while parsing a request that must be rejected"""
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class AsyncHTTPServer:
+    """
+    Small HTTP/1.1 server running on the bot's event loop
+
+    Only what the bot needs is implemented: exact-path routing (HEAD is
+    answered by the GET route), Content-Length bodies and keep-alive
+    connections for reverse proxies.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], RouteHandler] = {}
+        self._paths = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def add_route(self, method: str, path: str, handler: RouteHandler):
+        """
+        Register a handler for an exact method and path
+
+        Args:
+            method: HTTP method, e.g. "GET" or "POST"
+            path: Request path without query string
+            handler: Coroutine function taking a Request and returning a Response
+        """
+        self._routes[(method.upper(), path)] = handler
+        self._paths.add(path)
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the server is accepting connections"""
+        return self._server is not None and self._server.is_serving()
+
+    async def start(self):
+        """Start accepting connections"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info("HTTP server listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        """Stop accepting connections and wait for the listener to close"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except HTTPError as e:
+                    await self._write_response(writer, Response(e.status), keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await self._write_response(writer, response, keep_alive, head_only=request.method == "HEAD")
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _read_line(reader: asyncio.StreamReader) -> bytes:
+        try:
+            return await reader.readline()
+        except ValueError:
+            # Line longer than the reader's buffer limit
+            raise HTTPError(400)
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        request_line = await self._read_line(reader)
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400)
+
+        headers = {}
+        while True:
+            line = await self._read_line(reader)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADER_COUNT:
+                raise HTTPError(400)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if "transfer-encoding" in headers:
+            raise HTTPError(411)
+        if "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HTTPError(400)
+            if length < 0:
+                raise HTTPError(400)
+            if length > MAX_BODY_SIZE:
+                raise HTTPError(413)
+            body = await reader.readexactly(length)
+
+        path, _, query = target.partition("?")
+        return Request(method.upper(), path, query, headers, body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None and request.method == "HEAD":
+            handler = self._routes.get(("GET", request.path))
+        if handler is None:
+            return Response(405 if request.path in self._paths else 404)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error("Error handling %s %s: %s", request.method, request.path, e)
+            return Response(500)
+
+    async def _write_response(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool,
+                              head_only: bool = False):
+        reason = STATUS_REASONS.get(response.status, "")
+        head = (
+            f"HTTP/1.1 {response.status} {reason}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + (b"" if head_only else response.body))
+        await writer.drain()
@@ -1,15 +0,0 @@
-from flask import Flask   
-from threading import Thread
-
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-                return "I am alive!", 200
-
-def run():
-     app.run(host='0.0.0.0', port=8080)
-
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
\ No newline at end of file
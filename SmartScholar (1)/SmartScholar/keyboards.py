@@ -4,17 +4,81 @@
 Keyboard layouts for Daal Store Telegram Bot
 """
 
+import functools
+import json
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from config import COUNTRIES
+from catalog import plans_for, add_change_listener
+
+class PrebuiltKeyboardMarkup(InlineKeyboardMarkup):
+    """
+    Frozen markup that serializes itself once
+    
+    to_dict() returns the same dict on every call, so the request layer no
+    longer walks every button per message. The dict is shared and must not
+    be modified.
+    """
+    
+    __slots__ = ("_payload", "_payload_json")
+    
+    def __init__(self, inline_keyboard):
+        super().__init__(inline_keyboard)
+        with self._unfrozen():
+            self._payload = super().to_dict()
+            self._payload_json = json.dumps(self._payload)
+    
+    def to_dict(self, recursive: bool = True):
+        if recursive:
+            return self._payload
+        return super().to_dict(recursive=False)
+    
+    def to_json(self) -> str:
+        return self._payload_json
+
+# Built keyboards, keyed by builder; emptied when the catalog or config changes
+_keyboard_cache = {}
+_keyboard_getters = []
+
+def prebuilt(builder):
+    """Build a keyboard on first use and share the instance afterwards"""
+    @functools.wraps(builder)
+    def get_keyboard():
+        markup = _keyboard_cache.get(builder)
+        if markup is None:
+            markup = _keyboard_cache[builder] = PrebuiltKeyboardMarkup(builder())
+        return markup
+    _keyboard_getters.append(get_keyboard)
+    return get_keyboard
+
+def invalidate_keyboards():
+    """Drop all built keyboards so they are rebuilt from the current catalog"""
+    _keyboard_cache.clear()
+
+def prebuild_keyboards():
+    """Build every keyboard ahead of the first update"""
+    for get_keyboard in _keyboard_getters:
+        get_keyboard()
+
+add_change_listener(invalidate_keyboards)
+
+def _plan_rows(family, tier=""):
+    """One button row per catalog plan of a family and tier"""
+    return [
+        [InlineKeyboardButton(plan.button_text, callback_data=plan.plan_id)]
+        for plan in plans_for(family, tier)
+    ]
 
+@prebuilt
 def get_main_menu_keyboard():
     """Main menu keyboard"""
     keyboard = [
         [InlineKeyboardButton("🔐 VPN", callback_data="vpn")],
         [InlineKeyboardButton("🍎 Apple ID", callback_data="apple_id")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_vpn_menu_keyboard():
     """VPN service selection keyboard"""
     keyboard = [
@@ -22,16 +86,18 @@ def get_vpn_menu_keyboard():
         [InlineKeyboardButton("⚡ WireGuard", callback_data="wireguard")],
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_openvpn_keyboard():
     """OpenVPN options keyboard"""
     keyboard = [
-        [InlineKeyboardButton("📦 یک ماهه ۵۰ گیگ - ۲۸۰ تومان", callback_data="openvpn_50gb")],
+        *_plan_rows("openvpn"),
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_vpn")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_wireguard_keyboard():
     """WireGuard service type keyboard"""
     keyboard = [
@@ -39,39 +105,36 @@ def get_wireguard_keyboard():
         [InlineKeyboardButton("⭐ پریمیوم", callback_data="wireguard_premium")],
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_vpn")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_wireguard_economy_keyboard():
     """WireGuard economy options keyboard"""
     keyboard = [
-        [InlineKeyboardButton("📦 ۵۰ گیگ ماهانه - ۲۸۰ تومان", callback_data="wg_eco_50gb")],
-        [InlineKeyboardButton("📦 ۱۰۰ گیگ ماهانه - ۵۰۰ تومان", callback_data="wg_eco_100gb")],
+        *_plan_rows("wireguard", "economy"),
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_wireguard")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_wireguard_premium_keyboard():
     """WireGuard premium options keyboard"""
     keyboard = [
-        [InlineKeyboardButton("📦 ۳۰ گیگ - ۲۸۰ تومان", callback_data="wg_pre_30gb")],
-        [InlineKeyboardButton("📦 ۵۰ گیگ - ۴۰۰ تومان", callback_data="wg_pre_50gb")],
-        [InlineKeyboardButton("📦 ۱۲۰ گیگ - ۷۰۰ تومان", callback_data="wg_pre_120gb")],
-        [InlineKeyboardButton("🎮 ۳۰ گیگ (گیمینگ) - ۳۰۰ تومان", callback_data="wg_pre_30gb_gaming")],
-        [InlineKeyboardButton("🎮 ۵۰ گیگ (گیمینگ) - ۴۳۵ تومان", callback_data="wg_pre_50gb_gaming")],
-        [InlineKeyboardButton("🎮 ۱۲۰ گیگ (گیمینگ) - ۷۳۵ تومان", callback_data="wg_pre_120gb_gaming")],
+        *_plan_rows("wireguard", "premium"),
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_wireguard")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_apple_id_keyboard():
     """Apple ID service options keyboard"""
     keyboard = [
-        [InlineKeyboardButton("📧 ساخت با جیمیل شخصی - ۸۰۰ تومان", callback_data="apple_id_personal")],
-        [InlineKeyboardButton("🆕 ساخت با جیمیل جدید - ۸۵۰ تومان", callback_data="apple_id_new")],
+        *_plan_rows("apple_id"),
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_country_keyboard():
     """Country selection keyboard"""
     keyboard = []
@@ -83,18 +146,20 @@ def get_country_keyboard():
         keyboard.append(row)
     
     keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_wireguard")])
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_back_to_main_keyboard():
     """Back to main menu keyboard"""
     keyboard = [
         [InlineKeyboardButton("🔙 بازگشت به منو اصلی", callback_data="back_to_main")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
 
+@prebuilt
 def get_membership_check_keyboard():
     """Membership verification keyboard"""
     keyboard = [
         [InlineKeyboardButton("🔍 بررسی عضویت", callback_data="check_membership")]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return keyboard
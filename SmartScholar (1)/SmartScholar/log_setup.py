@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging setup for Daal Store Telegram Bot
+
+Loggers only put records on a queue. A background thread formats them and
+writes the console log and a size-rotated JSON lines file, so neither
+formatting nor log I/O runs on the event loop.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Optional
+
+from config import LOG_BACKUP_COUNT, LOG_LEVEL, LOG_MAX_BYTES, LOG_PATH
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; any other attribute was passed with extra= and becomes a JSON field
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extra fields and traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread
+
+    The stock QueueHandler formats each record before queueing it, so that it
+    can be pickled; the queue here stays in the process, so the record is
+    queued as is. Arguments are therefore formatted when written, and should
+    not be objects that change right after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, path: str = LOG_PATH, max_bytes: int = LOG_MAX_BYTES,
+                  backup_count: int = LOG_BACKUP_COUNT):
+    """
+    Route all logging through a queue to the console and the JSON log file
+
+    Replaces the root logger's handlers; calling it again does nothing.
+
+    Args:
+        level: Root log level name
+        path: JSON lines log file, "" for the console only
+        max_bytes: Size at which the file is rotated
+        backup_count: Rotated files kept
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        log_file = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        log_file.setFormatter(JsonFormatter())
+        handlers.append(log_file)
+
+    # The formats use no source file or line, so skip looking up the caller's frame for every record
+    logging._srcfile = None
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    # httpx logs every Bot API request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write the records still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -4,49 +4,262 @@
 Daal Store Telegram Bot
 Main entry point for the Persian Telegram bot that handles VPN and Apple ID services
 """
-from keep_alive import keep_alive
-keep_alive()
+import time
+PROCESS_STARTED = time.perf_counter()
+
 import logging
 import asyncio
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-from config import BOT_TOKEN, CHANNEL_ID
-from bot_handlers import (
-    start_handler,
-    button_handler,
-    message_handler,
-    error_handler
+import signal
+import threading
+from typing import Callable
+from telegram import Bot, Update
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, ChatMemberHandler, MessageHandler, TypeHandler, filters
 )
-
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from telegram.request import HTTPXRequest
+from config import (
+    BOT_TOKEN, BOT_MODE, MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES,
+    ORDER_LOG_CHANNEL, FLOOD_GLOBAL_RATE, FLOOD_PRIVATE_CHAT_RATE, FLOOD_PRIVATE_CHAT_BURST,
+    FLOOD_GROUP_CHAT_PER_MINUTE, HTTP_POOL_SIZE, HTTP_UPDATES_POOL_SIZE, HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT, HTTP_WRITE_TIMEOUT, HTTP_POOL_TIMEOUT, HTTP_VERSION, WORKER_PROCESSES,
+    SESSION_SWEEP_INTERVAL, ADMIN_IDS, UPDATE_MAX_AGE
 )
+from metrics import api_pool_size, cold_start_seconds, startup_phase_seconds
+from update_processor import PerUserUpdateProcessor
+from catch_up import update_offset
+from flood_control import FloodControlScheduler, FloodControlledRequest
+import event_loop
+from event_loop import loop_monitor
+from health import health_server
+
+from log_setup import setup_logging
+
+# Enable logging (written by a background thread, see log_setup.py)
+setup_logging()
 logger = logging.getLogger(__name__)
+startup_phase_seconds.labels("imports").set(time.perf_counter() - PROCESS_STARTED)
+
+# chat_member updates keep the membership index current (sent only if the bot is a channel admin)
+ALLOWED_UPDATES = ["message", "callback_query", "chat_member"]
+
+# Set in worker processes of sharded mode, where the supervisor receives updates
+IS_WORKER = False
+
+flood_scheduler = FloodControlScheduler(
+    global_rate=FLOOD_GLOBAL_RATE,
+    private_chat_rate=FLOOD_PRIVATE_CHAT_RATE,
+    private_chat_burst=FLOOD_PRIVATE_CHAT_BURST,
+    group_chat_rate=FLOOD_GROUP_CHAT_PER_MINUTE / 60
+)
+
+def load_handlers():
+    """
+    Import the handlers and everything they load (session store, order
+    outbox, catalog) and prebuild keyboards and texts
+
+    Runs in a worker thread while the bot connects to Telegram.
+
+    Returns:
+        module: bot_handlers
+    """
+    import bot_handlers
+    from keyboards import prebuild_keyboards
+    from render_cache import prerender_texts
+    prebuild_keyboards()
+    prerender_texts()
+    return bot_handlers
+
+def register_handlers(application: Application, handlers):
+    """Register the update and error handlers"""
+    import admin_handlers
+    admins = filters.User(user_id=ADMIN_IDS)
+    # Runs before the handlers below for every update
+    application.add_handler(TypeHandler(Update, handlers.register_user), group=-1)
+    application.add_handler(CommandHandler("order", admin_handlers.order_command, filters=admins))
+    application.add_handler(CommandHandler("orders", admin_handlers.orders_command, filters=admins))
+    application.add_handler(CommandHandler("stats", admin_handlers.stats_command, filters=admins))
+    application.add_handler(CommandHandler("broadcast", admin_handlers.broadcast_command, filters=admins))
+    application.add_handler(CommandHandler("broadcast_status", admin_handlers.broadcast_status_command, filters=admins))
+    application.add_handler(CommandHandler("broadcast_cancel", admin_handlers.broadcast_cancel_command, filters=admins))
+    application.add_handler(CommandHandler("start", handlers.start_handler))
+    application.add_handler(CallbackQueryHandler(handlers.button_handler))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.message_handler))
+    application.add_handler(ChatMemberHandler(handlers.chat_member_handler, ChatMemberHandler.CHAT_MEMBER))
+    application.add_error_handler(handlers.error_handler)
+
+async def warm_up(application: Application):
+    """
+    Open the Telegram connection and fetch the bot identity (get_me) while
+    the handlers are imported, then register them
+
+    Application.initialize() later finds the bot already initialized.
+    """
+    started = time.perf_counter()
+    _, handlers = await asyncio.gather(
+        application.bot.initialize(),
+        asyncio.to_thread(load_handlers)
+    )
+    register_handlers(application, handlers)
+    startup_phase_seconds.labels("warm_up").set(time.perf_counter() - started)
+
+def mark_ready(bot: Bot, receiving: Callable[[], bool]):
+    """Record the cold start time and let the health server report readiness"""
+    ready = time.perf_counter() - PROCESS_STARTED
+    cold_start_seconds.set(ready)
+    logger.info("Bot @%s ready in %.2fs", bot.username, ready)
+    health_server.set_ingress(bot, receiving)
+
+async def on_startup(application: Application):
+    """Start background workers once the bot is initialized, then report readiness."""
+    from states import session_store
+    from utils import broadcaster, order_outbox
+    from sales_stats import sales_stats
+    loop_monitor.start()
+    # Liveness is served from here on; readiness once updates are received
+    # (workers serve their own metrics on HEALTH_PORT + 1 + index)
+    await health_server.start()
+    order_outbox.start(application.bot)
+    broadcaster.start(application.bot)
+    session_store.start_sweeper(SESSION_SWEEP_INTERVAL)
+    # Read the last 30 days of orders now rather than on the first /stats
+    threading.Thread(target=sales_stats.sync, name="sales-stats", daemon=True).start()
+    update_offset.start()
+    
+    if BOT_MODE == "polling" and not IS_WORKER:
+        # Answer what arrived while the bot was down before polling starts
+        from catch_up import drain_backlog
+        await drain_backlog(application, update_offset, ALLOWED_UPDATES)
+    
+    if IS_WORKER:
+        logger.info("Worker ready in %.2fs", time.perf_counter() - PROCESS_STARTED)
+        health_server.set_ingress(application.bot, lambda: application.running)
+    elif application.updater is not None:
+        mark_ready(application.bot, lambda: application.updater.running)
+    else:
+        mark_ready(application.bot, lambda: application.running)
+
+async def on_stop(application: Application):
+    """Stop background workers while the bot can still send."""
+    from states import session_store
+    from utils import broadcaster, order_outbox
+    await broadcaster.stop()
+    await order_outbox.stop()
+    await update_offset.stop()
+    await session_store.stop_sweeper()
+    await health_server.stop()
+    await loop_monitor.stop()
+
+def http_version() -> str:
+    """HTTP_VERSION from config, falling back to HTTP/1.1 if the h2 package is missing"""
+    if HTTP_VERSION == "1.1":
+        return HTTP_VERSION
+    import importlib.util
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP_VERSION=2 needs httpx[http2] (pip install 'httpx[http2]'), using HTTP/1.1")
+        return "1.1"
+    return HTTP_VERSION
+
+def create_http_request(pool_size: int, version: str) -> HTTPXRequest:
+    """Create an HTTP client for the Bot API with the configured timeouts"""
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        write_timeout=HTTP_WRITE_TIMEOUT,
+        pool_timeout=HTTP_POOL_TIMEOUT,
+        http_version=version
+    )
+
+def build_application(updater: bool = BOT_MODE != "webhook") -> Application:
+    """Create the Application (without an Updater when something else feeds the update queue)"""
+    version = http_version()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(FloodControlledRequest(
+            create_http_request(HTTP_POOL_SIZE, version),
+            flood_scheduler,
+            low_priority_chat_id=ORDER_LOG_CHANNEL
+        ))
+        .get_updates_request(create_http_request(HTTP_UPDATES_POOL_SIZE, version))
+        .concurrent_updates(PerUserUpdateProcessor(
+            MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES, update_offset, UPDATE_MAX_AGE
+        ))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+    )
+    if not updater:
+        builder.updater(None)
+    api_pool_size.set(HTTP_POOL_SIZE)
+    return builder.build()
+
+async def run_webhook_mode(application: Application):
+    """Warm up, then serve updates received by webhook"""
+    from webhook import run_webhook
+    await warm_up(application)
+    await run_webhook(application, ALLOWED_UPDATES)
+
+async def run_worker_mode(application: Application, update_queue):
+    """Warm up, then serve updates routed to this worker by the supervisor"""
+    from sharding import serve_shard
+    await warm_up(application)
+    await serve_shard(application, update_queue)
+
+def run_worker(index: int, update_queue, global_bucket):
+    """Entry point of a worker process in sharded mode"""
+    global IS_WORKER
+    IS_WORKER = True
+    # Ctrl+C reaches the whole process group; the supervisor stops workers through their queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    flood_scheduler.global_bucket = global_bucket
+    logger.info("Worker %s starting", index)
+    event_loop.run(run_worker_mode(build_application(updater=False), update_queue))
+
+async def run_supervisor():
+    """Receive updates and route them to WORKER_PROCESSES worker processes"""
+    from sharding import ShardSupervisor
+    version = http_version()
+    bot = Bot(
+        BOT_TOKEN,
+        request=create_http_request(4, version),
+        get_updates_request=create_http_request(HTTP_UPDATES_POOL_SIZE, version)
+    )
+    supervisor = ShardSupervisor(WORKER_PROCESSES, run_worker, queue_size=MAX_PENDING_UPDATES)
+    loop_monitor.start()
+    await health_server.start()
+    try:
+        await supervisor.run(bot, ALLOWED_UPDATES, on_ready=lambda: mark_ready(bot, supervisor.is_receiving))
+    finally:
+        await health_server.stop()
+        await loop_monitor.stop()
 
 def main():
     """Start the bot."""
-    # Create the Application
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Register handlers
-    application.add_handler(CommandHandler("start", start_handler))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    if WORKER_PROCESSES > 1:
+        logger.info("Starting Daal Store Telegram Bot in %s mode with %s workers...", BOT_MODE, WORKER_PROCESSES)
+        event_loop.run(run_supervisor())
+        return
     
-    # Register error handler
-    application.add_error_handler(error_handler)
+    application = build_application()
     
     # Start the bot with improved error handling
-    logger.info("Starting Daal Store Telegram Bot...")
+    logger.info("Starting Daal Store Telegram Bot in %s mode...", BOT_MODE)
     try:
+        if BOT_MODE == "webhook":
+            event_loop.run(run_webhook_mode(application))
+            return
+        # run_polling uses the current event loop, so warm up on the same one
+        loop = event_loop.event_loop_factory()()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(warm_up(application))
+        # The backlog was drained in on_startup, so polling starts with new updates
         application.run_polling(
-            allowed_updates=["message", "callback_query"],
-            drop_pending_updates=True,  # Clear any pending updates
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=False,
             close_loop=False
         )
     except Exception as e:
-        logger.error(f"Bot crashed: {e}")
+        logger.error("Bot crashed: %s", e)
         raise
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Channel membership cache for Daal Store Telegram Bot
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+
+class MembershipCache:
+    """
+    Bounded TTL cache for channel membership results
+
+    Positive and negative results expire after separate TTLs, the oldest
+    entries are evicted once max_size is reached, and concurrent lookups
+    for the same user share a single in-flight request.
+    """
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, max_size: int):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # user_id -> (is_member, expires_at), oldest first
+        self._entries = OrderedDict()
+        # user_id -> future of the lookup currently running for that user
+        self._inflight = {}
+
+    def get(self, user_id: int) -> Optional[bool]:
+        """
+        Get a cached membership result
+
+        Args:
+            user_id: User ID to look up
+
+        Returns:
+            Optional[bool]: Cached result, or None if missing or expired
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        is_member, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        return is_member
+
+    def set(self, user_id: int, is_member: bool):
+        """
+        Store a membership result
+
+        Args:
+            user_id: User ID the result belongs to
+            is_member: Whether the user is a channel member
+        """
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """Drop the cached result for a user"""
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Drop all cached results and reset counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get_or_fetch(
+        self,
+        user_id: int,
+        fetch: Callable[[], Awaitable[bool]],
+        force_refresh: bool = False
+    ) -> bool:
+        """
+        Return a cached result or fetch it, sharing concurrent fetches
+
+        Args:
+            user_id: User ID to look up
+            fetch: Coroutine factory performing the actual API lookup
+            force_refresh: Ignore any cached result and in-flight fetch, and fetch again
+
+        Returns:
+            bool: True if user is member, False otherwise
+        """
+        if not force_refresh:
+            cached = self.get(user_id)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+        self.misses += 1
+        # A fetch already in flight may have started before the user joined
+        task = None if force_refresh else self._inflight.get(user_id)
+        if task is None:
+            # Run the lookup as its own task so a cancelled caller does not
+            # cancel the request other callers are waiting on
+            task = asyncio.ensure_future(fetch())
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda t: self._on_fetched(user_id, t))
+        return await asyncio.shield(task)
+
+    def _on_fetched(self, user_id: int, task: asyncio.Task):
+        """Store a finished lookup and release its in-flight slot, unless a forced refresh superseded it"""
+        if self._inflight.get(user_id) is not task:
+            return
+        del self._inflight[user_id]
+        if not task.cancelled() and task.exception() is None:
+            self.set(user_id, task.result())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Channel membership index for Daal Store Telegram Bot
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipIndex:
+    """
+    Channel membership of known users, kept current by chat_member updates
+
+    Statuses come from join, leave and kick events, and from the API lookup
+    made the first time a user is seen. They are held in memory and written
+    to SQLite by a background thread, so the index survives restarts and
+    lookups never wait for the database. Telegram only sends chat_member
+    updates to channel administrators, so the bot must be an administrator
+    of the channel. Statuses older than max_age are treated as unknown,
+    since events may have been missed, e.g. while the bot was down; beyond
+    max_size users the least recently used are forgotten. Unknown users are
+    looked up through the API again.
+
+    Args:
+        path: SQLite database file
+        max_age: Seconds a status is trusted, 0 for no limit
+        max_size: Most users held in memory, 0 for no limit
+    """
+
+    def __init__(self, path: str, max_age: float = 0, max_size: int = 0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_age = max_age
+        self.max_size = max_size
+        self.hits = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS membership ("
+            "user_id INTEGER PRIMARY KEY, is_member INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # user_id -> (is_member, time.time() of the status), least recently used first
+        self._members: "OrderedDict[int, Tuple[bool, float]]" = OrderedDict()
+        cutoff = time.time() - max_age if max_age else 0
+        rows = self._conn.execute(
+            "SELECT user_id, is_member, updated_at FROM membership WHERE updated_at >= ? "
+            "ORDER BY updated_at DESC LIMIT ?", (cutoff, max_size or -1)
+        ).fetchall()
+        for user_id, is_member, updated_at in reversed(rows):
+            self._members[user_id] = (bool(is_member), updated_at)
+        self._writer = BatchWriter(self._write, "membership-writer")
+
+    def get(self, user_id: int) -> Optional[bool]:
+        """
+        Look up a user's membership
+
+        Args:
+            user_id: User ID to look up
+
+        Returns:
+            Optional[bool]: Whether the user is a member, or None if unknown or too old
+        """
+        entry = self._members.get(user_id)
+        if entry is None:
+            return None
+        is_member, updated_at = entry
+        if self.max_age and time.time() - updated_at > self.max_age:
+            del self._members[user_id]
+            return None
+        self._members.move_to_end(user_id)
+        self.hits += 1
+        return is_member
+
+    def record(self, user_id: int, is_member: bool):
+        """
+        Store a user's membership
+
+        Args:
+            user_id: User the status belongs to
+            is_member: Whether the user is a channel member
+        """
+        now = time.time()
+        self._members[user_id] = (is_member, now)
+        self._members.move_to_end(user_id)
+        if self.max_size and len(self._members) > self.max_size:
+            self._members.popitem(last=False)
+        self._writer.put((user_id, int(is_member), now))
+
+    def _write(self, rows: List[Tuple[int, int, float]]):
+        try:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO membership (user_id, is_member, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET is_member = excluded.is_member, "
+                "updated_at = excluded.updated_at",
+                rows
+            )
+            self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error("Error storing membership of %s users: %s", len(rows), e)
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+
+    def flush(self):
+        """Wait until recorded statuses are written"""
+        self._writer.flush()
+
+    def __len__(self):
+        return len(self._members)
+
+    def close(self):
+        self._writer.close()
+        self._conn.close()
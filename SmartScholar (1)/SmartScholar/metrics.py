@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics for Daal Store Telegram Bot
+
+Metrics are plain Python counters updated from the event loop thread without
+locks. Label strings are formatted once, when a label combination is first
+seen, and the text exposition format is only built when /metrics is scraped.
+"""
+
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers in-process handlers up to slow Telegram calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric"):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """Base class; children hold the values of one label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self, label_text: str):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Get the child for a label combination, creating it on first use
+
+        Args:
+            values: Label values in labelnames order
+
+        Returns:
+            The child metric
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child(_format_labels(self.labelnames, values))
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _items(self):
+        # list() copies the dict atomically, children may be added meanwhile
+        return list(self._children.values())
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{child.label_text} {_format_value(child.value)}" for child in self._items()]
+
+
+class _ValueChild:
+    __slots__ = ("label_text", "value")
+
+    def __init__(self, label_text: str):
+        self.label_text = label_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+
+    kind = "counter"
+
+    def _new_child(self, label_text: str) -> _ValueChild:
+        return _ValueChild(label_text)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a function at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], float]] = None
+
+    def _new_child(self, label_text: str) -> _ValueChild:
+        return _ValueChild(label_text)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Read the (unlabelled) value from function whenever metrics are rendered
+
+        Args:
+            function: Callable returning the current value
+        """
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        return super().samples()
+
+
+class CounterFunction(Gauge):
+    """Counter whose value is kept elsewhere (e.g. MembershipCache.hits)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float],
+                 registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, registry=registry)
+        self.set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ("label_text", "upper_bounds", "counts", "sum")
+
+    def __init__(self, label_text: str, upper_bounds: Tuple[float, ...]):
+        self.label_text = label_text
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Histogram with fixed buckets; cumulative counts are built when rendering"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.upper_bounds = tuple(sorted(buckets))
+        self._bucket_labels = tuple(_format_value(float(bound)) for bound in self.upper_bounds) + ("+Inf",)
+
+    def _new_child(self, label_text: str) -> _HistogramChild:
+        return _HistogramChild(label_text, self.upper_bounds)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for child in self._items():
+            inner = child.label_text[1:-1] + "," if child.label_text else ""
+            cumulative = 0
+            for bound, count in zip(self._bucket_labels, list(child.counts)):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{inner}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{child.label_text} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{child.label_text} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Render the default registry"""
+    return REGISTRY.render()
+
+
+def timed(histogram: Histogram, *label_values):
+    """
+    Decorator observing the run time of an async function in histogram
+
+    Args:
+        histogram: Histogram to observe into
+        label_values: Label values, resolved once at decoration time
+    """
+    child = histogram.labels(*label_values)
+
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+# Bot metrics
+updates_total = Counter("daal_updates_total", "Updates received, by update type", ("type",))
+callbacks_total = Counter("daal_callbacks_total", "Button presses, by callback data", ("data",))
+handler_seconds = Histogram("daal_handler_seconds", "Handler latency", ("handler",))
+api_requests_total = Counter("daal_api_requests_total", "Telegram Bot API calls, by method", ("method",))
+api_request_seconds = Histogram("daal_api_request_seconds", "Telegram Bot API call latency", ("method",))
+api_errors_total = Counter("daal_api_errors_total", "Failed Telegram Bot API calls, by method", ("method",))
+api_in_flight = Gauge("daal_api_in_flight", "Telegram Bot API calls waiting for a connection or a response")
+api_in_flight_max = Gauge("daal_api_in_flight_max", "Most Telegram Bot API calls in flight at once since start")
+api_pool_size = Gauge("daal_api_pool_size", "Connections in the Telegram Bot API connection pool")
+api_pool_timeouts_total = Counter("daal_api_pool_timeouts_total", "Calls that gave up waiting for a free connection")
+membership_checks_total = Counter("daal_membership_checks_total", "Channel membership checks, by result", ("result",))
+orders_total = Counter("daal_orders_total", "Orders placed, by plan and country", ("plan", "country"))
+sessions = Gauge("daal_sessions", "Users with a stored session, recounted before every idle sweep")
+session_evictions_total = Counter(
+    "daal_session_evictions_total", "Sessions evicted from memory, by reason (capacity, idle)", ("reason",)
+)
+broadcast_messages_total = Counter(
+    "daal_broadcast_messages_total", "Broadcast messages, by result (sent, blocked, failed)", ("result",)
+)
+skipped_updates_total = Counter(
+    "daal_skipped_updates_total", "Updates not processed, by reason (duplicate, expired, collapsed)", ("reason",)
+)
+shard_updates_total = Counter("daal_shard_updates_total", "Updates routed to each worker process", ("worker",))
+worker_restarts_total = Counter("daal_worker_restarts_total", "Worker processes restarted after exiting")
+event_loop_lag_seconds = Histogram(
+    "daal_event_loop_lag_seconds", "How late the event loop ran a scheduled callback",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+event_loop_blocked_total = Counter(
+    "daal_event_loop_blocked_total", "Times the event loop was blocked for LOOP_BLOCKED_SECONDS or more"
+)
+startup_phase_seconds = Gauge("daal_startup_phase_seconds", "Duration of startup phases", ("phase",))
+cold_start_seconds = Gauge("daal_cold_start_seconds", "Seconds from process start until the bot was ready")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Order ledger for Daal Store Telegram Bot
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass(frozen=True)
+class Order:
+    """One recorded order"""
+    order_id: int
+    created_at: float  # Unix time
+    user_id: int
+    username: str
+    plan_id: str
+    country: str  # "" for plans without a country
+    price: int  # Thousand toman
+    details: str  # Order details as shown to the customer
+
+
+_COLUMNS = "order_id, created_at, user_id, username, plan_id, country, price, details"
+
+
+class OrderLedger:
+    """
+    SQLite (WAL) table of orders, the record behind the order log channel
+
+    Every order gets an ID from the database, so IDs stay unique when
+    several worker processes share the file. Orders are indexed by user,
+    plan, country and time, so lookups stay in the millisecond range with
+    hundreds of thousands of orders.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "order_id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+            "user_id INTEGER NOT NULL, username TEXT NOT NULL, plan_id TEXT NOT NULL, "
+            "country TEXT NOT NULL, price INTEGER NOT NULL, details TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS orders_by_user ON orders (user_id, order_id);"
+            "CREATE INDEX IF NOT EXISTS orders_by_plan ON orders (plan_id, created_at);"
+            "CREATE INDEX IF NOT EXISTS orders_by_country ON orders (country, created_at);"
+            "CREATE INDEX IF NOT EXISTS orders_by_time ON orders (created_at);"
+        )
+
+    def record(self, user_id: int, username: str, plan_id: str, country: str, price: int, details: str) -> Order:
+        """
+        Store an order and assign its ID
+
+        Args:
+            user_id: Customer's user ID
+            username: Customer's username
+            plan_id: Catalog plan ordered
+            country: Selected country, "" if the plan has none
+            price: Price in thousand toman
+            details: Order details as shown to the customer
+
+        Returns:
+            Order: The stored order
+        """
+        created_at = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO orders (created_at, user_id, username, plan_id, country, price, details) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (created_at, user_id, username, plan_id, country, price, details)
+            )
+        return Order(cursor.lastrowid, created_at, user_id, username, plan_id, country, price, details)
+
+    def _select(self, where: str, parameters: tuple) -> List[Order]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM orders {where}", parameters).fetchall()
+        return [Order(*row) for row in rows]
+
+    def get(self, order_id: int) -> Optional[Order]:
+        """Look up an order by ID"""
+        orders = self._select("WHERE order_id = ?", (order_id,))
+        return orders[0] if orders else None
+
+    def by_user(self, user_id: int, limit: int = 10) -> List[Order]:
+        """A user's most recent orders, newest first"""
+        return self._select("WHERE user_id = ? ORDER BY order_id DESC LIMIT ?", (user_id, limit))
+
+    def recent(self, limit: int = 10) -> List[Order]:
+        """The most recent orders, newest first"""
+        return self._select("ORDER BY order_id DESC LIMIT ?", (limit,))
+
+    def after(self, order_id: int, limit: int = 1000) -> List[Order]:
+        """Orders with IDs above order_id, oldest first"""
+        return self._select("WHERE order_id > ? ORDER BY order_id LIMIT ?", (order_id, limit))
+
+    def first_id_since(self, created_after: float) -> Optional[int]:
+        """ID of the first order placed after created_after, or None if there is none"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(order_id) FROM orders WHERE created_at > ?", (created_after,)
+            ).fetchone()[0]
+
+    def last_id(self) -> int:
+        """ID of the latest order, 0 if there are none"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders").fetchone()[0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Durable outbox for order log messages of Daal Store Telegram Bot
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class OrderOutbox:
+    """
+    Append-only spool of order messages drained by a background worker
+
+    submit() appends the message to the spool file and queues it, so a
+    handler never waits for the log channel. The worker sends queued
+    messages in order, rate limited, retrying failures with exponential
+    backoff. A message is acknowledged in the spool once sent,
+    and unacknowledged messages are queued again on the next start.
+    Messages Telegram keeps rejecting are moved to a dead-letter file.
+    """
+
+    def __init__(
+        self,
+        spool_path: str,
+        chat_id: str,
+        messages_per_minute: float = 20,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0
+    ):
+        self.spool_path = spool_path
+        self.dead_letter_path = spool_path + ".failed"
+        self.chat_id = chat_id
+        self.min_interval = 60.0 / messages_per_minute
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sent = 0
+        self.failed = 0
+
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._next_id = 1
+        self._fd = None
+        self._load()
+
+    def _load(self):
+        """Queue unacknowledged messages from the spool and compact it"""
+        directory = os.path.dirname(self.spool_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        pending = {}
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path, encoding="utf-8") as spool:
+                for line in spool:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        continue
+                    if "ack" in record:
+                        pending.pop(record["ack"], None)
+                    else:
+                        pending[record["id"]] = record
+                        self._next_id = max(self._next_id, record["id"] + 1)
+
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as spool:
+            for record in pending.values():
+                spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+        self._pending.extend(pending.values())
+        self._fd = os.open(self.spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if pending:
+            logger.info("Recovered %s unsent orders from outbox spool", len(pending))
+
+    def _append(self, record: dict):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self._fd is not None:
+            os.write(self._fd, line)
+            return
+        # Stopped: keep the message in the spool for the next start
+        fd = os.open(self.spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, text: str):
+        """
+        Persist an order message and queue it for sending
+
+        After stop() the message is only persisted, and sent after the next
+        start.
+
+        Args:
+            text: Message to post to the order log channel
+        """
+        record = {"id": self._next_id, "text": text}
+        self._next_id += 1
+        self._append(record)
+        self._pending.append(record)
+        self._wakeup.set()
+
+    def start(self, bot: Bot):
+        """
+        Start the background worker
+
+        Args:
+            bot: Telegram Bot instance used for sending
+        """
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run(bot))
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Stop the worker, giving it up to timeout seconds to drain the queue
+
+        Args:
+            timeout: Seconds to wait for queued messages to be sent
+        """
+        if self._worker is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        os.close(self._fd)
+        self._fd = None
+
+    async def _run(self, bot: Bot):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            record = self._pending[0]
+            await self._deliver(bot, record)
+            self._pending.popleft()
+            self._append({"ack": record["id"]})
+            if not self._pending:
+                # Everything is acknowledged, so the spool can start over
+                os.ftruncate(self._fd, 0)
+            await asyncio.sleep(self.min_interval)
+
+    async def _deliver(self, bot: Bot, record: dict):
+        """Send one message, retrying until it is sent or rejected for good"""
+        backoff = 0
+        rejections = 0
+        while True:
+            try:
+                await bot.send_message(chat_id=self.chat_id, text=record["text"], parse_mode='HTML')
+                self.sent += 1
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (BadRequest, Forbidden) as e:
+                rejections += 1
+                error = e
+            except TelegramError as e:
+                # Timeouts and connection errors: keep retrying, the order must not be lost
+                error = e
+            except Exception as e:
+                rejections += 1
+                error = e
+
+            if rejections >= self.max_attempts:
+                logger.error("Giving up on order %s after %s attempts: %s", record["id"], rejections, error)
+                self._dead_letter(record, str(error))
+                return
+            delay = self._backoff(backoff)
+            backoff += 1
+            logger.warning("Order log send failed, retrying in %.0fs: %s", delay, error)
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.base_delay * 2 ** min(attempt, 16), self.max_delay)
+
+    def _dead_letter(self, record: dict, error: str):
+        self.failed += 1
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letters:
+            dead_letters.write(json.dumps(dict(record, error=error), ensure_ascii=False) + "\n")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prerendered message texts for Daal Store Telegram Bot
+
+Screens that only vary by plan and country are rendered once and reused
+until the catalog or config changes. Payment screens are kept in two parts
+around the order ID, so sending one is a lookup and a single concatenation.
+"""
+
+import functools
+from dataclasses import dataclass
+from typing import Optional
+
+import config
+from catalog import CATALOG, add_change_listener
+from utils import ORDER_ID_PREFIX
+
+# WireGuard tier menu titles
+TIER_TITLES = {
+    "economy": "💰 WireGuard اکونومی",
+    "premium": "⭐ WireGuard پریمیوم",
+}
+
+
+@dataclass(frozen=True)
+class PaymentScreen:
+    """Order details and the payment screen around the order ID"""
+    order_details: str
+    head: str  # Order details and the order ID label
+    tail: str  # Payment information
+
+    def render(self, order_id: Optional[int]) -> str:
+        """Payment screen, without the order ID line if the order has no ID"""
+        if order_id is None:
+            return f"{self.order_details}{self.tail}"
+        return f"{self.head}{order_id}{self.tail}"
+
+
+# Rendered texts, keyed by (builder, arguments); emptied when the catalog or config changes
+_text_cache = {}
+
+
+def rendered(builder):
+    """Render a text on first use for its arguments and share it afterwards"""
+    @functools.wraps(builder)
+    def get_text(*args):
+        key = (builder, args)
+        text = _text_cache.get(key)
+        if text is None:
+            text = _text_cache[key] = builder(*args)
+        return text
+    return get_text
+
+
+def invalidate_texts():
+    """Drop all rendered texts so they are rebuilt from the current catalog and config"""
+    _text_cache.clear()
+
+
+add_change_listener(invalidate_texts)
+
+
+@rendered
+def wireguard_menu_text(country: str) -> str:
+    """WireGuard tier selection for a country"""
+    return f"⚡ WireGuard - {country}\n\nلطفا نوع سرویس مورد نظر خود را انتخاب کنید:"
+
+
+@rendered
+def wireguard_tier_text(tier: str, country: str) -> str:
+    """WireGuard plan selection for a tier and country"""
+    return f"{TIER_TITLES[tier]} - {country}\n\nلطفا پلن مورد نظر خود را انتخاب کنید:"
+
+
+@rendered
+def vpn_payment_screen(plan_id: str, country: str) -> PaymentScreen:
+    """Order details and payment screen of a VPN plan"""
+    order_details = CATALOG[plan_id].order_details(country)
+    return PaymentScreen(order_details, f"{order_details}\n{ORDER_ID_PREFIX}", f"\n\n{config.PAYMENT_INFO}")
+
+
+@rendered
+def apple_id_plan_text(plan_id: str) -> str:
+    """Apple ID service and price, shown above the first form prompt"""
+    plan = CATALOG[plan_id]
+    return f"🍎 ساخت {plan.label}\n💰 قیمت: {plan.price_label}\n\n"
+
+
+@rendered
+def apple_id_payment_tail() -> str:
+    return f"\n\n{config.APPLE_ID_PAYMENT_INFO}"
+
+
+def apple_id_payment_text(info_text: str, order_id: Optional[int]) -> str:
+    """Apple ID payment screen below the user's form answers, without the order ID line if there is none"""
+    if order_id is None:
+        return f"{info_text}{apple_id_payment_tail()}"
+    return f"{info_text}\n{ORDER_ID_PREFIX}{order_id}{apple_id_payment_tail()}"
+
+
+def prerender_texts():
+    """Render every plan and country screen ahead of the first update"""
+    apple_id_payment_tail()
+    for country in config.COUNTRIES:
+        wireguard_menu_text(country)
+        for tier in TIER_TITLES:
+            wireguard_tier_text(tier, country)
+    for plan in CATALOG.values():
+        if plan.family == "apple_id":
+            apple_id_plan_text(plan.plan_id)
+        elif plan.has_country:
+            for country in config.COUNTRIES:
+                vpn_payment_screen(plan.plan_id, country)
+        else:
+            vpn_payment_screen(plan.plan_id, "")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rolling sales aggregates for Daal Store Telegram Bot
+
+Orders and revenue are counted per plan, WireGuard tier, country and Apple
+ID service over the last hour, day and 30 days. Each window is a ring of
+time buckets with running totals beside it: an order is added to its
+bucket and to the totals, and a bucket's counts are subtracted once it
+falls out of the window, so reading the stats never rescans orders.
+
+The stats follow the order ledger by order ID, so every process that reads
+them (workers, the health server) sees orders from all workers.
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalog import CATALOG
+from config import ORDER_LEDGER_PATH
+from order_ledger import Order, OrderLedger
+
+# (name, length in seconds, buckets)
+WINDOWS = (
+    ("1h", 3600, 60),
+    ("24h", 86400, 144),
+    ("30d", 30 * 86400, 720),
+)
+
+# Orders read from the ledger per query while catching up
+SYNC_BATCH_SIZE = 5000
+
+Key = Tuple[str, str]  # (dimension, value), e.g. ("plan", "wg_eco_50gb")
+TOTAL: Key = ("total", "")
+
+
+class RollingWindow:
+    """
+    Orders and revenue per key over the last length seconds
+
+    Args:
+        length: Window length in seconds
+        buckets: Time buckets in the ring; a bucket is length / buckets seconds
+    """
+
+    def __init__(self, length: float, buckets: int):
+        self.length = length
+        self.bucket_seconds = length / buckets
+        # key -> [orders, revenue] per bucket, and over the whole window
+        self._buckets: List[Dict[Key, List[int]]] = [{} for _ in range(buckets)]
+        self._totals: Dict[Key, List[int]] = {}
+        self._newest: Optional[int] = None  # Number of the newest bucket in the ring
+
+    def _advance(self, bucket: int):
+        """Make bucket the newest, expiring the buckets it pushes out of the window"""
+        if self._newest is None:
+            self._newest = bucket
+            return
+        if bucket <= self._newest:
+            return
+        size = len(self._buckets)
+        for number in range(max(self._newest + 1, bucket - size + 1), bucket + 1):
+            expired = self._buckets[number % size]
+            for key, (orders, revenue) in expired.items():
+                total = self._totals[key]
+                total[0] -= orders
+                total[1] -= revenue
+                if not total[0]:
+                    del self._totals[key]
+            expired.clear()
+        self._newest = bucket
+
+    def add(self, created_at: float, keys: Iterable[Key], revenue: int):
+        """Count one order in every key"""
+        bucket = int(created_at // self.bucket_seconds)
+        self._advance(bucket)
+        if bucket <= self._newest - len(self._buckets):
+            return  # Older than the window
+        counts = self._buckets[bucket % len(self._buckets)]
+        for key in keys:
+            for table in (counts, self._totals):
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = [1, revenue]
+                else:
+                    entry[0] += 1
+                    entry[1] += revenue
+
+    def totals(self, now: float) -> Dict[Key, List[int]]:
+        """Orders and revenue per key over the window ending now"""
+        self._advance(int(now // self.bucket_seconds))
+        return {key: list(entry) for key, entry in self._totals.items()}
+
+
+def order_keys(order: Order) -> List[Key]:
+    """The keys an order counts towards"""
+    keys = [TOTAL, ("plan", order.plan_id)]
+    plan = CATALOG.get(order.plan_id)
+    if plan is not None and plan.family == "wireguard":
+        keys.append(("tier", plan.tier))
+    if plan is not None and plan.family == "apple_id":
+        keys.append(("service", plan.label))
+    if order.country:
+        keys.append(("country", order.country))
+    return keys
+
+
+class SalesStats:
+    """
+    Rolling windows fed from the order ledger
+
+    Args:
+        ledger: Order ledger to follow
+        windows: (name, length, buckets) of each window
+    """
+
+    def __init__(self, ledger: OrderLedger, windows=WINDOWS):
+        self.ledger = ledger
+        self.windows = {name: RollingWindow(length, buckets) for name, length, buckets in windows}
+        self._longest = max(length for _, length, _ in windows)
+        self._last_order_id: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def add(self, order: Order):
+        keys = order_keys(order)
+        for window in self.windows.values():
+            window.add(order.created_at, keys, order.price)
+
+    def sync(self):
+        """
+        Count the orders added to the ledger since the last sync
+
+        The first sync reads the orders of the longest window, which may take
+        a while with many orders; later ones only read new orders.
+        """
+        with self._lock:
+            if self._last_order_id is None:
+                first = self.ledger.first_id_since(time.time() - self._longest)
+                self._last_order_id = first - 1 if first is not None else self.ledger.last_id()
+            while True:
+                orders = self.ledger.after(self._last_order_id, SYNC_BATCH_SIZE)
+                for order in orders:
+                    self.add(order)
+                if orders:
+                    self._last_order_id = orders[-1].order_id
+                if len(orders) < SYNC_BATCH_SIZE:
+                    break
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        """
+        Current stats of every window
+
+        Returns:
+            dict: {window: {"orders", "revenue", "plans", "tiers", "countries",
+            "services"}}, each breakdown mapping a name to {"orders", "revenue"};
+            revenue is in thousand toman
+        """
+        self.sync()
+        now = time.time() if now is None else now
+        result = {}
+        with self._lock:
+            for name, window in self.windows.items():
+                totals = window.totals(now)
+                orders, revenue = totals.pop(TOTAL, (0, 0))
+                stats = {"orders": orders, "revenue": revenue,
+                         "plans": {}, "tiers": {}, "countries": {}, "services": {}}
+                for (dimension, value), (count, amount) in sorted(totals.items()):
+                    stats[f"{dimension}s" if dimension != "country" else "countries"][value] = {
+                        "orders": count, "revenue": amount
+                    }
+                result[name] = stats
+        return result
+
+
+sales_stats = SalesStats(OrderLedger(ORDER_LEDGER_PATH))
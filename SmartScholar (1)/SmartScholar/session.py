@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact in-memory sessions for Daal Store Telegram Bot
+
+A Session keeps a user's state and order fields in __slots__. Values drawn
+from small fixed sets (UserState values, VPN type, country, plan id, service
+type) are stored as small-int codes into shared tables, so a session holds
+no per-user strings for them, and most users, who only have a state, share
+one read-only session per state.
+
+SessionCache holds sessions by user id with an approximate LRU size cap and
+idle eviction.
+"""
+
+import time
+from collections import deque
+from collections.abc import Mapping
+from itertools import islice
+from typing import Any, Dict, Iterator, Optional
+
+from config import COUNTRIES
+from metrics import session_evictions_total
+
+
+class _Codes:
+    """Append-only table of values and their small-int codes"""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+
+_STATES = _Codes()
+# Data keys stored as codes; country codes are COUNTRIES indexes
+_CODED_FIELDS = {
+    "vpn_type": _Codes(),
+    "country": _Codes(COUNTRIES),
+    "plan_id": _Codes(),
+    "service_type": _Codes(),
+}
+# Data keys stored as they are in a slot of their own
+_PLAIN_FIELDS = ("needs_email", "name", "surname", "birthdate", "email")
+_SLOTS = {key: f"_{key}" for key in (*_CODED_FIELDS, *_PLAIN_FIELDS)}
+# State code -> the read-only session of users with that state and no data
+_SHARED: Dict[Optional[int], "Session"] = {}
+_MISSING = object()
+
+
+class Session(Mapping):
+    """
+    One user's state and data, read like the data dict it replaces
+
+    Keys without a slot, and values a slot cannot hold (None, non-string
+    codes), are kept in a dict.
+
+    Args:
+        state: UserState value, or None
+        data: Initial data fields
+    """
+
+    __slots__ = ("_state", "_vpn_type", "_country", "_plan_id", "_service_type", "_needs_email",
+                 "_name", "_surname", "_birthdate", "_email", "_extra")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self._state = None if state is None else _STATES.encode(state)
+        self._vpn_type = None
+        self._country = None
+        self._plan_id = None
+        self._service_type = None
+        self._needs_email = None
+        self._name = None
+        self._surname = None
+        self._birthdate = None
+        self._email = None
+        self._extra = None
+        if data:
+            for key, value in data.items():
+                self.set(key, value)
+
+    @classmethod
+    def shared(cls, state: Optional[str]) -> "Session":
+        """
+        Read-only session with a state and no data, one instance per state
+
+        Args:
+            state: UserState value, or None
+        """
+        code = None if state is None else _STATES.encode(state)
+        session = _SHARED.get(code)
+        if session is None:
+            session = _SHARED[code] = cls(state)
+        return session
+
+    @property
+    def is_shared(self) -> bool:
+        return _SHARED.get(self._state) is self
+
+    def _check_writable(self):
+        if self.is_shared:
+            raise TypeError("Shared sessions are read-only")
+
+    @property
+    def state(self) -> Optional[str]:
+        return None if self._state is None else _STATES.values[self._state]
+
+    @state.setter
+    def state(self, value: Optional[str]):
+        self._check_writable()
+        self._state = None if value is None else _STATES.encode(value)
+
+    def set(self, key: str, value):
+        """Store a data field"""
+        self._check_writable()
+        slot = _SLOTS.get(key)
+        if slot is not None and value is not None:
+            codes = _CODED_FIELDS.get(key)
+            if codes is None:
+                setattr(self, slot, value)
+            elif isinstance(value, str):
+                setattr(self, slot, codes.encode(value))
+            else:
+                slot = None
+            if slot is not None:
+                if self._extra is not None:
+                    self._extra.pop(key, None)
+                return
+        if slot is not None:
+            setattr(self, slot, None)
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def get(self, key: str, default=None):
+        slot = _SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+            if value is not None:
+                codes = _CODED_FIELDS.get(key)
+                return value if codes is None else codes.values[value]
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for key, slot in _SLOTS.items():
+            if getattr(self, slot) is not None:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def is_empty(self) -> bool:
+        """True if there is neither a state nor any data"""
+        return self._state is None and not self
+
+    def __repr__(self):
+        return f"Session(state={self.state!r}, data={dict(self)!r})"
+
+
+class SessionCache:
+    """
+    Sessions by user id with an approximate LRU cap and idle eviction
+
+    Sessions live in generations of plain dicts rather than one OrderedDict,
+    which would add a linked-list node per user. Using a session moves it to
+    the young generation. sweep() starts a new young generation every
+    idle_ttl / generations seconds and evicts the generations that stopped
+    being young more than idle_ttl ago, so a session is evicted after being
+    idle for idle_ttl plus at most one generation period. Beyond
+    max_sessions, the sessions of the oldest generation are evicted first,
+    in chunks of max_sessions / 64.
+
+    Args:
+        max_sessions: Most sessions to hold, 0 for no cap
+        idle_ttl: Seconds without use after which sweep() evicts a session, 0 to keep
+        generations: Generations per idle_ttl; more is finer grained
+    """
+
+    def __init__(self, max_sessions: int = 0, idle_ttl: float = 0, generations: int = 4):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.period = idle_ttl / generations
+        # Oldest first, the last one is young; started[i] is when generation i became young
+        self._generations = deque([{}])
+        self._started = deque([time.monotonic()])
+        self._young = self._generations[-1]
+        self._evicted_capacity = session_evictions_total.labels("capacity")
+        self._evicted_idle = session_evictions_total.labels("idle")
+
+    def get(self, user_id: int) -> Optional[Any]:
+        """Get a session and mark it as used, or None"""
+        session = self._young.get(user_id)
+        if session is None and len(self._generations) > 1:
+            for generation in reversed(self._generations):
+                session = generation.pop(user_id, None)
+                if session is not None:
+                    self._young[user_id] = session
+                    break
+        return session
+
+    def put(self, user_id: int, session):
+        """Store a session as used now, evicting beyond max_sessions"""
+        if user_id not in self._young:
+            for generation in self._generations:
+                generation.pop(user_id, None)
+            if self.max_sessions:
+                while len(self) >= self.max_sessions and self._evict_oldest():
+                    pass
+        self._young[user_id] = session
+
+    def pop(self, user_id: int) -> Optional[Any]:
+        for generation in self._generations:
+            session = generation.pop(user_id, None)
+            if session is not None:
+                return session
+        return None
+
+    def __len__(self):
+        return sum(len(generation) for generation in self._generations)
+
+    def _rotate(self, now: float):
+        self._young = {}
+        self._generations.append(self._young)
+        self._started.append(now)
+        while len(self._generations) > 1 and not self._generations[0]:
+            self._generations.popleft()
+            self._started.popleft()
+
+    def _evict_oldest(self) -> bool:
+        """Evict the first used sessions of the oldest generation"""
+        for generation in self._generations:
+            if generation and generation is not self._young:
+                break
+        else:
+            if not self._young:
+                return False
+            # Every session was used since the last rotation
+            self._rotate(time.monotonic())
+            generation = self._generations[-2]
+        # A chunk at a time: each pass rescans the slots freed by earlier ones
+        victims = list(islice(generation, max(1, self.max_sessions // 64)))
+        for user_id in victims:
+            del generation[user_id]
+        self._evicted_capacity.inc(len(victims))
+        return True
+
+    def sweep(self, limit: int) -> int:
+        """
+        Start a new generation when due and evict idle sessions
+
+        Args:
+            limit: Most sessions to evict in this call
+
+        Returns:
+            int: Number of sessions evicted
+        """
+        if not self.idle_ttl:
+            return 0
+        now = time.monotonic()
+        if now - self._started[-1] >= self.period:
+            self._rotate(now)
+        evicted = 0
+        # Sessions in the oldest generation were last used before the next one started
+        while evicted < limit and len(self._generations) > 1 and now - self._started[1] >= self.idle_ttl:
+            generation = self._generations[0]
+            while generation and evicted < limit:
+                generation.popitem()
+                evicted += 1
+            if not generation:
+                self._generations.popleft()
+                self._started.popleft()
+        self._evicted_idle.inc(evicted)
+        return evicted
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Session storage backends for Daal Store Telegram Bot
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Mapping, Optional, Tuple
+
+from config import (
+    SESSION_DB_PATH, SESSION_FLUSH_INTERVAL, SESSION_FLUSH_BATCH_SIZE,
+    REDIS_URL, SESSION_TTL, SESSION_MAX_IN_MEMORY, SESSION_IDLE_TTL
+)
+from session import Session, SessionCache
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """
+    Interface for per-user conversation state and form data
+
+    States are stored as UserState values (strings) so every backend can
+    persist them without knowing the enum.
+    """
+
+    _sweeper: Optional[asyncio.Task] = None
+    # Result of the last refresh_count
+    _session_count = 0
+
+    @abstractmethod
+    def get_state(self, user_id: int) -> Optional[str]:
+        """Get the stored state value, or None if the user has none"""
+
+    @abstractmethod
+    def set_state(self, user_id: int, state: str):
+        """Store the state value for a user"""
+
+    @abstractmethod
+    def get_data(self, user_id: int) -> Mapping:
+        """Get the user's data fields (empty if the user has none)"""
+
+    @abstractmethod
+    def set_data(self, user_id: int, key: str, value):
+        """Store a single data field for a user"""
+
+    @abstractmethod
+    def clear(self, user_id: int):
+        """Remove the user's state and data"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of users with a stored session; may block, so call it off the event loop"""
+
+    def refresh_count(self):
+        """Recount the sessions for cached_count"""
+        try:
+            self._session_count = self.count()
+        except Exception as e:
+            logger.error("Error counting sessions: %s", e)
+
+    def cached_count(self) -> int:
+        """Session count as of the last refresh, for metrics; never touches the backend"""
+        return self._session_count
+
+    def sweep(self, limit: int) -> int:
+        """Evict up to limit idle sessions from memory, returning how many were evicted"""
+        return 0
+
+    def start_sweeper(self, interval: float, batch_size: int = 1000):
+        """
+        Evict idle sessions every interval seconds in the background
+
+        Sessions are evicted batch_size at a time, yielding to the event loop
+        in between, so sweeping many sessions does not delay handlers. The
+        session count is refreshed in a worker thread before every sweep.
+
+        Args:
+            interval: Seconds between sweeps
+            batch_size: Sessions evicted per step
+        """
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop(interval, batch_size))
+
+    async def stop_sweeper(self):
+        """Stop the background sweeper"""
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        try:
+            await self._sweeper
+        except asyncio.CancelledError:
+            pass
+        self._sweeper = None
+
+    async def _sweep_loop(self, interval: float, batch_size: int):
+        while True:
+            await asyncio.to_thread(self.refresh_count)
+            await asyncio.sleep(interval)
+            while self.sweep(batch_size) == batch_size:
+                await asyncio.sleep(0)
+
+    def flush(self):
+        """Persist any buffered writes"""
+
+    def close(self):
+        """Flush and release resources"""
+        self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Process-local store, lost on restart
+
+    Sessions idle for idle_ttl seconds, and the least recently used beyond
+    max_sessions, are forgotten.
+    """
+
+    def __init__(self, max_sessions: int = 0, idle_ttl: float = 0):
+        self._sessions = SessionCache(max_sessions, idle_ttl)
+
+    def get_state(self, user_id: int) -> Optional[str]:
+        session = self._sessions.get(user_id)
+        return session.state if session is not None else None
+
+    def set_state(self, user_id: int, state: str):
+        session = self._sessions.get(user_id)
+        if session is None or session.is_shared:
+            self._sessions.put(user_id, Session.shared(state))
+        else:
+            session.state = state
+
+    def get_data(self, user_id: int) -> Mapping:
+        session = self._sessions.get(user_id)
+        return session if session is not None else Session.shared(None)
+
+    def set_data(self, user_id: int, key: str, value):
+        session = self._sessions.get(user_id)
+        if session is None or session.is_shared:
+            session = Session(session.state if session is not None else None)
+            self._sessions.put(user_id, session)
+        session.set(key, value)
+
+    def clear(self, user_id: int):
+        self._sessions.pop(user_id)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+    def sweep(self, limit: int) -> int:
+        return self._sessions.sweep(limit)
+
+
+class CachedSessionStore(SessionStore):
+    """
+    Persistent store with an in-memory cache and write-behind batching
+
+    Reads are served from the cache and only reach the backend the first
+    time a user is seen. Writes update the cache immediately and are flushed
+    by a background thread in one batch every flush_interval seconds, or
+    sooner once batch_size users are dirty, so handlers on the event loop
+    never wait for the backend to write. The cache evicts sessions idle for
+    idle_ttl seconds and the least recently used beyond max_cached;
+    unflushed changes of evicted sessions are kept until they are written.
+
+    Subclasses read one session with _load and write a batch with _write.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, batch_size: int = 500, max_cached: int = 0,
+                 idle_ttl: float = 0):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Users without a stored session are cached as the shared empty session
+        self._cache = SessionCache(max_cached, idle_ttl)
+        # user_id -> session with unflushed changes, and those being written
+        self._dirty = {}
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    @abstractmethod
+    def _load(self, user_id: int) -> Optional[Tuple[Optional[str], dict]]:
+        """Read a user's stored state and data, or None if there is no session"""
+
+    @abstractmethod
+    def _write(self, upserts: List[Tuple[int, Optional[str], dict]], deletes: List[int]):
+        """Store (user_id, state, data) sessions and remove deleted users' sessions, in one batch"""
+
+    def _release(self):
+        """Close connections to the backend"""
+
+    def _unflushed(self, user_id: int) -> Optional[Session]:
+        session = self._dirty.get(user_id)
+        return session if session is not None else self._flushing.get(user_id)
+
+    def _entry(self, user_id: int) -> Session:
+        with self._lock:
+            session = self._cache.get(user_id)
+            if session is None:
+                # Evicted from the cache before its changes were written
+                session = self._unflushed(user_id)
+                if session is not None:
+                    self._cache.put(user_id, session)
+        if session is None:
+            stored = self._load(user_id)
+            if stored is None:
+                loaded = Session.shared(None)
+            else:
+                state, data = stored
+                loaded = Session(state, data) if data else Session.shared(state)
+            with self._lock:
+                session = self._cache.get(user_id)
+                if session is None:
+                    session = self._unflushed(user_id)
+                if session is None:
+                    session = loaded
+                self._cache.put(user_id, session)
+        return session
+
+    def _mark_dirty(self, user_id: int, session: Session):
+        self._dirty[user_id] = session
+        if len(self._dirty) >= self.batch_size:
+            self._wakeup.set()
+
+    def get_state(self, user_id: int) -> Optional[str]:
+        return self._entry(user_id).state
+
+    def set_state(self, user_id: int, state: str):
+        session = self._entry(user_id)
+        with self._lock:
+            if session.is_shared:
+                session = Session.shared(state)
+                self._cache.put(user_id, session)
+            else:
+                session.state = state
+            self._mark_dirty(user_id, session)
+
+    def get_data(self, user_id: int) -> Mapping:
+        return self._entry(user_id)
+
+    def set_data(self, user_id: int, key: str, value):
+        session = self._entry(user_id)
+        with self._lock:
+            if session.is_shared:
+                session = Session(session.state)
+                self._cache.put(user_id, session)
+            session.set(key, value)
+            self._mark_dirty(user_id, session)
+
+    def clear(self, user_id: int):
+        session = Session.shared(None)
+        with self._lock:
+            self._cache.put(user_id, session)
+            self._mark_dirty(user_id, session)
+
+    def sweep(self, limit: int) -> int:
+        with self._lock:
+            return self._cache.sweep(limit)
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                dirty, self._dirty = self._dirty, {}
+                self._flushing = dirty
+                upserts = []
+                deletes = []
+                for user_id, session in dirty.items():
+                    if session.is_empty():
+                        deletes.append(user_id)
+                    else:
+                        upserts.append((user_id, session.state, dict(session)))
+
+            try:
+                self._write(upserts, deletes)
+            except Exception as e:
+                logger.error("Error flushing sessions: %s", e)
+                with self._lock:
+                    for user_id, session in dirty.items():
+                        self._dirty.setdefault(user_id, session)
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _flush_loop(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        self._release()
+
+
+class SQLiteSessionStore(CachedSessionStore):
+    """SQLite (WAL) store with an in-memory cache and write-behind batching"""
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 500,
+                 max_cached: int = 0, idle_ttl: float = 0):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Separate connections so cache misses never wait on a flush transaction
+        self._write_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._write_conn.execute("PRAGMA journal_mode=WAL")
+        self._write_conn.execute("PRAGMA synchronous=NORMAL")
+        self._write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+        super().__init__(flush_interval, batch_size, max_cached, idle_ttl)
+
+    def _load(self, user_id: int) -> Optional[Tuple[Optional[str], dict]]:
+        row = self._read_conn.execute(
+            "SELECT state, data FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def _write(self, upserts: List[Tuple[int, Optional[str], dict]], deletes: List[int]):
+        now = time.time()
+        try:
+            self._write_conn.execute("BEGIN")
+            self._write_conn.executemany(
+                "INSERT INTO sessions (user_id, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, "
+                "data = excluded.data, updated_at = excluded.updated_at",
+                [(user_id, state, json.dumps(data, ensure_ascii=False), now) for user_id, state, data in upserts]
+            )
+            self._write_conn.executemany("DELETE FROM sessions WHERE user_id = ?", [(user_id,) for user_id in deletes])
+            self._write_conn.execute("COMMIT")
+        except Exception:
+            if self._write_conn.in_transaction:
+                self._write_conn.execute("ROLLBACK")
+            raise
+
+    def count(self) -> int:
+        # On the write connection, so cache misses on the read connection never wait for the count;
+        # changes not flushed yet are not counted
+        with self._write_lock:
+            return self._write_conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _release(self):
+        self._read_conn.close()
+        self._write_conn.close()
+
+
+class RedisSessionStore(CachedSessionStore):
+    """
+    Store backed by a Redis-protocol server (Redis, KeyDB, Dragonfly, ...)
+
+    Each session is a hash holding the state and JSON-encoded data fields.
+    Like the SQLite store it is read through an in-memory cache and written
+    behind by the flusher thread, so handlers only wait for the server the
+    first time a user is seen. Requires the redis package.
+    """
+
+    STATE_FIELD = "__state__"
+
+    def __init__(self, url: str, key_prefix: str = "session:", ttl: Optional[int] = None,
+                 flush_interval: float = 0.5, batch_size: int = 500, max_cached: int = 0, idle_ttl: float = 0):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package")
+
+        self._client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        super().__init__(flush_interval, batch_size, max_cached, idle_ttl)
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    def _load(self, user_id: int) -> Optional[Tuple[Optional[str], dict]]:
+        fields = self._client.hgetall(self._key(user_id))
+        if not fields:
+            return None
+        state = None
+        data = {}
+        for key, value in fields.items():
+            key = key.decode("utf-8")
+            if key == self.STATE_FIELD:
+                state = value.decode("utf-8")
+            else:
+                data[key] = json.loads(value)
+        return state, data
+
+    def _write(self, upserts: List[Tuple[int, Optional[str], dict]], deletes: List[int]):
+        pipe = self._client.pipeline(transaction=True)
+        for user_id, state, data in upserts:
+            key = self._key(user_id)
+            fields = {field: json.dumps(value, ensure_ascii=False) for field, value in data.items()}
+            if state is not None:
+                fields[self.STATE_FIELD] = state
+            # Rewritten whole, so fields removed from the session do not linger
+            pipe.delete(key)
+            pipe.hset(key, mapping=fields)
+            if self.ttl:
+                pipe.expire(key, self.ttl)
+        for user_id in deletes:
+            pipe.delete(self._key(user_id))
+        pipe.execute()
+
+    def count(self) -> int:
+        return sum(1 for _ in self._client.scan_iter(match=f"{self.key_prefix}*", count=1000))
+
+    def _release(self):
+        self._client.close()
+
+
+def create_session_store(backend: str) -> SessionStore:
+    """
+    Create the session store selected in config
+
+    Args:
+        backend: "memory", "sqlite" or "redis"
+
+    Returns:
+        SessionStore: Configured store instance
+    """
+    if backend == "memory":
+        return MemorySessionStore(SESSION_MAX_IN_MEMORY, SESSION_IDLE_TTL)
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            SESSION_DB_PATH, SESSION_FLUSH_INTERVAL, SESSION_FLUSH_BATCH_SIZE,
+            SESSION_MAX_IN_MEMORY, SESSION_IDLE_TTL
+        )
+    if backend == "redis":
+        return RedisSessionStore(
+            REDIS_URL, ttl=SESSION_TTL or None, flush_interval=SESSION_FLUSH_INTERVAL,
+            batch_size=SESSION_FLUSH_BATCH_SIZE, max_cached=SESSION_MAX_IN_MEMORY, idle_ttl=SESSION_IDLE_TTL
+        )
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-process sharded mode for Daal Store Telegram Bot
+
+A supervisor process receives updates (long polling or webhook) and routes
+each one by user id to a fixed worker process over a multiprocessing queue.
+All updates of a user land on the same worker, so session state and the
+per-user ordering of PerUserUpdateProcessor stay local to that worker.
+Workers share one global outbound rate budget through a SharedTokenBucket.
+"""
+
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from typing import Callable, List, Optional
+
+from telegram import Bot, Update
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application
+
+from config import (
+    BOT_MODE, FLOOD_GLOBAL_RATE, FLOOD_GROUP_CHAT_PER_MINUTE, HEALTH_PORT, LOG_PATH, MEMBERSHIP_INDEX_PATH,
+    ORDER_LOG_MESSAGES_PER_MINUTE, ORDER_OUTBOX_PATH, TRACE_PATH, UPDATE_MAX_AGE, UPDATE_OFFSET_PATH,
+    WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT
+)
+from catch_up import select_backlog, update_offset
+from flood_control import SharedTokenBucket
+from metrics import shard_updates_total, worker_restarts_total
+
+logger = logging.getLogger(__name__)
+
+# Long polling timeout of the supervisor's getUpdates calls, in seconds
+POLL_TIMEOUT = 10
+
+
+def extract_user_id(data: dict) -> Optional[int]:
+    """
+    Find the user (or chat) an update in Bot API JSON belongs to
+
+    Membership changes belong to the member, not to the admin who made them.
+
+    Args:
+        data: Update as sent by Telegram
+
+    Returns:
+        Optional[int]: User id, chat id if there is no user, or None
+    """
+    for key, payload in data.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        member = payload.get("new_chat_member")
+        user = member.get("user") if isinstance(member, dict) else None
+        user = user or payload.get("from") or payload.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = payload.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def shard_for(data: dict, workers: int) -> int:
+    """Worker index an update is routed to; updates without a user go to worker 0"""
+    user_id = extract_user_id(data)
+    return user_id % workers if isinstance(user_id, int) else 0
+
+
+def _worker_path(path: str, index: int) -> str:
+    """Per-worker variant of a file path: name.ext -> name.<index>.ext"""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{index}{extension}"
+
+
+@contextlib.contextmanager
+def _environment(overrides: dict):
+    """Temporarily set environment variables (inherited by spawned processes)"""
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class ShardSupervisor:
+    """
+    Start and watch worker processes and route updates to them
+
+    Args:
+        worker_count: Number of worker processes
+        worker_target: Picklable function run in each worker as
+            worker_target(index, update_queue, global_bucket)
+        queue_size: Updates buffered per worker before ingress waits
+    """
+
+    def __init__(self, worker_count: int, worker_target: Callable, queue_size: int = 1024):
+        # spawn, so every worker imports config with its own environment
+        self.context = multiprocessing.get_context("spawn")
+        self.worker_count = worker_count
+        self.worker_target = worker_target
+        self.queue_size = queue_size
+        self.global_bucket = SharedTokenBucket(FLOOD_GLOBAL_RATE, FLOOD_GLOBAL_RATE, self.context)
+        self.queues = [self.context.Queue(queue_size) for _ in range(worker_count)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * worker_count
+        self._routed = [shard_updates_total.labels(str(index)) for index in range(worker_count)]
+        self._ingress: Optional[asyncio.Task] = None
+        self._server = None
+
+    def _worker_environment(self, index: int) -> dict:
+        """
+        Settings that differ per worker: own local files and health server port, a share of
+        per-channel limits, one broadcast runner
+        """
+        return {
+            "HEALTH_PORT": str(HEALTH_PORT + 1 + index),
+            "ORDER_OUTBOX_PATH": _worker_path(ORDER_OUTBOX_PATH, index),
+            "MEMBERSHIP_INDEX_PATH": _worker_path(MEMBERSHIP_INDEX_PATH, index),
+            "TRACE_PATH": _worker_path(TRACE_PATH, index) if TRACE_PATH else "",
+            "LOG_PATH": _worker_path(LOG_PATH, index) if LOG_PATH else "",
+            "UPDATE_OFFSET_PATH": _worker_path(UPDATE_OFFSET_PATH, index),
+            "BROADCAST_RUNNER": "1" if index == 0 else "0",
+            "ORDER_LOG_MESSAGES_PER_MINUTE": str(ORDER_LOG_MESSAGES_PER_MINUTE / self.worker_count),
+            "FLOOD_GROUP_CHAT_PER_MINUTE": str(FLOOD_GROUP_CHAT_PER_MINUTE / self.worker_count),
+        }
+
+    def _start_worker(self, index: int):
+        process = self.context.Process(
+            target=self.worker_target,
+            args=(index, self.queues[index], self.global_bucket),
+            name=f"worker-{index}",
+            daemon=True
+        )
+        with _environment(self._worker_environment(index)):
+            process.start()
+        self.processes[index] = process
+        logger.info("Started worker %s (pid %s)", index, process.pid)
+
+    def start(self):
+        """Start all worker processes"""
+        for index in range(self.worker_count):
+            self._start_worker(index)
+
+    def _replace_queue(self, index: int):
+        """
+        Give a worker a new queue, moving over the updates still queued
+
+        A worker killed inside queue.get() leaves the queue's reader lock
+        held, so the old queue cannot be handed to its replacement. If the
+        lock is held, the updates left in it are lost.
+        """
+        old = self.queues[index]
+        new = self.queues[index] = self.context.Queue(self.queue_size)
+        moved = 0
+        while True:
+            try:
+                data = old.get(block=False)
+            except queue.Empty:
+                break
+            new.put_nowait(data)
+            moved += 1
+        lost = old.qsize()
+        if lost:
+            logger.error("Lost %s updates queued for worker %s", lost, index)
+        elif moved:
+            logger.info("Moved %s queued updates to the new worker %s", moved, index)
+        old.close()
+        old.cancel_join_thread()
+
+    async def watch(self, interval: float = 1.0):
+        """Restart workers that died, keeping the updates queued for them where possible"""
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    logger.error("Worker %s exited with code %s, restarting", index, process.exitcode)
+                    worker_restarts_total.inc()
+                    self._replace_queue(index)
+                    self._start_worker(index)
+
+    async def dispatch(self, data: dict):
+        """
+        Route one update (Bot API JSON) to its worker
+
+        Args:
+            data: Update as sent by Telegram
+        """
+        index = shard_for(data, self.worker_count)
+        self._routed[index].inc()
+        try:
+            self.queues[index].put_nowait(data)
+        except queue.Full:
+            # Backpressure: wait for the worker instead of dropping the update
+            await asyncio.to_thread(self.queues[index].put, data)
+
+    def stop(self, timeout: float = 10.0):
+        """Ask workers to finish their queued updates and exit, then reap them"""
+        for update_queue in self.queues:
+            update_queue.put(None)
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating", index)
+                process.terminate()
+                process.join()
+
+    async def poll(self, bot: Bot, allowed_updates: List[str]):
+        """
+        Receive updates by long polling and dispatch them until cancelled
+
+        The backlog Telegram kept while the bot was down comes first, thinned
+        by select_backlog; workers skip updates they processed before.
+        """
+        await bot.delete_webhook(drop_pending_updates=False)
+        offset = 0
+        catching_up = True
+        update_offset.start()
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, timeout=0 if catching_up else POLL_TIMEOUT, allowed_updates=allowed_updates
+                    )
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except TelegramError as e:
+                    logger.error("Error fetching updates: %s", e)
+                    await asyncio.sleep(1)
+                    continue
+                if not updates:
+                    catching_up = False
+                    continue
+                offset = updates[-1].update_id + 1
+                if catching_up:
+                    updates = select_backlog(updates, UPDATE_MAX_AGE, update_offset.stopped_at)
+                for update in updates:
+                    await self.dispatch(update.to_dict())
+                # Dispatched, not processed; the supervisor's offset file only records when it ran
+                update_offset.begin(offset - 1)
+                update_offset.done(offset - 1)
+        finally:
+            await update_offset.stop()
+            if offset:
+                # Confirm the dispatched updates so Telegram does not resend them
+                with contextlib.suppress(TelegramError):
+                    await bot.get_updates(offset=offset, timeout=0)
+
+    def is_receiving(self) -> bool:
+        """Whether updates are being received and at least one worker is alive"""
+        if self._server is not None:
+            receiving = self._server.is_running
+        else:
+            receiving = self._ingress is not None and not self._ingress.done()
+        return receiving and any(process is not None and process.is_alive() for process in self.processes)
+
+    async def run(self, bot: Bot, allowed_updates: List[str], on_ready: Optional[Callable[[], None]] = None):
+        """
+        Run workers and the ingress until SIGINT or SIGTERM
+
+        Args:
+            bot: Bot used by the ingress (getUpdates or setWebhook)
+            allowed_updates: Update types to subscribe to
+            on_ready: Called once workers run and updates are being received
+        """
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        watcher = None
+        try:
+            async with bot:
+                if BOT_MODE == "webhook":
+                    from http_server import AsyncHTTPServer
+                    from webhook import add_update_route, register_webhook, webhook_secret_token
+                    secret_token = webhook_secret_token()
+                    self._server = AsyncHTTPServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+                    add_update_route(self._server, WEBHOOK_PATH, secret_token, self.dispatch)
+                    await self._server.start()
+                    await register_webhook(bot, secret_token, allowed_updates)
+                self.start()
+                if self._server is None:
+                    self._ingress = asyncio.create_task(self.poll(bot, allowed_updates))
+                watcher = asyncio.create_task(self.watch())
+                logger.info("Routing updates to %s workers", self.worker_count)
+                if on_ready:
+                    on_ready()
+                try:
+                    await stop_event.wait()
+                finally:
+                    for task in (self._ingress, watcher):
+                        if task is not None:
+                            task.cancel()
+                            with contextlib.suppress(asyncio.CancelledError):
+                                await task
+                    if self._server is not None:
+                        await self._server.stop()
+        finally:
+            await asyncio.to_thread(self.stop)
+
+
+async def serve_shard(application: Application, update_queue, poll_interval: float = 1.0):
+    """
+    Run an Application fed by the supervisor's queue instead of an Updater
+
+    Returns once the supervisor sends None or exits.
+
+    Args:
+        application: Application built without an Updater, handlers registered
+        update_queue: multiprocessing queue of Bot API update JSON
+        poll_interval: Seconds between checks that the supervisor is alive
+    """
+    parent = multiprocessing.parent_process()
+
+    def next_update():
+        while True:
+            try:
+                return update_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    return None
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            while True:
+                data = await asyncio.to_thread(next_update)
+                if data is None:
+                    break
+                try:
+                    update = Update.de_json(data, application.bot)
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    logger.error("Invalid update from supervisor: %s", e)
+                    continue
+                await application.update_queue.put(update)
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
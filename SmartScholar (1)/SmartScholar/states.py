@@ -6,6 +6,11 @@ State management for Daal Store Telegram Bot
 
 from enum import Enum
 
+from config import SESSION_BACKEND
+from metrics import sessions
+from session_store import create_session_store
+from tracing import span
+
 class UserState(Enum):
     """User states for bot conversation flow"""
     MAIN_MENU = "main_menu"
@@ -22,31 +27,32 @@ class UserState(Enum):
     WAITING_FOR_BIRTHDATE = "waiting_for_birthdate"
     WAITING_FOR_EMAIL = "waiting_for_email"
 
-# Global user states storage (in production, use Redis or database)
-user_states = {}
-user_data = {}
+# Session storage backend, selected by SESSION_BACKEND in config
+session_store = create_session_store(SESSION_BACKEND)
+sessions.set_function(session_store.cached_count)
 
 def get_user_state(user_id):
     """Get current user state"""
-    return user_states.get(user_id, UserState.MAIN_MENU)
+    with span("get_user_state"):
+        state = session_store.get_state(user_id)
+    return UserState(state) if state is not None else UserState.MAIN_MENU
 
 def set_user_state(user_id, state):
     """Set user state"""
-    user_states[user_id] = state
+    with span("set_user_state"):
+        session_store.set_state(user_id, state.value)
 
 def get_user_data(user_id):
     """Get user data"""
-    return user_data.get(user_id, {})
+    with span("get_user_data"):
+        return session_store.get_data(user_id)
 
 def set_user_data(user_id, key, value):
     """Set user data"""
-    if user_id not in user_data:
-        user_data[user_id] = {}
-    user_data[user_id][key] = value
+    with span("set_user_data"):
+        session_store.set_data(user_id, key, value)
 
 def clear_user_data(user_id):
     """Clear user data"""
-    if user_id in user_data:
-        del user_data[user_id]
-    if user_id in user_states:
-        del user_states[user_id]
+    with span("clear_user_data"):
+        session_store.clear(user_id)
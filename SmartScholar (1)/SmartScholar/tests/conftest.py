@@ -0,0 +1,124 @@
+"""
+Shared test setup and fixtures
+
+The project modules are imported from the directory above. They read
+config at import time, so the environment is set before any of them is
+imported.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import sys
+import tempfile
+import time
+import types
+
+import pytest
+from telegram import Bot, Update
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="daal-test-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flood_control  # noqa: E402
+import membership_cache  # noqa: E402
+import membership_index  # noqa: E402
+import session  # noqa: E402
+import user_registry  # noqa: E402
+
+# Modules whose time module the clock fixture replaces
+CLOCKED_MODULES = (membership_cache, membership_index, flood_control, session, user_registry)
+
+BOT = Bot("1:test")
+
+
+class VirtualClock:
+    """
+    Stands in for the time module and asyncio.sleep of the modules under test
+
+    The clock only moves when a test moves it, or in run(): sleeping tasks
+    wake in order of their deadline, and the clock jumps to each deadline
+    once every task is waiting. Each jump moves the clock, as real time
+    would, even for deadlines too close to tell apart from now.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        # time() starts at the real wall clock time
+        self.epoch = time.time() - self.now
+        self._sleepers = []
+        self._order = itertools.count()
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.epoch + self.now
+
+    async def sleep(self, delay):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + delay, next(self._order), future))
+        await future
+
+    async def run(self, *coroutines):
+        """Run coroutines to completion on virtual time and return their results"""
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        while not all(task.done() for task in tasks):
+            for _ in range(20):
+                await asyncio.sleep(0)
+            if self._sleepers:
+                wake, _, future = heapq.heappop(self._sleepers)
+                self.now = max(wake, math.nextafter(self.now, math.inf))
+                future.set_result(None)
+        return [task.result() for task in tasks]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = VirtualClock()
+    for module in CLOCKED_MODULES:
+        monkeypatch.setattr(module, "time", fake)
+    monkeypatch.setattr(flood_control, "asyncio", types.SimpleNamespace(sleep=fake.sleep))
+    return fake
+
+
+@pytest.fixture
+def message():
+    """Factory of private chat text message updates, sent age seconds ago"""
+    def make(update_id, user_id=1, age=0.0):
+        return Update.de_json({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time() - age),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+                "text": "hi",
+            },
+        }, BOT)
+    return make
+
+
+@pytest.fixture
+def press():
+    """Factory of button press updates on a message of the bot"""
+    def make(update_id, message_id, user_id=1):
+        return Update.de_json({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": "c",
+                "data": "plan",
+                "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "menu",
+                },
+            },
+        }, BOT)
+    return make
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+
+from catch_up import UpdateOffset, select_backlog
+
+
+def ids(updates):
+    return [update.update_id for update in updates]
+
+
+def test_select_backlog_drops_expired_messages(message):
+    updates = [message(1, age=900), message(2, age=10), message(3)]
+    assert ids(select_backlog(updates, 600, time.time() - 60)) == [2, 3]
+
+
+def test_select_backlog_keeps_everything_without_max_age(message, press):
+    updates = [message(1, age=10 ** 6), press(2, 50)]
+    assert ids(select_backlog(updates, 0, time.time() - 10 ** 6)) == [1, 2]
+
+
+def test_select_backlog_keeps_last_press_per_message(message, press):
+    updates = [press(1, 50), message(2), press(3, 50), press(4, 51), press(5, 50)]
+    assert ids(select_backlog(updates, 600, time.time() - 60)) == [2, 4, 5]
+
+
+def test_select_backlog_drops_presses_after_long_outage(message, press):
+    updates = [press(1, 50), message(2), press(3, 51)]
+    assert ids(select_backlog(updates, 600, time.time() - 3600)) == [2]
+
+
+def test_select_backlog_keeps_presses_when_stop_time_unknown(press):
+    assert ids(select_backlog([press(1, 50)], 600, None)) == [1]
+
+
+def test_offset_only_moves_past_finished_updates(tmp_path):
+    offset = UpdateOffset(str(tmp_path / "offset.json"))
+    for update_id in (10, 11, 12):
+        offset.begin(update_id)
+    offset.done(11)
+    offset.done(12)
+    assert offset.update_id == 9
+    assert offset.is_processed(9)
+    assert offset.is_processed(10)
+    assert not offset.is_processed(13)
+    offset.done(10)
+    assert offset.update_id == 12
+
+
+def test_offset_round_trip(tmp_path):
+    path = str(tmp_path / "state" / "offset.json")
+    offset = UpdateOffset(path)
+    assert offset.update_id == 0
+    assert offset.stopped_at is None
+    offset.begin(42)
+    offset.done(42)
+    before = time.time()
+    offset.save()
+
+    restarted = UpdateOffset(path)
+    assert restarted.update_id == 42
+    assert before <= restarted.stopped_at <= time.time()
+    assert restarted.is_processed(42)
+    assert not restarted.is_processed(43)
+
+
+def test_offset_stop_writes_final_offset(tmp_path):
+    path = str(tmp_path / "offset.json")
+
+    async def run():
+        offset = UpdateOffset(path, checkpoint_interval=60)
+        offset.start()
+        offset.begin(7)
+        offset.done(7)
+        await offset.stop()
+
+    asyncio.run(run())
+    with open(path, encoding="utf-8") as offset_file:
+        assert json.load(offset_file)["update_id"] == 7
+
+
+def test_offset_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "offset.json"
+    path.write_text("{not json", encoding="utf-8")
+    offset = UpdateOffset(str(path))
+    assert offset.update_id == 0
+    assert offset.stopped_at is None
@@ -0,0 +1,120 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from flood_control import (
+    PRIORITY_BROADCAST, PRIORITY_LOG, PRIORITY_USER, FloodControlScheduler, SharedTokenBucket, TokenBucket
+)
+
+
+def send_times(clock, scheduler, calls):
+    """Times at which each (chat_id, priority) call was let through, relative to the start"""
+    start = clock.now
+
+    async def call(chat_id, priority):
+        await scheduler.acquire(chat_id, priority)
+        return round(clock.now - start, 6)
+
+    return asyncio.run(clock.run(*(call(chat_id, priority) for chat_id, priority in calls)))
+
+
+def test_token_bucket_burst_then_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = clock.now
+    assert [bucket.try_acquire(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire(now) == pytest.approx(0.5)
+    assert bucket.try_acquire(now + 0.5) == 0.0
+    assert bucket.try_acquire(now + 0.75) == pytest.approx(0.25)
+    assert not bucket.is_idle(now + 1)
+    assert bucket.is_idle(now + 2.5)
+
+
+def test_token_bucket_block(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    now = clock.now
+    bucket.block(now, 10)
+    assert bucket.try_acquire(now + 4) == pytest.approx(6)
+    assert not bucket.is_idle(now + 9)
+    assert bucket.try_acquire(now + 10) == 0.0
+
+
+def test_private_chat_burst_then_one_per_second(clock):
+    scheduler = FloodControlScheduler(global_rate=30, private_chat_rate=1, private_chat_burst=3)
+    times = send_times(clock, scheduler, [(42, PRIORITY_USER)] * 5)
+    assert sorted(times) == pytest.approx([0, 0, 0, 1, 2])
+    assert scheduler.throttled > 0
+
+
+def test_group_chat_rate(clock):
+    scheduler = FloodControlScheduler(group_chat_rate=20 / 60, group_chat_burst=3)
+    times = send_times(clock, scheduler, [(-100, PRIORITY_USER)] * 5)
+    assert sorted(times) == pytest.approx([0, 0, 0, 3, 6])
+
+
+def test_chats_are_limited_independently(clock):
+    scheduler = FloodControlScheduler(private_chat_rate=1, private_chat_burst=1)
+    times = send_times(clock, scheduler, [(1, PRIORITY_USER), (2, PRIORITY_USER), (1, PRIORITY_USER)])
+    assert times == pytest.approx([0, 0, 1])
+
+
+def test_global_rate(clock):
+    scheduler = FloodControlScheduler(global_rate=30)
+    times = send_times(clock, scheduler, [(chat_id, PRIORITY_USER) for chat_id in range(1, 61)])
+    assert sorted(times)[29] == 0
+    assert max(times) == pytest.approx(1)
+
+
+def test_user_calls_go_before_log_and_broadcast(clock):
+    scheduler = FloodControlScheduler(global_rate=1)
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire(None, priority)
+        order.append(name)
+
+    async def run():
+        # Use up the global budget, then queue lower priorities first
+        await scheduler.acquire(None, PRIORITY_USER)
+        await clock.run(call("broadcast", PRIORITY_BROADCAST), call("log", PRIORITY_LOG), call("user", PRIORITY_USER))
+
+    asyncio.run(run())
+    assert order == ["user", "log", "broadcast"]
+    assert scheduler.stats()["queued"] == {"user": 0, "log": 0, "broadcast": 0}
+
+
+def test_retry_after_blocks_chat(clock):
+    scheduler = FloodControlScheduler(private_chat_rate=1, private_chat_burst=3)
+    scheduler.retry_after(7, 5)
+    times = send_times(clock, scheduler, [(7, PRIORITY_USER), (8, PRIORITY_USER)])
+    assert times == pytest.approx([5, 0])
+    assert scheduler.retry_after_count == 1
+
+
+def test_retry_after_without_chat_blocks_everything(clock):
+    scheduler = FloodControlScheduler()
+    scheduler.retry_after(None, 2)
+    assert send_times(clock, scheduler, [(7, PRIORITY_USER), (8, PRIORITY_USER)]) == pytest.approx([2, 2])
+
+
+def test_idle_chat_buckets_are_pruned(clock):
+    scheduler = FloodControlScheduler(private_chat_rate=1, private_chat_burst=1, max_chat_buckets=2)
+    send_times(clock, scheduler, [(1, PRIORITY_USER), (2, PRIORITY_USER)])
+    clock.now += 5
+    send_times(clock, scheduler, [(3, PRIORITY_USER)])
+    assert scheduler.stats()["chat_buckets"] == 1
+
+
+def _drain(bucket, count):
+    for _ in range(count):
+        bucket.try_acquire(bucket.updated)
+
+
+def test_shared_token_bucket_is_shared_with_workers():
+    context = multiprocessing.get_context("spawn")
+    bucket = SharedTokenBucket(rate=0.001, capacity=5, context=context)
+    worker = context.Process(target=_drain, args=(bucket, 3))
+    worker.start()
+    worker.join(30)
+    assert worker.exitcode == 0
+    assert bucket.tokens == pytest.approx(2, abs=0.01)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from http_server import AsyncHTTPServer, Response
+from webhook import SECRET_TOKEN_HEADER, add_update_route
+
+
+async def hello(request):
+    return Response(200, b"hello " + request.query.encode("latin-1"))
+
+
+def exchange(server, raw: bytes) -> bytes:
+    """Start the server, send raw bytes on one connection and return everything it answers"""
+    async def run():
+        await server.start()
+        try:
+            port = server._server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            answer = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return answer
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def status(answer: bytes) -> int:
+    return int(answer.split(b" ", 2)[1])
+
+
+def hello_server():
+    server = AsyncHTTPServer("127.0.0.1", 0)
+    server.add_route("GET", "/hello", hello)
+    return server
+
+
+def test_routes():
+    answer = exchange(hello_server(), b"GET /hello?x HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status(answer) == 200
+    assert answer.endswith(b"\r\n\r\nhello x")
+    assert status(exchange(hello_server(), b"GET /nope HTTP/1.1\r\nConnection: close\r\n\r\n")) == 404
+    assert status(exchange(hello_server(), b"POST /hello HTTP/1.1\r\nConnection: close\r\n\r\n")) == 405
+    head = exchange(hello_server(), b"HEAD /hello HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status(head) == 200
+    assert head.endswith(b"\r\n\r\n")
+
+
+def test_keep_alive_serves_several_requests():
+    answer = exchange(hello_server(), b"GET /hello HTTP/1.1\r\n\r\nGET /hello HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert answer.count(b"HTTP/1.1 200 OK") == 2
+
+
+def test_overlong_request_line_is_rejected():
+    answer = exchange(hello_server(), b"GET /" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n")
+    assert status(answer) == 400
+
+
+def test_overlong_header_is_rejected():
+    answer = exchange(hello_server(), b"GET /hello HTTP/1.1\r\nX-Big: " + b"a" * 70000 + b"\r\n\r\n")
+    assert status(answer) == 400
+
+
+def test_bad_content_length_is_rejected():
+    for length in (b"-1", b"abc"):
+        raw = b"POST /hello HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n"
+        assert status(exchange(hello_server(), raw)) == 400
+    raw = b"POST /hello HTTP/1.1\r\nContent-Length: 2000000\r\n\r\n"
+    assert status(exchange(hello_server(), raw)) == 413
+
+
+def update_server(secret_token, received):
+    async def on_update(data):
+        received.append(data["update_id"])
+
+    server = AsyncHTTPServer("127.0.0.1", 0)
+    add_update_route(server, "/telegram", secret_token, on_update)
+    return server
+
+
+def post_update(server, token=None) -> int:
+    body = json.dumps({"update_id": 1}).encode("utf-8")
+    header = f"{SECRET_TOKEN_HEADER}: {token}\r\n".encode("latin-1") if token is not None else b""
+    raw = (b"POST /telegram HTTP/1.1\r\nConnection: close\r\nContent-Length: " + str(len(body)).encode()
+           + b"\r\n" + header + b"\r\n" + body)
+    return status(exchange(server, raw))
+
+
+def test_update_route_checks_secret_token():
+    received = []
+    assert post_update(update_server("s3cret", received)) == 403
+    assert post_update(update_server("s3cret", received), "wrong") == 403
+    assert post_update(update_server("s3cret", received), "s3cret") == 200
+    assert received == [1]
+
+
+def test_update_route_without_secret_token_accepts_any():
+    received = []
+    assert post_update(update_server("", received)) == 200
+    assert received == [1]
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from membership_cache import MembershipCache
+
+
+def test_results_expire_after_their_ttl(clock):
+    cache = MembershipCache(positive_ttl=60, negative_ttl=10, max_size=100)
+    cache.set(1, True)
+    cache.set(2, False)
+    clock.now += 11
+    assert cache.get(2) is None
+    assert cache.get(1) is True
+    clock.now += 50
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_oldest_results_are_evicted(clock):
+    cache = MembershipCache(positive_ttl=60, negative_ttl=60, max_size=2)
+    cache.set(1, True)
+    cache.set(2, True)
+    cache.set(1, False)
+    cache.set(3, True)
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) is False
+    assert cache.get(3) is True
+
+
+def test_concurrent_lookups_share_one_fetch():
+    cache = MembershipCache(positive_ttl=60, negative_ttl=10, max_size=100)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return True
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_fetch(1, fetch) for _ in range(5)))
+        return results, await cache.get_or_fetch(1, fetch)
+
+    results, cached = asyncio.run(run())
+    assert results == [True] * 5
+    assert cached is True
+    assert len(calls) == 1
+    assert cache.hits == 1
+
+
+def test_failed_fetch_is_not_cached():
+    cache = MembershipCache(positive_ttl=60, negative_ttl=10, max_size=100)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise RuntimeError("getChatMember failed")
+
+    async def run():
+        return await asyncio.gather(cache.get_or_fetch(1, fetch), cache.get_or_fetch(1, fetch),
+                                    return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+    assert len(calls) == 1
+    assert cache.get(1) is None
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_fetch(1, fetch))
+    assert len(calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_fetch():
+    cache = MembershipCache(positive_ttl=60, negative_ttl=10, max_size=100)
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return True
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_fetch(1, fetch))
+        second = asyncio.ensure_future(cache.get_or_fetch(1, fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) is True
+    assert cache.get(1) is True
+
+
+def test_force_refresh_ignores_cached_result():
+    cache = MembershipCache(positive_ttl=60, negative_ttl=10, max_size=100)
+    cache.set(1, False)
+
+    async def fetch():
+        return True
+
+    assert asyncio.run(cache.get_or_fetch(1, fetch, force_refresh=True)) is True
+    assert cache.get(1) is True
+
+
+def test_force_refresh_supersedes_fetch_in_flight():
+    cache = MembershipCache(positive_ttl=60, negative_ttl=10, max_size=100)
+    left = asyncio.Event()
+
+    async def before_joining():
+        # Answered by Telegram before the user joined, delivered after the refresh
+        await left.wait()
+        return False
+
+    async def after_joining():
+        return True
+
+    async def run():
+        stale = asyncio.ensure_future(cache.get_or_fetch(1, before_joining))
+        await asyncio.sleep(0)
+        refreshed = await cache.get_or_fetch(1, after_joining, force_refresh=True)
+        left.set()
+        return refreshed, await stale
+
+    assert asyncio.run(run()) == (True, False)
+    assert cache.get(1) is True
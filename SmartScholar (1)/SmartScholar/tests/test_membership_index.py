@@ -0,0 +1,76 @@
+import pytest
+
+from membership_index import MembershipIndex
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "membership.db")
+
+
+def test_statuses_expire_after_max_age(index_path, clock):
+    index = MembershipIndex(index_path, max_age=3600)
+    try:
+        index.record(1, True)
+        index.record(2, False)
+        clock.now += 3000
+        assert index.get(1) is True
+        assert index.get(2) is False
+        index.record(2, True)
+        clock.now += 1000
+        assert index.get(1) is None
+        assert index.get(2) is True
+        assert len(index) == 1
+        assert index.hits == 3
+    finally:
+        index.close()
+
+
+def test_least_recently_used_are_forgotten_beyond_max_size(index_path, clock):
+    index = MembershipIndex(index_path, max_size=2)
+    try:
+        index.record(1, True)
+        index.record(2, True)
+        assert index.get(1) is True
+        index.record(3, False)
+        assert len(index) == 2
+        assert index.get(2) is None
+        assert index.get(1) is True
+        assert index.get(3) is False
+    finally:
+        index.close()
+
+
+def test_statuses_survive_restart(index_path, clock):
+    index = MembershipIndex(index_path)
+    index.record(1, True)
+    index.record(2, False)
+    index.record(1, False)
+    index.flush()
+    index.close()
+
+    reopened = MembershipIndex(index_path)
+    try:
+        assert reopened.get(1) is False
+        assert reopened.get(2) is False
+        assert reopened.get(3) is None
+    finally:
+        reopened.close()
+
+
+def test_restart_loads_only_recent_statuses(index_path, clock):
+    index = MembershipIndex(index_path)
+    index.record(1, True)
+    clock.now += 5000
+    index.record(2, True)
+    clock.now += 10
+    index.record(3, True)
+    index.close()
+
+    reopened = MembershipIndex(index_path, max_age=3600, max_size=1)
+    try:
+        assert len(reopened) == 1
+        assert reopened.get(3) is True
+        assert reopened.get(1) is None
+    finally:
+        reopened.close()
@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+from telegram.error import BadRequest, NetworkError
+
+from order_outbox import OrderOutbox
+
+
+class FakeBot:
+    """Records sent texts; raises the queued errors first"""
+
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(text)
+
+
+def outbox(path, **kwargs):
+    kwargs.setdefault("messages_per_minute", 60000)
+    kwargs.setdefault("base_delay", 0.001)
+    return OrderOutbox(str(path), "-100", **kwargs)
+
+
+def texts(box):
+    return [record["text"] for record in box._pending]
+
+
+def test_unsent_orders_are_replayed_after_restart(tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+    box = outbox(spool)
+    box.submit("order 1")
+    box.submit("order 2")
+    # The process dies before the worker runs
+    del box
+
+    restarted = outbox(spool)
+    assert texts(restarted) == ["order 1", "order 2"]
+    restarted.submit("order 3")
+    assert [record["id"] for record in restarted._pending] == [1, 2, 3]
+
+
+def test_sent_orders_are_not_replayed(tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+    bot = FakeBot()
+
+    async def run():
+        box = outbox(spool)
+        box.start(bot)
+        box.submit("order 1")
+        box.submit("order 2")
+        await box.stop(timeout=5)
+
+    asyncio.run(run())
+    assert bot.sent == ["order 1", "order 2"]
+    assert texts(outbox(spool)) == []
+
+
+def test_acknowledged_records_are_compacted_on_load(tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+    records = [{"id": 1, "text": "a"}, {"id": 2, "text": "b"}, {"ack": 1}]
+    spool.write_text("".join(json.dumps(record) + "\n" for record in records) + '{"id": 3, "te', encoding="utf-8")
+
+    box = outbox(spool)
+    assert texts(box) == ["b"]
+    with open(spool, encoding="utf-8") as lines:
+        assert [json.loads(line) for line in lines] == [{"id": 2, "text": "b"}]
+    box.submit("c")
+    assert box._pending[-1]["id"] == 3
+
+
+def test_order_submitted_after_stop_is_kept(tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+
+    async def run():
+        box = outbox(spool)
+        box.start(FakeBot())
+        await box.stop(timeout=1)
+        box.submit("late")
+
+    asyncio.run(run())
+    assert texts(outbox(spool)) == ["late"]
+
+
+def test_transient_errors_are_retried(tmp_path):
+    bot = FakeBot([NetworkError("down"), NetworkError("down")])
+
+    async def run():
+        box = outbox(tmp_path / "outbox.jsonl")
+        box.start(bot)
+        box.submit("order")
+        await box.stop(timeout=5)
+        return box
+
+    box = asyncio.run(run())
+    assert bot.sent == ["order"]
+    assert box.failed == 0
+
+
+def test_rejected_order_goes_to_dead_letters(tmp_path):
+    spool = tmp_path / "outbox.jsonl"
+    bot = FakeBot([BadRequest("bad html")] * 2)
+
+    async def run():
+        box = outbox(spool, max_attempts=2)
+        box.start(bot)
+        box.submit("broken")
+        box.submit("fine")
+        await box.stop(timeout=5)
+        return box
+
+    box = asyncio.run(run())
+    assert bot.sent == ["fine"]
+    assert box.failed == 1
+    with open(box.dead_letter_path, encoding="utf-8") as dead_letters:
+        record = json.loads(dead_letters.readline())
+    assert record["text"] == "broken"
+    assert "bad html" in record["error"]
+    assert texts(outbox(spool)) == []
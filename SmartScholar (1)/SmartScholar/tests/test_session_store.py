@@ -0,0 +1,142 @@
+import pytest
+
+from session import Session, SessionCache
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+def test_idle_sessions_are_evicted(clock):
+    cache = SessionCache(idle_ttl=100, generations=4)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    clock.now += 50
+    assert cache.sweep(1000) == 0
+    cache.get(1)
+    clock.now += 75
+    assert cache.sweep(1000) == 0
+    clock.now += 50
+    # 2 was idle for 175s, 1 for 125s but only one generation period past idle_ttl
+    assert cache.sweep(1000) == 1
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+
+
+def test_sessions_in_use_are_kept(clock):
+    cache = SessionCache(idle_ttl=100, generations=4)
+    cache.put(1, "a")
+    for _ in range(20):
+        clock.now += 30
+        cache.sweep(1000)
+        assert cache.get(1) == "a"
+
+
+def test_sweep_respects_limit(clock):
+    cache = SessionCache(idle_ttl=100, generations=4)
+    for user_id in range(10):
+        cache.put(user_id, user_id)
+    clock.now += 25
+    cache.sweep(1000)
+    clock.now += 200
+    assert cache.sweep(4) == 4
+    assert cache.sweep(100) == 6
+    assert len(cache) == 0
+
+
+def test_least_recently_used_are_evicted_beyond_cap(clock):
+    cache = SessionCache(max_sessions=4, idle_ttl=100, generations=4)
+    for user_id in range(4):
+        cache.put(user_id, user_id)
+    clock.now += 25
+    cache.sweep(1000)
+    cache.get(0)
+    cache.put(4, 4)
+    assert len(cache) == 4
+    assert cache.get(0) == 0
+    assert cache.get(4) == 4
+    assert cache.get(1) is None
+
+
+def test_cap_without_idle_ttl(clock):
+    cache = SessionCache(max_sessions=3)
+    for user_id in range(10):
+        cache.put(user_id, user_id)
+        assert len(cache) <= 3
+    assert cache.get(9) == 9
+
+
+def test_session_round_trips_data():
+    data = {"vpn_type": "v2ray", "country": "Germany", "email": "a@b.c", "custom": [1]}
+    stored = Session("waiting_email", data)
+    assert stored.state == "waiting_email"
+    assert dict(stored) == data
+    assert Session.shared("main_menu").is_shared
+    with pytest.raises(TypeError):
+        Session.shared("main_menu").set("name", "x")
+
+
+def test_memory_store_keeps_state_and_data():
+    store = MemorySessionStore()
+    store.set_state(1, "waiting_name")
+    store.set_data(1, "name", "A")
+    assert store.get_state(1) == "waiting_name"
+    assert dict(store.get_data(1)) == {"name": "A"}
+    store.clear(1)
+    assert store.get_state(1) is None
+    assert dict(store.get_data(1)) == {}
+
+
+def test_memory_store_forgets_evicted_sessions():
+    store = MemorySessionStore(max_sessions=1)
+    store.set_data(1, "name", "A")
+    store.set_data(2, "name", "B")
+    assert store.get_data(1).get("name") is None
+    assert store.get_data(2)["name"] == "B"
+
+
+def test_sqlite_store_persists_across_restart(sqlite_path):
+    store = SQLiteSessionStore(sqlite_path, flush_interval=60)
+    store.set_state(1, "waiting_name")
+    store.set_data(1, "name", "A")
+    store.set_state(2, "main_menu")
+    store.clear(2)
+    store.close()
+
+    reopened = SQLiteSessionStore(sqlite_path, flush_interval=60)
+    try:
+        assert reopened.get_state(1) == "waiting_name"
+        assert dict(reopened.get_data(1)) == {"name": "A"}
+        assert reopened.get_state(2) is None
+        assert reopened.count() == 1
+    finally:
+        reopened.close()
+
+
+def test_sqlite_store_reloads_evicted_sessions(sqlite_path, clock):
+    store = SQLiteSessionStore(sqlite_path, flush_interval=60, max_cached=2)
+    try:
+        store.set_state(1, "waiting_email")
+        store.set_data(1, "email", "a@b.c")
+        store.flush()
+        for user_id in (2, 3, 4):
+            store.set_state(user_id, "main_menu")
+        assert len(store._cache) <= 2
+        assert store._cache.get(1) is None
+        assert store.get_state(1) == "waiting_email"
+        assert store.get_data(1)["email"] == "a@b.c"
+    finally:
+        store.close()
+
+
+def test_sqlite_store_keeps_unflushed_changes_of_evicted_sessions(sqlite_path, clock):
+    store = SQLiteSessionStore(sqlite_path, flush_interval=60, max_cached=1)
+    try:
+        store.set_data(1, "name", "A")
+        store.set_data(2, "name", "B")
+        assert store._cache.get(1) is None
+        assert store.get_data(1)["name"] == "A"
+    finally:
+        store.close()
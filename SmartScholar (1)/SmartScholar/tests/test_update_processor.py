@@ -0,0 +1,69 @@
+import asyncio
+
+from catch_up import UpdateOffset
+from update_processor import PerUserUpdateProcessor
+
+
+class Recorder:
+    """Handler coroutines that log when they start and finish"""
+
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+
+    async def handle(self, update, delay):
+        self.events.append(("start", update.update_id))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(delay)
+        self.running -= 1
+        self.events.append(("end", update.update_id))
+
+
+async def process_all(processor, recorder, updates):
+    await asyncio.gather(*(
+        processor.do_process_update(update, recorder.handle(update, delay)) for update, delay in updates
+    ))
+
+
+def test_updates_of_one_user_run_in_order(message):
+    processor = PerUserUpdateProcessor(max_running=8, max_pending=64)
+    recorder = Recorder()
+    # Earlier updates take longer, so they would finish last if they overlapped
+    updates = [(message(update_id, 1), 0.05 - update_id * 0.01) for update_id in range(1, 5)]
+    asyncio.run(process_all(processor, recorder, updates))
+    assert recorder.events == [(event, update_id) for update_id in range(1, 5) for event in ("start", "end")]
+    assert processor.active_users == 0
+
+
+def test_users_run_concurrently(message):
+    processor = PerUserUpdateProcessor(max_running=8, max_pending=64)
+    recorder = Recorder()
+    updates = [(message(update_id, update_id % 3), 0.02) for update_id in range(1, 10)]
+    asyncio.run(process_all(processor, recorder, updates))
+    assert recorder.max_running == 3
+    for user_id in range(3):
+        starts = [update_id for event, update_id in recorder.events if event == "start" and update_id % 3 == user_id]
+        assert starts == sorted(starts)
+
+
+def test_running_updates_are_bounded(message):
+    processor = PerUserUpdateProcessor(max_running=2, max_pending=64)
+    recorder = Recorder()
+    updates = [(message(update_id, update_id), 0.01) for update_id in range(1, 9)]
+    asyncio.run(process_all(processor, recorder, updates))
+    assert recorder.max_running == 2
+    assert len(recorder.events) == 16
+
+
+def test_offset_skips_duplicate_and_expired_updates(tmp_path, message):
+    offset = UpdateOffset(str(tmp_path / "offset.json"))
+    offset.begin(5)
+    offset.done(5)
+    processor = PerUserUpdateProcessor(max_running=8, max_pending=64, offset=offset, max_age=600)
+    recorder = Recorder()
+    updates = [(message(5, 1), 0), (message(6, 1), 0), (message(7, 2, age=900), 0), (message(8, 2), 0)]
+    asyncio.run(process_all(processor, recorder, updates))
+    assert [update_id for event, update_id in recorder.events if event == "start"] == [6, 8]
+    assert offset.update_id == 8
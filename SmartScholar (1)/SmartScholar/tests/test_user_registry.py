@@ -0,0 +1,55 @@
+import pytest
+
+from user_registry import UserRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, clock):
+    registry = UserRegistry(str(tmp_path / "users.db"), refresh_interval=3600, max_remembered=2)
+    yield registry
+    registry.close()
+
+
+def last_seen(registry, user_id):
+    with registry._lock:
+        row = registry._conn.execute("SELECT last_seen FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return row and row[0]
+
+
+def test_seen_users_are_written_in_the_background(registry):
+    for user_id in (3, 1, 2):
+        registry.seen(user_id)
+    registry.flush()
+    assert registry.active_after(0, 10) == [1, 2, 3]
+    assert registry.count_active(1) == 2
+
+
+def test_users_are_written_again_after_refresh_interval(registry, clock):
+    registry.seen(1)
+    registry.flush()
+    first = last_seen(registry, 1)
+    clock.now += 60
+    registry.seen(1)
+    registry.flush()
+    assert last_seen(registry, 1) == first
+    clock.now += 3600
+    registry.seen(1)
+    registry.flush()
+    assert last_seen(registry, 1) == first + 3660
+
+
+def test_only_recent_writes_are_remembered(registry):
+    for user_id in (1, 2, 3):
+        registry.seen(user_id)
+    assert list(registry._written) == [2, 3]
+
+
+def test_deactivated_users_come_back_when_seen(registry):
+    registry.seen(1)
+    registry.seen(2)
+    registry.deactivate(1)
+    registry.flush()
+    assert registry.active_after(0, 10) == [2]
+    registry.seen(1)
+    registry.flush()
+    assert registry.active_after(0, 10) == [1, 2]
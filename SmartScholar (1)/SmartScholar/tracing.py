@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-update tracing for Daal Store Telegram Bot
+
+Every update is traced: the update processor opens a root span, and
+handlers, Bot API calls and session store accesses add child spans to the
+span current in their task (a contextvar, so concurrent updates and
+asyncio.gather branches keep separate parents). Outside an update, spans
+are not recorded.
+
+A sample of traces is appended to a JSONL file by a background thread.
+Updates slower than the threshold are always written, and logged with
+their span breakdown.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import List, Optional
+
+from config import TRACE_MAX_BYTES, TRACE_PATH, TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    A timed step of an update; started and duration are perf_counter seconds
+
+    Used as a context manager, the span is current (the parent of new spans)
+    inside the with block.
+    """
+
+    __slots__ = ("name", "started", "duration", "error", "children", "_token")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _current_span.reset(self._token)
+        return False
+
+    def to_dict(self, origin: float) -> dict:
+        """Span tree with start offsets from origin and durations in milliseconds"""
+        result = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1e3, 3),
+            "ms": round(self.duration * 1e3, 3),
+        }
+        if self.error:
+            result["error"] = self.error
+        if self.children:
+            result["children"] = [child.to_dict(origin) for child in self.children]
+        return result
+
+    def format(self, origin: float, depth: int = 0) -> List[str]:
+        """Indented lines of the span tree, for the slow update log"""
+        error = f" [{self.error}]" if self.error else ""
+        lines = [
+            f"{'  ' * depth}{self.name} +{(self.started - origin) * 1e3:.1f}ms "
+            f"{self.duration * 1e3:.1f}ms{error}"
+        ]
+        for child in self.children:
+            lines.extend(child.format(origin, depth + 1))
+        return lines
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("daal_span", default=None)
+_no_span = contextlib.nullcontext()
+
+
+def span(name: str):
+    """
+    Start a child span of the current span, for use in a with statement
+
+    Args:
+        name: Step name, e.g. a Bot API method
+
+    Returns:
+        The span, or a null context outside a traced update
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _no_span
+    child = Span(name)
+    parent.children.append(child)
+    return child
+
+
+def traced(name: str):
+    """Decorator recording each call of an async function as a span"""
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Tracer:
+    """
+    Root spans of updates, with sampling and the slow update log
+
+    Args:
+        path: JSONL file for traces, "" to only log slow updates
+        sample_rate: Share of traces written, 0 to 1
+        slow_seconds: Updates taking at least this long are always written and logged
+        max_bytes: Size at which the file is rotated to path + ".1"
+
+    Traces are queued and written by a writer thread started on the first
+    write, so file I/O never runs on the event loop.
+    """
+
+    def __init__(self, path: str, sample_rate: float, slow_seconds: float, max_bytes: int):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.max_bytes = max_bytes
+        self.written = 0
+        self._file = None
+        self._queue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attributes):
+        """
+        Record an update as a root span
+
+        Args:
+            name: Update type
+            attributes: Fields written with the trace, e.g. update_id
+        """
+        root = Span(name)
+        try:
+            with root:
+                yield root
+        finally:
+            self._finish(root, attributes)
+
+    def _finish(self, root: Span, attributes: dict):
+        slow = root.duration >= self.slow_seconds
+        if slow:
+            details = " ".join(f"{key}={value}" for key, value in attributes.items())
+            logger.warning(
+                "Slow update (%s): %.0fms\n%s", details, root.duration * 1e3, "\n".join(root.format(root.started))
+            )
+        if slow or random.random() < self.sample_rate:
+            self._write({"time": time.time(), **attributes, "slow": slow, **root.to_dict(root.started)})
+
+    def _write(self, record: dict):
+        if not self.path:
+            return
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_queued, name="trace-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.close)
+        self._queue.put(record)
+
+    def close(self):
+        """Write the traces still queued and stop the writer thread"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def _write_queued(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._write_record(record)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_record(self, record: dict):
+        try:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.written += 1
+            if self._file.tell() >= self.max_bytes:
+                self._file.close()
+                self._file = None
+                os.replace(self.path, self.path + ".1")
+        except OSError as e:
+            logger.error("Error writing trace to %s: %s", self.path, e)
+
+
+tracer = Tracer(TRACE_PATH, TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS, TRACE_MAX_BYTES)
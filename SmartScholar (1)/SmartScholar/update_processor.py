@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Concurrent update processing with per-user ordering for Daal Store Telegram Bot
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from catch_up import UpdateOffset, is_expired
+from metrics import skipped_updates_total, updates_total
+from tracing import span, tracer
+
+
+class _UserLock:
+    """Lock for one user plus the number of updates holding or awaiting it"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates of different users concurrently, one at a time per user
+
+    Updates from the same user wait on that user's lock, so the state machine
+    in states.py never sees two updates of one user interleaved. Only updates
+    that hold their user's lock count towards max_running; max_pending bounds
+    how many updates may be in flight or waiting in total. A user's lock is
+    dropped as soon as no update of that user is in flight.
+
+    With an offset, processed update IDs are checkpointed, and updates that
+    were processed before or messages older than max_age are skipped.
+    """
+
+    __slots__ = ("max_running", "running", "offset", "max_age", "_running", "_locks")
+
+    def __init__(self, max_running: int, max_pending: int, offset: Optional[UpdateOffset] = None,
+                 max_age: float = 0):
+        super().__init__(max(max_pending, max_running))
+        self.max_running = max_running
+        self.running = 0
+        self.offset = offset
+        self.max_age = max_age
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._locks = {}
+
+    @staticmethod
+    def _user_key(update: object) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    @staticmethod
+    def _update_type(update: object) -> str:
+        if isinstance(update, Update):
+            for update_type in Update.ALL_TYPES:
+                if getattr(update, update_type) is not None:
+                    return update_type
+            return "unknown"
+        return type(update).__name__
+
+    @property
+    def active_users(self) -> int:
+        """Number of users with an update in flight"""
+        return len(self._locks)
+
+    async def _run(self, coroutine: Awaitable[Any]):
+        with span("wait_running"):
+            await self._running.acquire()
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+            self._running.release()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        if self.offset is None or not isinstance(update, Update):
+            await self._process(update, coroutine)
+            return
+        if self.offset.is_processed(update.update_id):
+            skipped_updates_total.labels("duplicate").inc()
+            coroutine.close()
+            return
+        self.offset.begin(update.update_id)
+        try:
+            if is_expired(update, self.max_age, time.time()):
+                skipped_updates_total.labels("expired").inc()
+                coroutine.close()
+                return
+            await self._process(update, coroutine)
+        finally:
+            self.offset.done(update.update_id)
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]):
+        update_type = self._update_type(update)
+        updates_total.labels(update_type).inc()
+        key = self._user_key(update)
+        update_id = update.update_id if isinstance(update, Update) else None
+        with tracer.trace(update_type, update_id=update_id, user=key):
+            if key is None:
+                await self._run(coroutine)
+                return
+
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = _UserLock()
+            entry.users += 1
+            try:
+                # Earlier updates of the same user
+                with span("wait_user"):
+                    await entry.lock.acquire()
+                try:
+                    await self._run(coroutine)
+                finally:
+                    entry.lock.release()
+            finally:
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
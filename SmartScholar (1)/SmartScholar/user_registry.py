@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+User registry for Daal Store Telegram Bot
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+
+class UserRegistry:
+    """
+    SQLite (WAL) table of every user who has talked to the bot privately
+
+    A user is written the first time a process sees them, and again at most
+    once per refresh_interval after that, so an update normally costs a dict
+    lookup. Only the max_remembered most recent writes are remembered; a
+    forgotten user is just written again. Writes are queued and made in
+    batches by a background thread, so handlers never wait for the file,
+    which is shared by all worker processes. Users who blocked the bot are
+    kept but marked inactive, and become active again when they come back.
+
+    Args:
+        path: SQLite database file
+        refresh_interval: Seconds before a seen user is written again
+        max_remembered: Users whose last write is remembered, 0 for no limit
+    """
+
+    def __init__(self, path: str, refresh_interval: float = 86400, max_remembered: int = 200000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.refresh_interval = refresh_interval
+        self.max_remembered = max_remembered
+        # user_id -> time.monotonic() of the last write by this process, oldest write first
+        self._written: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id INTEGER PRIMARY KEY, first_seen REAL NOT NULL, last_seen REAL NOT NULL, "
+            "active INTEGER NOT NULL)"
+        )
+        self._writer = BatchWriter(self._write, "user-registry-writer")
+
+    def seen(self, user_id: int):
+        """
+        Record that a user used the bot
+
+        Args:
+            user_id: User ID (also their private chat ID)
+        """
+        now = time.monotonic()
+        written = self._written.get(user_id)
+        if written is not None and now - written < self.refresh_interval:
+            return
+        self._written[user_id] = now
+        self._written.move_to_end(user_id)
+        if self.max_remembered and len(self._written) > self.max_remembered:
+            self._written.popitem(last=False)
+        self._writer.put((user_id, time.time()))
+
+    def deactivate(self, user_id: int):
+        """Mark a user who blocked the bot or deleted their account as unreachable"""
+        self._written.pop(user_id, None)
+        self._writer.put((user_id, None))
+
+    def _write(self, changes: List[Tuple[int, Optional[float]]]):
+        """Apply (user_id, time seen) changes in order, a time of None deactivating the user"""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                for user_id, timestamp in changes:
+                    if timestamp is None:
+                        self._conn.execute("UPDATE users SET active = 0 WHERE user_id = ?", (user_id,))
+                    else:
+                        self._conn.execute(
+                            "INSERT INTO users (user_id, first_seen, last_seen, active) VALUES (?, ?, ?, 1) "
+                            "ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen, active = 1",
+                            (user_id, timestamp, timestamp)
+                        )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                logger.error("Error writing %s user registry changes: %s", len(changes), e)
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+
+    def flush(self):
+        """Wait until queued changes are written"""
+        self._writer.flush()
+
+    def active_after(self, user_id: int, limit: int) -> List[int]:
+        """Active user IDs above user_id, ascending"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM users WHERE user_id > ? AND active = 1 ORDER BY user_id LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_active(self, after_user_id: int = 0) -> int:
+        """Number of active users, optionally only those above after_user_id"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM users WHERE user_id > ? AND active = 1", (after_user_id,)
+            ).fetchone()[0]
+
+    def close(self):
+        self._writer.close()
+        self._conn.close()
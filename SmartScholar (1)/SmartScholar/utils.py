@@ -4,29 +4,138 @@
 Utility functions for Daal Store Telegram Bot
 """
 
+import asyncio
 import logging
-from telegram import Bot
-from config import CHANNEL_ID, ORDER_LOG_CHANNEL
+import re
+import sqlite3
+from typing import Optional
+from telegram import Bot, Chat
+from config import (
+    CHANNEL_ID, ORDER_LOG_CHANNEL, MEMBERSHIP_CACHE_POSITIVE_TTL,
+    MEMBERSHIP_CACHE_NEGATIVE_TTL, MEMBERSHIP_CACHE_MAX_SIZE,
+    MEMBERSHIP_INDEX, MEMBERSHIP_INDEX_PATH, MEMBERSHIP_INDEX_MAX_AGE, MEMBERSHIP_INDEX_MAX_SIZE,
+    ORDER_OUTBOX_PATH, ORDER_LOG_MESSAGES_PER_MINUTE, ORDER_LEDGER_PATH,
+    USER_REGISTRY_PATH, SESSION_MAX_IN_MEMORY, BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE, BROADCAST_RUNNER
+)
+from broadcast import Broadcaster
+from membership_cache import MembershipCache
+from membership_index import MembershipIndex
+from metrics import CounterFunction, Gauge, membership_checks_total
+from order_ledger import Order, OrderLedger
+from order_outbox import OrderOutbox
+from tracing import span
+from user_registry import UserRegistry
 
 logger = logging.getLogger(__name__)
 
-async def check_channel_membership(bot: Bot, user_id: int) -> bool:
+# Input validation patterns, compiled once
+BIRTHDATE_PATTERN = re.compile(r'^(19|20)\d{2}[/-](0[1-9]|1[0-2])[/-](0[1-9]|[12]\d|3[01])$')
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+membership_cache = MembershipCache(
+    positive_ttl=MEMBERSHIP_CACHE_POSITIVE_TTL,
+    negative_ttl=MEMBERSHIP_CACHE_NEGATIVE_TTL,
+    max_size=MEMBERSHIP_CACHE_MAX_SIZE
+)
+CounterFunction("daal_membership_cache_hits_total", "Membership checks served from the cache",
+                lambda: membership_cache.hits)
+CounterFunction("daal_membership_cache_misses_total", "Membership checks that asked Telegram",
+                lambda: membership_cache.misses)
+
+# Chat member statuses that count as being in the channel
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+membership_index = (
+    MembershipIndex(MEMBERSHIP_INDEX_PATH, MEMBERSHIP_INDEX_MAX_AGE, MEMBERSHIP_INDEX_MAX_SIZE)
+    if MEMBERSHIP_INDEX else None
+)
+if membership_index is not None:
+    CounterFunction("daal_membership_index_hits_total", "Membership checks answered by the membership index",
+                    lambda: membership_index.hits)
+    Gauge("daal_membership_index_users", "Users in the membership index").set_function(lambda: len(membership_index))
+
+order_outbox = OrderOutbox(
+    spool_path=ORDER_OUTBOX_PATH,
+    chat_id=ORDER_LOG_CHANNEL,
+    messages_per_minute=ORDER_LOG_MESSAGES_PER_MINUTE
+)
+
+order_ledger = OrderLedger(ORDER_LEDGER_PATH)
+
+user_registry = UserRegistry(USER_REGISTRY_PATH, max_remembered=SESSION_MAX_IN_MEMORY)
+broadcaster = Broadcaster(
+    user_registry,
+    USER_REGISTRY_PATH,
+    rate=BROADCAST_RATE,
+    concurrency=BROADCAST_CONCURRENCY,
+    batch_size=BROADCAST_BATCH_SIZE,
+    runner=BROADCAST_RUNNER
+)
+
+async def check_channel_membership(bot: Bot, user_id: int, force_refresh: bool = False) -> bool:
     """
     Check if user is a member of the required channel
     
+    Users known to membership_index are answered from it without a call.
+    Other results are served from membership_cache when possible. Failed
+    lookups are not cached.
+    
     Args:
         bot: Telegram Bot instance
         user_id: User ID to check
+        force_refresh: Skip the cache and ask Telegram again
         
     Returns:
         bool: True if user is member, False otherwise
     """
-    try:
+    if membership_index is not None and not force_refresh:
+        is_member = membership_index.get(user_id)
+        if is_member is not None:
+            membership_checks_total.labels("member" if is_member else "not_member").inc()
+            return is_member
+
+    async def fetch():
         member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        return member.status in ['member', 'administrator', 'creator']
+        is_member = member.status in MEMBER_STATUSES
+        if membership_index is not None:
+            membership_index.record(user_id, is_member)
+        return is_member
+    
+    try:
+        is_member = await membership_cache.get_or_fetch(user_id, fetch, force_refresh=force_refresh)
     except Exception as e:
-        logger.error(f"Error checking membership for user {user_id}: {e}")
+        logger.error("Error checking membership for user %s: %s", user_id, e)
+        membership_checks_total.labels("error").inc()
         return False
+    membership_checks_total.labels("member" if is_member else "not_member").inc()
+    return is_member
+
+def is_membership_channel(chat: Chat) -> bool:
+    """
+    Check if a chat is the channel users must join
+    
+    Args:
+        chat: Chat from an update
+        
+    Returns:
+        bool: True if chat is CHANNEL_ID (a @username or a numeric ID)
+    """
+    if CHANNEL_ID.startswith("@"):
+        return (chat.username or "").lower() == CHANNEL_ID[1:].lower()
+    return str(chat.id) == CHANNEL_ID
+
+def record_membership(user_id: int, status: str):
+    """
+    Apply a membership change from a chat_member update
+    
+    Args:
+        user_id: User whose status changed
+        status: New chat member status
+    """
+    is_member = status in MEMBER_STATUSES
+    membership_cache.set(user_id, is_member)
+    if membership_index is not None:
+        membership_index.record(user_id, is_member)
 
 def validate_name(name: str) -> bool:
     """
@@ -50,9 +159,7 @@ def validate_birthdate(birthdate: str) -> bool:
     Returns:
         bool: True if valid format, False otherwise
     """
-    import re
-    pattern = r'^(19|20)\d{2}[/-](0[1-9]|1[0-2])[/-](0[1-9]|[12]\d|3[01])$'
-    return bool(re.match(pattern, birthdate))
+    return BIRTHDATE_PATTERN.match(birthdate) is not None
 
 def validate_email(email: str) -> bool:
     """
@@ -64,9 +171,7 @@ def validate_email(email: str) -> bool:
     Returns:
         bool: True if valid format, False otherwise
     """
-    import re
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return EMAIL_PATTERN.match(email) is not None
 
 def format_user_info(user_data: dict) -> str:
     """
@@ -90,14 +195,57 @@ def format_user_info(user_data: dict) -> str:
     
     return info
 
-async def log_order_to_channel(bot: Bot, user_info: dict, order_details: str):
+# Order ID line shown to the customer and in the order log, without the ID
+ORDER_ID_PREFIX = "🧾 شماره سفارش: #"
+
+def format_order_id(order_id: int) -> str:
+    """Order ID line shown to the customer and in the order log"""
+    return f"{ORDER_ID_PREFIX}{order_id}"
+
+async def place_order(bot: Bot, user_info: dict, plan_id: str, country: str, price: int,
+                      order_details: str) -> Optional[Order]:
+    """
+    Record an order in the ledger and log it to the order channel
+    
+    The order is logged to the channel even if the ledger write fails, then
+    without an order ID.
+    
+    Args:
+        bot: Telegram Bot instance
+        user_info: Dictionary containing user information
+        plan_id: Catalog plan ordered
+        country: Selected country, "" if the plan has none
+        price: Price in thousand toman
+        order_details: String containing order details
+        
+    Returns:
+        Optional[Order]: The recorded order, with its ID, or None if the ledger write failed
+    """
+    order = None
+    try:
+        with span("order_ledger.record"):
+            # In a thread: a locked ledger file must not hold up the event loop
+            order = await asyncio.to_thread(
+                order_ledger.record,
+                user_info['user_id'], user_info['username'], plan_id, country, price, order_details
+            )
+    except sqlite3.Error as e:
+        logger.error("Error recording order of user %s in the ledger: %s", user_info.get('user_id'), e)
+    await log_order_to_channel(bot, user_info, order_details, order.order_id if order else None)
+    return order
+
+async def log_order_to_channel(bot: Bot, user_info: dict, order_details: str, order_id: Optional[int] = None):
     """
     Log order details to the specified Telegram channel
     
+    The message is handed to order_outbox, which persists it and sends it in
+    the background, so this returns without waiting for Telegram.
+    
     Args:
         bot: Telegram Bot instance
         user_info: Dictionary containing user information
         order_details: String containing order details
+        order_id: Ledger ID of the order, if recorded
     """
     try:
         # Format order message
@@ -115,17 +263,15 @@ async def log_order_to_channel(bot: Bot, user_info: dict, order_details: str):
 {order_details}
 
 ⏰ زمان سفارش: {import_datetime().now().strftime('%Y-%m-%d %H:%M:%S')}"""
+        if order_id is not None:
+            order_message += f"\n{format_order_id(order_id)}"
         
-        # Send message to order log channel
-        await bot.send_message(
-            chat_id=ORDER_LOG_CHANNEL,
-            text=order_message,
-            parse_mode='HTML'
-        )
-        logger.info(f"Order logged for user {user_id}")
+        # Queue message for the order log channel
+        order_outbox.submit(order_message)
+        logger.info("Order queued for user %s", user_id)
         
     except Exception as e:
-        logger.error(f"Error logging order to channel: {e}")
+        logger.error("Error logging order to channel: %s", e)
 
 def import_datetime():
     """Import datetime module"""
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhook ingestion for Daal Store Telegram Bot
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from typing import Awaitable, Callable, List
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from config import WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+from http_server import AsyncHTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def add_update_route(
+    server: AsyncHTTPServer,
+    path: str,
+    secret_token: str,
+    on_update: Callable[[dict], Awaitable[None]]
+):
+    """
+    Register the endpoint Telegram posts updates to
+
+    Args:
+        server: HTTP server to register the route on
+        path: URL path Telegram posts updates to
+        secret_token: Expected X-Telegram-Bot-Api-Secret-Token header value, "" to accept any
+        on_update: Coroutine function receiving each decoded update
+    """
+    expected = secret_token.encode("utf-8")
+
+    async def receive_update(request: Request) -> Response:
+        received = request.headers.get(SECRET_TOKEN_HEADER, "").encode("utf-8")
+        if expected and not hmac.compare_digest(received, expected):
+            return Response(403)
+        try:
+            await on_update(json.loads(request.body))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.error("Invalid webhook update: %s", e)
+            return Response(400)
+        return Response(200)
+
+    server.add_route("POST", path, receive_update)
+
+
+def add_webhook_route(server: AsyncHTTPServer, application: Application, path: str, secret_token: str):
+    """
+    Register the endpoint that feeds posted updates into the update queue
+
+    Args:
+        server: HTTP server to register the route on
+        application: Application whose update_queue receives the updates
+        path: URL path Telegram posts updates to
+        secret_token: Expected X-Telegram-Bot-Api-Secret-Token header value
+    """
+    async def enqueue(data: dict):
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    add_update_route(server, path, secret_token, enqueue)
+
+
+def webhook_secret_token() -> str:
+    """
+    WEBHOOK_SECRET_TOKEN, or a random token when it is not configured
+
+    Without WEBHOOK_URL the webhook is not registered, so no one could know
+    a random token; the header is then not checked at all.
+    """
+    if WEBHOOK_SECRET_TOKEN:
+        return WEBHOOK_SECRET_TOKEN
+    if not WEBHOOK_URL:
+        logger.warning("WEBHOOK_SECRET_TOKEN and WEBHOOK_URL are not set, accepting updates without a secret token")
+        return ""
+    # Instances behind one proxy must share a token, so only fall back to
+    # a random one when a single instance is running
+    logger.warning("WEBHOOK_SECRET_TOKEN is not set, using a random token for this process")
+    return secrets.token_urlsafe(32)
+
+
+async def register_webhook(bot: Bot, secret_token: str, allowed_updates: List[str]):
+    """Point Telegram at WEBHOOK_URL, if one is configured"""
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            allowed_updates=allowed_updates,
+            secret_token=secret_token,
+            drop_pending_updates=False
+        )
+
+
+async def run_webhook(application: Application, allowed_updates: List[str]):
+    """
+    Run the application with updates delivered by webhook
+
+    The application must be built without an Updater. When WEBHOOK_URL is
+    empty the webhook is not registered with Telegram, which is useful for
+    posting JSON updates to the endpoint locally; unless WEBHOOK_SECRET_TOKEN
+    is set, they need no secret token header then.
+
+    Args:
+        application: Application with handlers registered
+        allowed_updates: Update types to subscribe to
+    """
+    secret_token = webhook_secret_token()
+    server = AsyncHTTPServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    add_webhook_route(server, application, WEBHOOK_PATH, secret_token)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await register_webhook(application.bot, secret_token, allowed_updates)
+        await application.start()
+        await server.start()
+        logger.info("Receiving updates by webhook on %s:%s%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)